@@ -0,0 +1,147 @@
+import math
+import time
+
+from Payloads import L2Book
+
+
+class RollingStats:
+    """
+    Exponentially weighted mean and variance over a time window.
+    Each update is O(1) and the memory used does not depend on the window length.
+    """
+    def __init__(self, half_life_seconds):
+        """
+        :param half_life_seconds: float, the time after which a sample's weight is halved.
+        """
+        self.half_life_seconds = half_life_seconds
+        self.mean = None
+        self.variance = 0.0
+        self.last_timestamp = None
+        self.count = 0
+
+    def update(self, value, timestamp):
+        if self.mean is None:
+            self.mean = value
+        else:
+            dt = max(timestamp - self.last_timestamp, 0.0)
+            alpha = 1.0 - 0.5 ** (dt / self.half_life_seconds)
+            diff = value - self.mean
+            self.mean += alpha * diff
+            self.variance = (1.0 - alpha) * (self.variance + alpha * diff * diff)
+        self.last_timestamp = timestamp
+        self.count += 1
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def z_score(self, value):
+        """Returns the z-score of value against this window, or 0.0 while the window is still flat."""
+        if self.mean is None or self.variance <= 0.0:
+            return 0.0
+        return (value - self.mean) / self.std
+
+
+class BasisMonitor:
+    """
+    BasisMonitor tracks the basis between the PERP and SPOT books of one coin.
+
+    For every pair of book updates we compute:
+        mid basis   = (perp_mid - spot_mid) / spot_mid
+        entry basis = (perp bid VWAP - spot ask VWAP) / spot ask VWAP, i.e. short perp and buy spot at our size
+        exit basis  = (perp ask VWAP - spot bid VWAP) / spot bid VWAP, i.e. buy back perp and sell spot at our size
+
+    Each series keeps streaming statistics over several windows. A high entry basis means
+    the perp is rich against spot, which is a good time to open; a low exit basis means the
+    perp is cheap against spot, which is a good time to unwind.
+    """
+    SERIES = ("mid", "entry", "exit")
+
+    def __init__(self, half_lives=(60, 900, 3600), reference_window=900):
+        """
+        :param half_lives: tuple, the half-lives in seconds of the rolling windows.
+        :param reference_window: int, the half-life of the window the entry/exit checks use.
+        """
+        if reference_window not in half_lives:
+            raise Exception(f"reference_window {reference_window} must be one of half_lives {half_lives}.")
+        self.half_lives = tuple(half_lives)
+        self.reference_window = reference_window
+        self.stats = {series: {h: RollingStats(h) for h in self.half_lives} for series in self.SERIES}
+        self.latest = None
+
+    def update(self, spot_book, perp_book, notional, timestamp=None):
+        """
+        Feeds one spot and one perp l2 snapshot into the monitor.
+
+        :param spot_book: dict, info.l2_snapshot(pair), or an L2Book decoded from it.
+        :param perp_book: dict, info.l2_snapshot(coin), or an L2Book decoded from it.
+        :param notional: float, our position size in USDC, used for the executable basis.
+        :param timestamp: float, sample time in seconds. Defaults to now.
+        :return: dict, the latest basis values and their z-scores, or None if a book is empty.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        spot_book, perp_book = L2Book.of(spot_book), L2Book.of(perp_book)
+        spot_mid = spot_book.mid()
+        perp_mid = perp_book.mid()
+        if spot_mid is None or perp_mid is None:
+            return None
+
+        size = notional / spot_mid if notional and notional > 0 else 0.0
+        if size > 0:
+            spot_ask = spot_book.vwap(False, size)
+            spot_bid = spot_book.vwap(True, size)
+            perp_bid = perp_book.vwap(True, size)
+            perp_ask = perp_book.vwap(False, size)
+        else:
+            spot_ask = spot_book.best_ask()
+            spot_bid = spot_book.best_bid()
+            perp_bid = perp_book.best_bid()
+            perp_ask = perp_book.best_ask()
+
+        values = {"mid": (perp_mid - spot_mid) / spot_mid}
+        # A book too thin for our size has no executable basis on that side
+        values["entry"] = (perp_bid - spot_ask) / spot_ask if perp_bid and spot_ask else None
+        values["exit"] = (perp_ask - spot_bid) / spot_bid if perp_ask and spot_bid else None
+
+        result = {"timestamp": timestamp, "size": size}
+        for series, value in values.items():
+            result[series] = value
+            if value is None:
+                continue
+            for h, stats in self.stats[series].items():
+                stats.update(value, timestamp)
+                result[f"{series}_z_{h}"] = stats.z_score(value)
+
+        self.latest = result
+        return result
+
+    def z_score(self, series):
+        """Returns the z-score of the latest value of series against the reference window."""
+        if self.latest is None or self.latest.get(series) is None:
+            return None
+        return self.stats[series][self.reference_window].z_score(self.latest[series])
+
+    def is_entry_favorable(self, min_z=0.0, min_basis=None):
+        """
+        True if the latest entry basis is at least min_z standard deviations above its mean
+        (and above min_basis, if given).
+        """
+        z = self.z_score("entry")
+        if z is None:
+            return False
+        if min_basis is not None and self.latest["entry"] < min_basis:
+            return False
+        return z >= min_z
+
+    def is_exit_favorable(self, max_z=0.0, max_basis=None):
+        """
+        True if the latest exit basis is at least max_z standard deviations below its mean
+        (and below max_basis, if given).
+        """
+        z = self.z_score("exit")
+        if z is None:
+            return False
+        if max_basis is not None and self.latest["exit"] > max_basis:
+            return False
+        return z <= -max_z
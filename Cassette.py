@@ -0,0 +1,316 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import requests
+from hyperliquid.utils.error import ClientError, ServerError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class CassetteExhausted(SystemExit):
+    """
+    Raised by a replayed call once the cassette has no response left for it.
+    It is a SystemExit so it passes the strategy's `except Exception` loops and each thread
+    ends when the tape runs out.
+    """
+
+
+class CassetteMismatch(Exception):
+    """Raised by a strict replay when a call was not recorded with the same arguments."""
+
+
+class RecordedError(Exception):
+    """A replayed call that raised an error of a type the replay cannot rebuild."""
+    def __init__(self, error_type, message):
+        super().__init__(f"{error_type}: {message}")
+        self.error_type = error_type
+
+
+def _error_record(error):
+    """What a replay needs to raise the same error: its type and the fields retries look at."""
+    record = {"type": type(error).__name__, "module": type(error).__module__, "message": str(error)}
+    if isinstance(error, ClientError):
+        record.update(status_code=error.status_code, error_code=error.error_code,
+                      error_message=error.error_message, error_data=error.error_data)
+    elif isinstance(error, ServerError):
+        record.update(status_code=error.status_code, server_message=error.message)
+    return record
+
+
+def _rebuild_error(record):
+    """
+    The exception a recorded call raised: the SDK's ClientError and ServerError and requests'
+    exceptions are raised as themselves, so retries treat them as they did when recording.
+    """
+    error_type = record["type"]
+    if error_type == "ClientError" and "status_code" in record:
+        return ClientError(record["status_code"], record["error_code"], record["error_message"], None, record["error_data"])
+    if error_type == "ServerError" and "status_code" in record:
+        return ServerError(record["status_code"], record["server_message"])
+    if record.get("module", "").startswith("requests"):
+        error_class = getattr(requests.exceptions, error_type, None)
+        if isinstance(error_class, type) and issubclass(error_class, requests.exceptions.RequestException):
+            return error_class(record["message"])
+    return RecordedError(error_type, record["message"])
+
+
+def _default(value):
+    # Cloid, and anything else the SDK takes that JSON does not know
+    if hasattr(value, "to_raw"):
+        return value.to_raw()
+    return str(value)
+
+
+def _dumps(record, sort_keys=False):
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(record, default=_default, option=option)
+    return json.dumps(record, default=_default, separators=(",", ":"), sort_keys=sort_keys).encode()
+
+
+def _loads(line):
+    return orjson.loads(line) if orjson is not None else json.loads(line)
+
+
+def _call_key(method, args, kwargs):
+    return method, _dumps([args, kwargs], sort_keys=True)
+
+
+class Cassette:
+    """
+    Cassette appends every Info and Exchange call to a JSONL file, one line per call:
+        {"seq", "client", "method", "args", "kwargs", "time", "duration", "thread", "result" or "error"}
+    The file is only ever appended to and flushed after every call, so a crash loses nothing.
+    A first {"session": ...} line holds what a replay needs to rebuild the strategy, e.g. the address.
+
+    Wrap a client with cassette.wrap(info, "info"); wrap the raw client, below any rate limiting
+    or retries, so that each attempt is recorded with its own network latency. Close it, or use
+    it as a context manager, when the session ends; calls made after that are not recorded.
+    """
+    def __init__(self, path, clock=time):
+        """
+        :param path: str, the JSONL file to append to.
+        :param clock: object with time(), the time module unless simulating.
+        """
+        self.path = path
+        self.clock = clock
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path, "ab")
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    def start_session(self, **session):
+        session.setdefault("started", self.clock.time())
+        self._write({"session": session})
+
+    def _write(self, record):
+        with self.lock:
+            if self.file.closed:
+                return
+            if "session" not in record:
+                record["seq"] = self.seq
+                self.seq += 1
+            self.file.write(_dumps(record) + b"\n")
+            self.file.flush()
+
+    def wrap(self, client, name):
+        return RecordingClient(client, name, self)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RecordingClient:
+    """Wraps an Info or Exchange instance and records every public method call to a Cassette."""
+    def __init__(self, client, name, cassette):
+        self.client = client
+        self.name = name
+        self.cassette = cassette
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            record = {"client": self.name, "method": name, "args": args, "kwargs": kwargs,
+                      "time": self.cassette.clock.time(), "thread": threading.current_thread().name}
+            start = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                record["duration"] = time.perf_counter() - start
+                record["error"] = _error_record(e)
+                self.cassette._write(record)
+                raise
+            record["duration"] = time.perf_counter() - start
+            record["result"] = result
+            self.cassette._write(record)
+            return result
+
+        return call
+
+
+class ReplayClock:
+    """
+    The clock of a replay, driven by the recorded call times.
+
+    With speed None, time stands still between calls: sleep() advances it instantly, like
+    SimClock, and each replayed call moves it to the moment its response arrived, so a session
+    replays as fast as the CPU allows. With a speed, time runs `speed` times faster than the
+    wall clock and each replayed call waits until its response is due, so the session replays
+    at its recorded pace.
+
+    Once the tape is used up, sleep() raises CassetteExhausted, so that loops which make no
+    call while they wait end too.
+    """
+    def __init__(self, start, speed=None):
+        self.start = start
+        self.speed = speed
+        self.stopped = False
+        self.now = start
+        self.wall_start = time.time()
+        self.lock = threading.Lock()
+
+    def time(self):
+        if self.speed is None:
+            return self.now
+        return self.start + (time.time() - self.wall_start) * self.speed
+
+    def sleep(self, seconds):
+        if self.stopped:
+            raise CassetteExhausted("The cassette has been replayed.")
+        if self.speed is None:
+            with self.lock:
+                self.now += max(seconds, 0.0)
+        else:
+            time.sleep(max(seconds, 0.0) / self.speed)
+
+    def advance_to(self, timestamp):
+        if self.speed is None:
+            with self.lock:
+                self.now = max(self.now, timestamp)
+        else:
+            time.sleep(max(timestamp - self.time(), 0.0) / self.speed)
+
+
+class CassettePlayer:
+    """
+    CassettePlayer serves the responses of a recorded session to the unchanged strategy:
+
+        player = CassettePlayer("cassette.jsonl")
+        HypeSpotPerpArbitrage(coin, info=player.client("info"), exchange=player.client("exchange"),
+                              address=player.session["address"], clock=player.clock, notify=False)
+
+    A call gets the oldest unused response recorded for the same method and arguments, else,
+    unless strict, the oldest unused response of the same method: arguments that hold
+    timestamps, such as user_fills_by_time, differ from run to run. Threads may not
+    interleave as they did when recording, so responses are matched per method rather than
+    in one global order.
+    """
+    def __init__(self, path, speed=None, strict=False):
+        """
+        :param path: str, the JSONL file written by a Cassette.
+        :param speed: float, replay pace relative to the recording, None for as fast as possible.
+        :param strict: bool, raise CassetteMismatch instead of falling back to the same method.
+        """
+        self.session = {}
+        self.records = []
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = _loads(line)
+                if "session" in record:
+                    self.session = record["session"]
+                else:
+                    self.records.append(record)
+
+        self.strict = strict
+        self.used = [False] * len(self.records)
+        self.by_call = defaultdict(deque)
+        self.by_method = defaultdict(deque)
+        for index, record in enumerate(self.records):
+            client, method = record["client"], record["method"]
+            self.by_call[client, _call_key(method, record["args"], record["kwargs"])].append(index)
+            self.by_method[client, method].append(index)
+        self.replayed = 0
+        self.fallbacks = 0
+        self.lock = threading.Lock()
+
+        start = self.records[0]["time"] if self.records else self.session.get("started", 0.0)
+        self.clock = ReplayClock(start, speed)
+
+    def client(self, name):
+        return ReplayingClient(self, name)
+
+    @staticmethod
+    def _pop(queue, used):
+        while queue and used[queue[0]]:
+            queue.popleft()
+        return queue.popleft() if queue else None
+
+    def next_record(self, client, method, args, kwargs):
+        # Arguments go through JSON first so that they compare like the recorded ones
+        args, kwargs = _loads(_dumps([list(args), kwargs]))
+        with self.lock:
+            index = self._pop(self.by_call[client, _call_key(method, args, kwargs)], self.used)
+            if index is None:
+                index = self._pop(self.by_method[client, method], self.used)
+                if index is None:
+                    self.clock.stopped = True
+                    raise CassetteExhausted(f"The cassette has no {client}.{method} response left.")
+                if self.strict:
+                    self.by_method[client, method].appendleft(index)
+                    raise CassetteMismatch(f"No recorded {client}.{method} call with args {args} {kwargs}.")
+                self.fallbacks += 1
+            self.used[index] = True
+            self.replayed += 1
+            if self.replayed == len(self.records):
+                self.clock.stopped = True
+            return self.records[index]
+
+    def replay(self, client, method, args, kwargs):
+        record = self.next_record(client, method, args, kwargs)
+        self.clock.advance_to(record["time"] + record["duration"])
+        if "error" in record:
+            raise _rebuild_error(record["error"])
+        return record["result"]
+
+    def status(self):
+        with self.lock:
+            return {
+                "recorded": len(self.records),
+                "replayed": self.replayed,
+                "fallbacks": self.fallbacks,
+                "remaining": len(self.records) - self.replayed
+            }
+
+
+class ReplayingClient:
+    """Stands in for an Info or Exchange instance, answering every method from a CassettePlayer."""
+    def __init__(self, player, name):
+        self.player = player
+        self.name = name
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            return self.player.replay(self.name, name, args, kwargs)
+
+        return call
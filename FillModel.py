@@ -0,0 +1,201 @@
+import json
+import math
+import os
+
+from Payloads import L2Book
+
+
+def _ewma(value, sample, alpha):
+    return sample if value is None else value + alpha * (sample - value)
+
+
+def _gamma_cdf(shape, x):
+    """P(Gamma(shape, 1) <= x), by the Wilson-Hilferty approximation."""
+    if x <= 0:
+        return 0.0
+    c = 1.0 / (9.0 * shape)
+    z = ((x / shape) ** (1.0 / 3.0) - (1.0 - c)) / math.sqrt(c)
+    return 0.5 * (1.0 + math.erf(z / math.sqrt(2.0)))
+
+
+class FillModel:
+    """
+    FillModel estimates, for each price level on our side of the spot book, the probability
+    that a maker order placed there fills within a horizon and its expected time to fill, and
+    picks the level of lowest expected cost.
+
+    A buy joining the bids at level k fills once sellers have taken everything ahead of it,
+    levels 0 to k, and then the order itself. The volume leaving the top of each side between
+    two snapshots, from trades and from cancellations alike, gives a flow rate R and its
+    dispersion D (variance over mean of the volume per interval). Our own orders calibrate
+    the share c of that flow which actually reaches our place in the queue: c is the number of
+    orders filled over the number the flow predicted, starting from a prior of queue_share.
+    The time to take a volume V is then Gamma-distributed with shape V / D and mean V / (c R).
+
+    The cost of a level, as a fraction of the mid, is
+        p * (distance from mid + maker fee) + (1 - p) * (crossing the spread + taker fee)
+        + risk_aversion * volatility * sqrt(expected wait)
+    with p the fill probability within horizon: an order still unfilled then is canceled and
+    crosses the spread, and every second we wait is exposed to the price moving.
+    """
+    def __init__(self, maker_fee, taker_fee, horizon=60.0, risk_aversion=1.0, max_levels=5, half_life=900.0,
+                 max_gap=300.0, queue_share=0.5, prior_orders=5.0, state_path="fill_model_state.json"):
+        """
+        :param maker_fee, taker_fee: float, the spot fees.
+        :param horizon: float, seconds we are willing to wait for a fill.
+        :param risk_aversion: float, the weight of the price risk while waiting.
+        :param max_levels: int, the number of levels of our side that are candidates.
+        :param half_life: float, seconds, half-life of the flow, dispersion and volatility estimates.
+        :param max_gap: float, seconds between two snapshots beyond which they are not compared.
+        :param queue_share: float, the prior share of the flow that reaches our queue position.
+        :param prior_orders: float, the weight of that prior, in orders.
+        :param state_path: str, the JSON file the calibration is kept in between runs, None to keep none.
+        """
+        self.maker_fee = maker_fee
+        self.taker_fee = taker_fee
+        self.horizon = horizon
+        self.risk_aversion = risk_aversion
+        self.max_levels = max_levels
+        self.half_life = half_life
+        self.max_gap = max_gap
+        self.state_path = state_path
+        self.state = {
+            "flow": {"bid": None, "ask": None},
+            "dispersion": {"bid": None, "ask": None},
+            "variance": None,           # of the log mid, per second
+            "filled": prior_orders * queue_share,
+            "predicted": prior_orders,
+            "orders": 0
+        }
+        if state_path and os.path.exists(state_path):
+            with open(state_path) as f:
+                self.state.update(json.load(f))
+        self.previous = None
+        self.pending = {}
+
+    def _save(self):
+        if not self.state_path:
+            return
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    @staticmethod
+    def _depletion(previous, current, is_bid):
+        """The volume that left the top of one side between two snapshots of it."""
+        (old_prices, old_sizes), (prices, sizes) = previous, current
+        if not prices:
+            return sum(old_sizes)
+        best = prices[0]
+        volume = 0.0
+        for px, sz in zip(old_prices, old_sizes):
+            if (px > best) if is_bid else (px < best):
+                # The price moved through this level
+                volume += sz
+            else:
+                if px == best:
+                    volume += max(sz - sizes[0], 0.0)
+                break
+        return volume
+
+    def observe_book(self, book, timestamp):
+        """Updates the flow, dispersion and volatility estimates with one spot l2 snapshot, raw or L2Book."""
+        book = L2Book.of(book)
+        current = {"bid": book.top(True, self.max_levels), "ask": book.top(False, self.max_levels), "mid": book.mid()}
+        previous, self.previous = self.previous, (timestamp, current)
+        if previous is None or current["mid"] is None:
+            return
+        dt = timestamp - previous[0]
+        if dt <= 0 or dt > self.max_gap or previous[1]["mid"] is None:
+            return
+
+        # Weighted by time, since snapshots come at irregular intervals
+        alpha = 1.0 - math.exp(-math.log(2) * dt / self.half_life)
+        flows, dispersions = self.state["flow"], self.state["dispersion"]
+        for side in ("bid", "ask"):
+            volume = self._depletion(previous[1][side], current[side], side == "bid")
+            if flows[side]:
+                dispersions[side] = _ewma(dispersions[side], (volume - flows[side] * dt) ** 2 / (flows[side] * dt), alpha)
+            flows[side] = _ewma(flows[side], volume / dt, alpha)
+        sample = math.log(current["mid"] / previous[1]["mid"]) ** 2 / dt
+        self.state["variance"] = _ewma(self.state["variance"], sample, alpha)
+
+    def observe_cassette(self, path, name):
+        """Calibrates the book estimates from the l2_snapshot responses of name recorded in a cassette."""
+        from Cassette import CassettePlayer
+
+        self.previous = None
+        for record in CassettePlayer(path).records:
+            if record["method"] != "l2_snapshot" or not record.get("result"):
+                continue
+            if (record["args"][0] if record["args"] else record["kwargs"].get("name")) != name:
+                continue
+            self.observe_book(record["result"], record["result"]["time"] / 1000)
+        self.previous = None
+
+    @property
+    def calibration(self):
+        """The share of the book flow that reaches our queue position, at most all of it."""
+        return min(self.state["filled"] / self.state["predicted"], 1.0)
+
+    def score(self, book, is_buy, size):
+        """
+        Scores joining each of the best max_levels levels of our side with an order of size.
+
+        :return: list of dicts, one per level: level, px, queue (volume ahead of us),
+                 fill_probability, expected_time, cost and flow (the uncalibrated rate);
+                 None until the flow on that side has been estimated.
+        """
+        book = L2Book.of(book)
+        side = "bid" if is_buy else "ask"
+        flow = self.state["flow"][side]
+        mid = book.mid()
+        if not flow or mid is None:
+            return None
+        rate = flow * self.calibration
+        far = book.best_ask() if is_buy else book.best_bid()
+        sign = 1.0 if is_buy else -1.0
+        cross_cost = sign * (far - mid) / mid + self.taker_fee
+        volatility = math.sqrt(self.state["variance"] or 0.0)
+
+        rows = []
+        queue = 0.0
+        prices, sizes = book.top(is_buy, self.max_levels)
+        # Until it is estimated, the flow is taken to come in lots the size of an average level
+        dispersion = max(self.state["dispersion"][side] or sum(sizes) / max(len(sizes), 1), 1e-12)
+        for level, (px, sz) in enumerate(zip(prices, sizes)):
+            queue += sz
+            volume = queue + size
+            expected_time = volume / rate
+            fill_probability = _gamma_cdf(volume / dispersion, rate / dispersion * self.horizon)
+            wait = fill_probability * min(expected_time, self.horizon) + (1 - fill_probability) * self.horizon
+            maker_cost = sign * (px - mid) / mid + self.maker_fee
+            cost = (fill_probability * maker_cost + (1 - fill_probability) * cross_cost
+                    + self.risk_aversion * volatility * math.sqrt(wait))
+            rows.append({"level": level, "px": px, "queue": queue, "fill_probability": fill_probability,
+                         "expected_time": expected_time, "cost": cost, "flow": flow})
+        return rows
+
+    def best_level(self, book, is_buy, size):
+        """The row of score() with the lowest expected cost, or None until the model has estimates."""
+        rows = self.score(book, is_buy, size)
+        return min(rows, key=lambda row: row["cost"]) if rows else None
+
+    def placed(self, key, row, size, timestamp):
+        """Remembers a maker order placed at a row of score(), until closed() tells how it went."""
+        self.pending[key] = {"volume": row["queue"] + size, "flow": row["flow"], "placed": timestamp}
+
+    def closed(self, key, filled_fraction, timestamp):
+        """
+        Calibrates with the outcome of a placed order: filled_fraction of it filled by timestamp,
+        against the fills the uncalibrated flow predicted over the same time.
+        """
+        order = self.pending.pop(key, None)
+        if order is None:
+            return
+        predicted = order["flow"] * max(timestamp - order["placed"], 0.0) / order["volume"]
+        self.state["filled"] += filled_fraction
+        self.state["predicted"] += predicted
+        self.state["orders"] += 1
+        self._save()
@@ -0,0 +1,225 @@
+import bisect
+import threading
+import time
+from collections import deque
+
+
+class StaleData(Exception):
+    """Raised when market data is older than its staleness budget, after any re-fetches."""
+
+
+class AgeHistogram:
+    """Counts of data ages in fixed buckets, in seconds, with their sum and maximum."""
+    BOUNDS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, age):
+        self.counts[bisect.bisect_left(self.BOUNDS, age)] += 1
+        self.count += 1
+        self.total += age
+        self.max = max(self.max, age)
+
+    def quantile(self, q):
+        """The upper bound of the bucket holding the q-quantile, inf past the last bound."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.BOUNDS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": {f"<={bound}": count for bound, count in zip(self.BOUNDS, self.counts)} | {"inf": self.counts[-1]}
+        }
+
+
+class FreshnessGuard:
+    """
+    FreshnessGuard knows how old every piece of market data is when we act on it.
+
+    Each read records when its data was produced, on our clock. Responses that carry a server
+    "time" in ms, such as l2_snapshot and user_state, give it exactly once the offset between
+    the server's clock and ours is known; for the others it is the middle of the request.
+    The offset is estimated from the same responses. Data is never produced after we receive
+    it, so server time minus receive time is a lower bound of the offset whatever the data's
+    age; the estimate is the largest such bound in a window, from the freshest response.
+    A stale response can only lower a bound, never raise it, so old data is never mistaken for
+    a clock difference, and ages err towards stale by at most one round trip. A bound leaves
+    the window once a later bound is window_seconds old too, so after our clock steps forward,
+    e.g. on an NTP correction, the ages are back to normal within about that time, while the
+    last bound before a pause in reads is kept: a response never sets its own offset, which
+    would make it look fresh whatever its age. Kept bounds lose max_drift seconds per second of
+    their age, the most our clock may drift from the server's.
+
+    read() re-fetches data older than its budget and raises StaleData if it stays stale;
+    decision() records the age of every input to an order, PnL or risk decision at the moment
+    it is made, and refuses one whose inputs have gone stale since they were read. Both feed
+    age histograms per source and per decision.
+    """
+    def __init__(self, budgets=None, default_budget=5.0, refetches=1, window=64, window_seconds=10.0, max_drift=0.001,
+                 clock=time, logger=None):
+        """
+        :param budgets: dict, method name (e.g. "l2_snapshot") to the largest age in seconds we act on.
+        :param default_budget: float, the budget of methods not in budgets.
+        :param refetches: int, how many times read() fetches again before raising StaleData.
+        :param window: int, the number of clock offset bounds the estimate is the largest of.
+        :param window_seconds: float, the age in seconds past which a bound leaves the window.
+        :param max_drift: float, seconds our clock may drift from the server's per second.
+        :param clock: object with time(), the strategy's clock.
+        :param logger: logging.Logger.
+        """
+        self.budgets = budgets or {}
+        self.default_budget = default_budget
+        self.refetches = refetches
+        self.clock = clock
+        self.logger = logger
+        self.offset_samples = deque(maxlen=window)
+        self.window_seconds = window_seconds
+        self.max_drift = max_drift
+        self.offset = 0.0
+        self.offset_error = None
+        self.produced = {}
+        self.histograms = {}
+        self.refused = {}
+        self.lock = threading.Lock()
+
+    def budget(self, source):
+        return self.budgets.get(source.split(":", 1)[0], self.default_budget)
+
+    def _observe(self, name, age):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = AgeHistogram()
+        histogram.observe(age)
+
+    def _update_offset(self, server_time, sent, received):
+        samples = self.offset_samples
+        samples.append((server_time - received, received - sent, received))
+        # Drop a bound once the next one is out of the window too, so one always precedes this one
+        while len(samples) > 1 and received - samples[1][2] > self.window_seconds:
+            samples.popleft()
+        self.offset, self.offset_error = max((bound - self.max_drift * (received - at), rtt)
+                                             for bound, rtt, at in samples)
+
+    def record(self, source, response, sent, received):
+        """Records one response received for source. Returns its age on arrival, in seconds."""
+        server_ms = response.get("time") if isinstance(response, dict) else None
+        with self.lock:
+            if isinstance(server_ms, (int, float)):
+                self._update_offset(server_ms / 1000, sent, received)
+                produced = server_ms / 1000 - self.offset
+            else:
+                produced = (sent + received) / 2
+            # A stale response never replaces a fresher one read meanwhile by another thread
+            self.produced[source] = max(produced, self.produced.get(source, produced))
+            age = max(received - produced, 0.0)
+            self._observe("read:" + source.split(":", 1)[0], age)
+        return age
+
+    def read(self, source, fetch):
+        """
+        Calls fetch() and returns its response, fetching again while it is older than the
+        budget of source, and raising StaleData once refetches are used up.
+        """
+        budget = self.budget(source)
+        for attempt in range(self.refetches + 1):
+            sent = self.clock.time()
+            response = fetch()
+            age = self.record(source, response, sent, self.clock.time())
+            if age <= budget:
+                return response
+            if self.logger:
+                self.logger.info(f"{source} is {age:.2f}s old, over its {budget}s budget"
+                                 + (". Fetching again." if attempt < self.refetches else "."))
+        with self.lock:
+            self.refused[source] = self.refused.get(source, 0) + 1
+        raise StaleData(f"{source} is {age:.2f}s old, over its {budget}s budget.")
+
+    def age(self, source, now=None):
+        """The age of the latest data read for source, None if it was never read."""
+        produced = self.produced.get(source)
+        if produced is None:
+            return None
+        return max((self.clock.time() if now is None else now) - produced, 0.0)
+
+    def decision(self, name, sources, refuse=True):
+        """
+        Records the age of each source a decision is about to act on.
+
+        :param name: str, the decision, e.g. "spot_order".
+        :param sources: list, the sources read for it, e.g. ["l2_snapshot:HYPE/USDC"].
+        :param refuse: bool, raise StaleData if an input is over its budget.
+        :return: dict of source to age in seconds.
+        """
+        now = self.clock.time()
+        ages = {source: self.age(source, now) for source in sources}
+        stale = []
+        with self.lock:
+            for source, age in ages.items():
+                if age is None:
+                    continue
+                self._observe(f"{name}:{source.split(':', 1)[0]}", age)
+                if age > self.budget(source):
+                    stale.append(source)
+            if stale and refuse:
+                self.refused[name] = self.refused.get(name, 0) + 1
+        if stale and refuse:
+            raise StaleData(f"Refusing {name}: " + ", ".join(f"{source} is {ages[source]:.2f}s old" for source in stale) + ".")
+        return ages
+
+    def snapshot(self):
+        """The clock offset, the current age of every source and the age histograms, for export."""
+        now = self.clock.time()
+        with self.lock:
+            return {
+                "clock_offset": self.offset,
+                "clock_offset_error": self.offset_error,
+                "ages": {source: max(now - produced, 0.0) for source, produced in self.produced.items()},
+                "refused": dict(self.refused),
+                "histograms": {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())}
+            }
+
+
+class FreshnessClient:
+    """
+    Wraps an Info instance so that every market-data read goes through FreshnessGuard.read():
+    its age is recorded, and it is fetched again or refused when over budget. Other methods
+    are passed through untouched.
+    """
+    GUARDED = ("l2_snapshot", "all_mids", "meta_and_asset_ctxs", "user_state", "spot_user_state")
+
+    def __init__(self, client, guard):
+        self.client = client
+        self.guard = guard
+
+    @staticmethod
+    def source(name, args, kwargs):
+        # Books are tracked per coin, the rest per method
+        if name == "l2_snapshot":
+            return f"l2_snapshot:{args[0] if args else kwargs.get('name')}"
+        return name
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if name not in self.GUARDED:
+            return attr
+
+        def call(*args, **kwargs):
+            return self.guard.read(self.source(name, args, kwargs), lambda: attr(*args, **kwargs))
+
+        return call
@@ -0,0 +1,245 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+HOUR_MS = 3600 * 1000
+HOURS_PER_YEAR = 24 * 365
+
+
+class FundingHistoryCache:
+    """
+    FundingHistoryCache keeps the hourly funding history of each perp in a local .npz file
+    of three columns: time (ms), fundingRate and premium.
+
+    download() fetches only what the cache is missing, for many coins in parallel, and saves
+    after every page, so an interrupted download resumes where it stopped. Pass an Info
+    wrapped in a ScheduledClient to keep the downloads within the request budget.
+    """
+    PAGE_LIMIT = 500    # funding_history returns at most this many points per call
+
+    def __init__(self, info, cache_dir="funding_cache", workers=4, logger=None):
+        """
+        :param info: Info, used for meta and funding_history, or None to only read the cache.
+        :param cache_dir: str, the directory of the .npz files.
+        :param workers: int, the number of coins downloaded at once.
+        :param logger: logging.Logger.
+        """
+        self.info = info
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.logger = logger
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, coin):
+        # Builder-deployed perps are named like 'dex:COIN'
+        return os.path.join(self.cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", coin) + ".npz")
+
+    def load(self, coin):
+        """Returns the cached (time, rate, premium) arrays of coin, empty if nothing is cached."""
+        path = self._path(coin)
+        if not os.path.exists(path):
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        with np.load(path) as data:
+            return data["time"], data["rate"], data["premium"]
+
+    def _save(self, coin, times, rates, premiums):
+        order = np.argsort(times, kind="stable")
+        times, rates, premiums = times[order], rates[order], premiums[order]
+        unique = np.concatenate(([True], times[1:] != times[:-1]))
+        # np.savez appends .npz to names without it
+        tmp_path = self._path(coin)[:-4] + ".tmp.npz"
+        np.savez(tmp_path, time=times[unique], rate=rates[unique], premium=premiums[unique])
+        os.replace(tmp_path, self._path(coin))
+
+    def _fetch(self, coin, start_ms, end_ms):
+        """Fetches [start_ms, end_ms] page by page, saving after each page."""
+        fetched = 0
+        while start_ms <= end_ms:
+            page = self.info.funding_history(coin, start_ms, end_ms)
+            if not page:
+                break
+            times, rates, premiums = self.load(coin)
+            self._save(coin,
+                       np.concatenate((times, np.array([p["time"] for p in page], dtype=np.int64))),
+                       np.concatenate((rates, np.array([float(p["fundingRate"]) for p in page]))),
+                       np.concatenate((premiums, np.array([float(p["premium"]) for p in page]))))
+            fetched += len(page)
+            start_ms = page[-1]["time"] + 1
+            if len(page) < self.PAGE_LIMIT:
+                break
+        return fetched
+
+    def update(self, coin, start_ms, end_ms):
+        """Fetches whatever part of [start_ms, end_ms] the cache of coin is missing."""
+        times, _, _ = self.load(coin)
+        fetched = 0
+        if len(times) == 0:
+            return self._fetch(coin, start_ms, end_ms)
+        if start_ms < times[0] - HOUR_MS:
+            fetched += self._fetch(coin, start_ms, int(times[0]) - 1)
+        if end_ms > times[-1] + HOUR_MS:
+            fetched += self._fetch(coin, int(times[-1]) + 1, end_ms)
+        return fetched
+
+    def universe(self):
+        return [asset["name"] for asset in self.info.meta()["universe"] if not asset.get("isDelisted")]
+
+    def cached(self):
+        """
+        The coins with a cache file, read from the directory without any request. Builder-deployed
+        perps come back with '_' for ':', which load() maps to the same file.
+        """
+        return sorted(name[:-4] for name in os.listdir(self.cache_dir)
+                      if name.endswith(".npz") and not name.endswith(".tmp.npz"))
+
+    def download(self, days=90, coins=None):
+        """
+        Brings the cache up to date for the last `days` days.
+
+        :param coins: list, the perps to download, defaults to every listed perp in meta().
+        :return: dict of coin to the number of points fetched.
+        """
+        end_ms = int(time.time() * 1000)
+        start_ms = end_ms - days * 24 * HOUR_MS
+        coins = coins or self.universe()
+        results = {}
+        lock = threading.Lock()
+
+        def work(coin):
+            try:
+                fetched = self.update(coin, start_ms, end_ms)
+            except Exception as e:
+                # The next download resumes from what was saved
+                if self.logger:
+                    self.logger.error(f"Funding history of {coin} failed: {e}")
+                fetched = None
+            with lock:
+                results[coin] = fetched
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            list(pool.map(work, coins))
+        return results
+
+    def matrix(self, coins, days=90, end_ms=None):
+        """
+        Aligns the cached histories on one hourly grid.
+
+        :return: (coins, hours, rates) where rates is a float array of shape (coins, hours),
+                 NaN where a coin has no funding print.
+        """
+        if end_ms is None:
+            end_ms = int(time.time() * 1000)
+        last_hour = end_ms // HOUR_MS
+        first_hour = last_hour - days * 24 + 1
+        hours = np.arange(first_hour, last_hour + 1)
+        rates = np.full((len(coins), len(hours)), np.nan)
+        for row, coin in enumerate(coins):
+            times, coin_rates, _ = self.load(coin)
+            index = times // HOUR_MS - first_hour
+            keep = (index >= 0) & (index < len(hours))
+            rates[row, index[keep]] = coin_rates[keep]
+        return list(coins), hours * HOUR_MS, rates
+
+
+def _positive_runs(positive):
+    """
+    Returns (rows, lengths) of every run of True along axis 1 of a boolean matrix,
+    for all rows at once.
+    """
+    padded = np.zeros((positive.shape[0], positive.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = positive
+    edges = np.diff(padded, axis=1)
+    start_rows, start_cols = np.nonzero(edges == 1)
+    _, end_cols = np.nonzero(edges == -1)
+    # Starts and ends come out in the same row-major order, one end per start
+    return start_rows, end_cols - start_cols
+
+
+def funding_statistics(rates, regime_window=24):
+    """
+    Computes funding statistics of every coin at once from a (coins, hours) matrix of hourly
+    rates, NaN where missing.
+
+    :param regime_window: int, hours of the moving average whose sign defines the regime.
+    :return: dict of arrays, one value per coin:
+        hours                hours with a funding print
+        mean_apr             mean funding, annualized
+        volatility_apr       standard deviation of hourly funding, annualized like the mean
+        positive_share       share of hours with positive funding
+        persistence          P(positive next hour | positive this hour)
+        autocorrelation      lag-1 autocorrelation of the rate
+        mean_positive_run    mean length of a run of positive hours
+        max_positive_run     longest run of positive hours
+        current_positive_run positive hours up to the last one
+        regime_changes       sign changes of the moving average
+        hours_in_regime      hours since the last sign change
+        recent_apr           mean funding of the last week, annualized
+    """
+    n_coins, n_hours = rates.shape
+    valid = ~np.isnan(rates)
+    filled = np.where(valid, rates, 0.0)
+    counts = valid.sum(axis=1)
+    safe_counts = np.maximum(counts, 1)
+
+    mean = filled.sum(axis=1) / safe_counts
+    deviation = np.where(valid, rates - mean[:, None], 0.0)
+    std = np.sqrt((deviation ** 2).sum(axis=1) / np.maximum(counts - 1, 1))
+
+    positive = valid & (filled > 0)
+    positive_share = positive.sum(axis=1) / safe_counts
+
+    both = valid[:, :-1] & valid[:, 1:]
+    stay_positive = (positive[:, :-1] & positive[:, 1:]).sum(axis=1)
+    was_positive = (positive[:, :-1] & both).sum(axis=1)
+    persistence = stay_positive / np.maximum(was_positive, 1)
+
+    lagged = (deviation[:, :-1] * deviation[:, 1:] * both).sum(axis=1)
+    autocorrelation = lagged / np.maximum((deviation ** 2).sum(axis=1), 1e-18)
+
+    rows, lengths = _positive_runs(positive)
+    run_counts = np.bincount(rows, minlength=n_coins)
+    mean_positive_run = np.bincount(rows, weights=lengths, minlength=n_coins) / np.maximum(run_counts, 1)
+    max_positive_run = np.zeros(n_coins, dtype=np.int64)
+    np.maximum.at(max_positive_run, rows, lengths)
+    # Counting back from the last hour, the first hour that is not positive ends the current run
+    current_positive_run = np.where(positive.all(axis=1), n_hours, np.argmax(~positive[:, ::-1], axis=1))
+
+    # The regime is the sign of a moving average, so single-hour flips do not count
+    window = min(regime_window, n_hours)
+    sums = np.cumsum(np.pad(filled, ((0, 0), (1, 0))), axis=1)
+    valid_sums = np.cumsum(np.pad(valid.astype(np.int64), ((0, 0), (1, 0))), axis=1)
+    moving = (sums[:, window:] - sums[:, :-window]) / np.maximum(valid_sums[:, window:] - valid_sums[:, :-window], 1)
+    sign = np.sign(moving)
+    changed = (sign[:, 1:] != sign[:, :-1]) & (sign[:, 1:] != 0) & (sign[:, :-1] != 0)
+    regime_changes = changed.sum(axis=1)
+    hours_in_regime = np.where(changed.any(axis=1), np.argmax(changed[:, ::-1], axis=1) + 1, moving.shape[1])
+
+    recent = slice(max(n_hours - 24 * 7, 0), n_hours)
+    recent_mean = filled[:, recent].sum(axis=1) / np.maximum(valid[:, recent].sum(axis=1), 1)
+
+    return {
+        "hours": counts,
+        "mean_apr": mean * HOURS_PER_YEAR,
+        "volatility_apr": std * HOURS_PER_YEAR,
+        "positive_share": positive_share,
+        "persistence": persistence,
+        "autocorrelation": autocorrelation,
+        "mean_positive_run": mean_positive_run,
+        "max_positive_run": max_positive_run,
+        "current_positive_run": current_positive_run,
+        "regime_changes": regime_changes,
+        "hours_in_regime": hours_in_regime,
+        "recent_apr": recent_mean * HOURS_PER_YEAR
+    }
+
+
+def rank_coins(coins, statistics, sort_by="mean_apr", min_hours=24 * 7):
+    """Returns one dict per coin with at least min_hours of history, best first."""
+    keep = np.nonzero(statistics["hours"] >= min_hours)[0]
+    order = keep[np.argsort(-statistics[sort_by][keep], kind="stable")]
+    return [dict({"coin": coins[i]}, **{key: values[i].item() for key, values in statistics.items()}) for i in order]
@@ -0,0 +1,197 @@
+import json
+import os
+import time
+
+
+class FundingLedger:
+    """
+    FundingLedger keeps the funding we were paid and the fees we paid, per coin.
+
+    It pulls info.user_funding_history and info.user_fills_by_time incrementally from cursors
+    stored on disk, appends every new event to a JSONL file and keeps running totals in a small
+    state file. Reports are served from the running totals, so they cost the same whether the
+    bot has been running for a day or a year.
+
+    Totals are kept twice per coin: for all time, and since the current position was opened
+    (see open_position), which is what the per-position yield is computed from.
+    """
+    # The most events user_funding_history and user_fills_by_time return per call
+    PAGE_LIMIT = 500
+    FILLS_PAGE_LIMIT = 2000
+    HOURS_PER_YEAR = 24 * 365
+
+    def __init__(self, info, address, path="funding_ledger.jsonl", state_path="funding_ledger_state.json",
+                 start_time=0, aliases=None):
+        """
+        :param info: Info, used for user_funding_history and user_fills_by_time.
+        :param address: str, the account address.
+        :param path: str, the JSONL file every funding and fee event is appended to.
+        :param state_path: str, the JSON file holding the cursors and running totals.
+        :param start_time: int, ms timestamp to start from when there is no stored cursor.
+        :param aliases: dict, maps fill coin names (e.g. '@107' for a spot pair) to a coin.
+        """
+        self.info = info
+        self.address = address
+        self.path = path
+        self.state_path = state_path
+        self.aliases = aliases or {}
+        self.state = {"funding_cursor": start_time, "fills_cursor": start_time, "funding_seen": [], "fills_seen": [],
+                      "prices": {}, "coins": {}}
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                self.state.update(json.load(f))
+
+    def _coin(self, coin):
+        return self.aliases.get(coin, coin)
+
+    @staticmethod
+    def _empty(start=0):
+        return {"funding": 0.0, "fees": 0.0, "hours": 0, "notional_hours": 0.0, "start": start, "last_time": None}
+
+    def _totals(self, coin):
+        coins = self.state["coins"]
+        if coin not in coins:
+            coins[coin] = {"all_time": self._empty(), "position": self._empty()}
+        return coins[coin]
+
+    def _add(self, coin, timestamp, funding=0.0, fee=0.0, notional=None):
+        for totals in self._totals(coin).values():
+            # Events from before the position was opened may still arrive with a late sync
+            if timestamp < totals["start"]:
+                continue
+            totals["funding"] += funding
+            totals["fees"] += fee
+            if notional is not None:
+                totals["hours"] += 1
+                totals["notional_hours"] += notional
+            totals["last_time"] = timestamp
+
+    def _unseen(self, page, limit, cursor, seen, key):
+        """
+        Returns the events of page not read yet and moves the cursor to its newest millisecond.
+        The cursor stays on that millisecond rather than past it, since a full page may end
+        midway through its events; the keys of those already read are kept in state[seen].
+        """
+        read = set(self.state[seen])
+        unseen = [item for item in page if item["time"] != self.state[cursor] or key(item) not in read]
+        if page:
+            newest = max(item["time"] for item in page)
+            keys = {key(item) for item in page if item["time"] == newest}
+            if newest == self.state[cursor]:
+                keys |= read
+            self.state[cursor] = newest
+            self.state[seen] = sorted(keys)
+            if len(page) >= limit and not unseen:
+                # A full page of one millisecond cannot be paged through by time; move past it
+                self.state[cursor] = newest + 1
+                self.state[seen] = []
+        return unseen
+
+    @staticmethod
+    def _funding_key(item):
+        return f"{item['delta'].get('coin')}-{item.get('hash')}"
+
+    @staticmethod
+    def _fill_key(fill):
+        return str(fill.get("tid") or f"{fill.get('hash')}-{fill['oid']}-{fill['px']}-{fill['sz']}")
+
+    def open_position(self, coin, timestamp=None):
+        """
+        Starts the per-position totals of coin afresh, e.g. when the strategy opens.
+
+        :param timestamp: int, ms timestamp of the opening. Defaults to now.
+        """
+        if timestamp is None:
+            timestamp = int(time.time() * 1000)
+        self._totals(coin)["position"] = self._empty(timestamp)
+        self._save()
+
+    def sync(self):
+        """
+        Pulls funding payments and fills newer than the stored cursors.
+        Returns the number of new events.
+        """
+        events = []
+
+        # Funding, oldest first, one page at a time
+        while True:
+            page = self.info.user_funding_history(self.address, self.state["funding_cursor"])
+            unseen = self._unseen(page, self.PAGE_LIMIT, "funding_cursor", "funding_seen", self._funding_key)
+            for item in unseen:
+                delta = item["delta"]
+                if delta.get("type") != "funding":
+                    continue
+                coin = self._coin(delta["coin"])
+                usdc = float(delta["usdc"])
+                rate = float(delta["fundingRate"])
+                szi = float(delta["szi"])
+                # Funding paid is notional * rate, so the notional of that hour is usdc / rate. With a zero
+                # rate it is priced at the last price funding gave, and left out if there is none.
+                if rate and szi:
+                    notional = abs(usdc / rate)
+                    self.state["prices"][coin] = notional / abs(szi)
+                else:
+                    price = self.state["prices"].get(coin)
+                    notional = abs(szi) * price if price is not None else None
+                self._add(coin, item["time"], funding=usdc, notional=notional)
+                events.append({"type": "funding", "time": item["time"], "coin": coin, "usdc": usdc,
+                               "rate": rate, "szi": szi, "hash": item.get("hash")})
+            if len(page) < self.PAGE_LIMIT:
+                break
+
+        # Fees, from our fills
+        while True:
+            fills = self.info.user_fills_by_time(self.address, self.state["fills_cursor"])
+            unseen = self._unseen(fills, self.FILLS_PAGE_LIMIT, "fills_cursor", "fills_seen", self._fill_key)
+            for fill in unseen:
+                coin = self._coin(fill["coin"])
+                fee = float(fill.get("fee", 0.0))
+                # Spot buys pay their fee in the token bought
+                if fill.get("feeToken") not in (None, "USDC"):
+                    fee *= float(fill["px"])
+                self._add(coin, fill["time"], fee=fee)
+                events.append({"type": "fee", "time": fill["time"], "coin": coin, "usdc": -fee,
+                               "oid": fill.get("oid"), "dir": fill.get("dir")})
+            if len(fills) < self.FILLS_PAGE_LIMIT:
+                break
+
+        if events:
+            with open(self.path, "a") as f:
+                for event in events:
+                    f.write(json.dumps(event) + "\n")
+        self._save()
+        return len(events)
+
+    def _save(self):
+        # Write then rename, so a crash never leaves a half-written state file
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def report(self, coin, scope="position"):
+        """
+        Returns realized carry of coin.
+
+        :param scope: str, 'position' for the current position or 'all_time'.
+        :return: dict with funding, fees, net_carry, avg_notional, and annualized_yield of the funding
+                 alone and net_annualized_yield after fees, both over the hours funding was paid.
+        """
+        totals = self._totals(coin)[scope]
+        net_carry = totals["funding"] - totals["fees"]
+        avg_notional = totals["notional_hours"] / totals["hours"] if totals["hours"] else 0.0
+        annualized_yield = net_annualized_yield = None
+        if avg_notional > 0:
+            years = totals["hours"] / self.HOURS_PER_YEAR
+            annualized_yield = totals["funding"] / avg_notional / years
+            net_annualized_yield = net_carry / avg_notional / years
+        return {
+            "coin": coin,
+            "funding": totals["funding"],
+            "fees": totals["fees"],
+            "net_carry": net_carry,
+            "funding_hours": totals["hours"],
+            "avg_notional": avg_notional,
+            "annualized_yield": annualized_yield,
+            "net_annualized_yield": net_annualized_yield
+        }
@@ -0,0 +1,174 @@
+import time
+from datetime import datetime
+
+
+class FundingPredictor:
+    """
+    FundingPredictor projects the next hourly funding print of a perp from the
+    premium samples we see in info.meta_and_asset_ctxs().
+
+    HyperLiquid computes funding as the hourly average of the premium index P plus
+    a clamped interest component:
+        F_8h = P + clamp(I - P, -0.0005, 0.0005),  I = 0.01% per 8 hours
+        F_1h = F_8h / 8, capped at 4% per hour.
+
+    We keep time-weighted running sums of the premium over the current funding
+    interval, so each update is O(1) and the state does not grow with the number
+    of samples. The part of the interval that has not happened yet is projected
+    with an exponentially weighted mean of the recent premium, and the confidence
+    band shrinks as the interval elapses.
+    """
+    INTEREST_RATE_8H = 0.0001
+    PREMIUM_CLAMP = 0.0005
+    MAX_HOURLY_RATE = 0.04
+
+    def __init__(self, interval_seconds=3600, z_score=1.96, half_life_seconds=300, min_samples=10):
+        """
+        :param interval_seconds: int, the length of a funding interval in seconds.
+        :param z_score: float, width of the confidence band in standard deviations.
+        :param half_life_seconds: float, half-life of the recent-premium average used for the projection.
+        :param min_samples: int, samples needed before the band is trusted. With fewer, the variance
+                            estimates are still near zero and so is the width of the band.
+        """
+        self.interval_seconds = interval_seconds
+        self.z_score = z_score
+        self.half_life_seconds = half_life_seconds
+        self.min_samples = min_samples
+
+        self.interval_start = None
+        self.last_timestamp = None
+        self.last_premium = None
+        self.current_funding = None
+
+        # Time-weighted sums over the current funding interval
+        self.weight_sum = 0.0
+        self.premium_sum = 0.0
+        self.premium_sq_sum = 0.0
+        self.samples = 0
+        # Samples since startup, across intervals
+        self.total_samples = 0
+
+        # Exponentially weighted mean and variance of the premium, across intervals
+        self.ewma_premium = None
+        self.ewma_variance = 0.0
+
+        # Average premium of the last completed interval, kept for logging
+        self.settled_premium = None
+
+    @staticmethod
+    def premium_from_ctx(asset_ctx):
+        """
+        Computes the premium index from the impact prices and the oracle price.
+        Falls back to the 'premium' field when impact prices are missing.
+
+        :param asset_ctx: dict, one entry of info.meta_and_asset_ctxs()[1].
+        :return: float, the premium index.
+        """
+        impact_pxs = asset_ctx.get("impactPxs")
+        oracle_px = asset_ctx.get("oraclePx")
+        if impact_pxs and oracle_px and float(oracle_px) > 0:
+            oracle_px = float(oracle_px)
+            impact_bid = float(impact_pxs[0])
+            impact_ask = float(impact_pxs[1])
+            return (max(impact_bid - oracle_px, 0.0) - max(oracle_px - impact_ask, 0.0)) / oracle_px
+        return float(asset_ctx.get("premium") or 0.0)
+
+    @classmethod
+    def funding_from_premium(cls, premium):
+        """Maps an average premium to the hourly funding rate HyperLiquid would charge."""
+        interest = cls.INTEREST_RATE_8H - premium
+        interest = max(-cls.PREMIUM_CLAMP, min(cls.PREMIUM_CLAMP, interest))
+        hourly = (premium + interest) / 8
+        return max(-cls.MAX_HOURLY_RATE, min(cls.MAX_HOURLY_RATE, hourly))
+
+    def update(self, asset_ctx, timestamp=None):
+        """
+        Feeds one asset context sample into the estimator.
+
+        :param asset_ctx: dict, one entry of info.meta_and_asset_ctxs()[1].
+        :param timestamp: float, sample time in seconds. Defaults to now.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        premium = self.premium_from_ctx(asset_ctx)
+        if asset_ctx.get("funding") is not None:
+            self.current_funding = float(asset_ctx["funding"])
+
+        interval_start = timestamp - timestamp % self.interval_seconds
+        if self.interval_start is None or interval_start != self.interval_start:
+            self._roll_interval(interval_start)
+
+        # Each sample holds until the next one, so it is weighted by the time since the
+        # previous sample (or since the interval began for the first sample).
+        if self.last_timestamp is None:
+            weight = 1.0
+        else:
+            weight = max(timestamp - max(self.last_timestamp, interval_start), 1.0)
+        self.weight_sum += weight
+        self.premium_sum += weight * premium
+        self.premium_sq_sum += weight * premium * premium
+        self.samples += 1
+        self.total_samples += 1
+
+        if self.ewma_premium is None:
+            self.ewma_premium = premium
+        else:
+            dt = max(timestamp - self.last_timestamp, 0.0)
+            alpha = 1.0 - 0.5 ** (dt / self.half_life_seconds)
+            diff = premium - self.ewma_premium
+            self.ewma_premium += alpha * diff
+            self.ewma_variance = (1.0 - alpha) * (self.ewma_variance + alpha * diff * diff)
+
+        self.last_timestamp = timestamp
+        self.last_premium = premium
+
+    def _roll_interval(self, interval_start):
+        if self.weight_sum > 0:
+            self.settled_premium = self.premium_sum / self.weight_sum
+        self.interval_start = interval_start
+        self.weight_sum = 0.0
+        self.premium_sum = 0.0
+        self.premium_sq_sum = 0.0
+        self.samples = 0
+
+    def predict(self, timestamp=None):
+        """
+        Projects the funding rate of the current interval.
+
+        :param timestamp: float, evaluation time in seconds. Defaults to now.
+        :return: dict with the predicted hourly funding rate and its confidence band,
+                 or None if no sample has been seen yet. "ready" is False until min_samples
+                 samples were seen; the band should not be acted on before.
+        """
+        if self.ewma_premium is None:
+            return None
+        if timestamp is None:
+            timestamp = time.time()
+
+        elapsed = (timestamp - self.interval_start) / self.interval_seconds
+        elapsed = max(0.0, min(1.0, elapsed))
+
+        if self.weight_sum > 0:
+            observed_mean = self.premium_sum / self.weight_sum
+            observed_variance = max(self.premium_sq_sum / self.weight_sum - observed_mean ** 2, 0.0)
+        else:
+            observed_mean = self.ewma_premium
+            observed_variance = 0.0
+
+        # The observed part of the interval is known; the rest is projected from recent premium.
+        premium_avg = elapsed * observed_mean + (1.0 - elapsed) * self.ewma_premium
+        sigma = max(observed_variance, self.ewma_variance) ** 0.5
+        half_width = self.z_score * sigma * (1.0 - elapsed)
+
+        next_settlement = self.interval_start + self.interval_seconds
+        return {
+            "premium_avg": premium_avg,
+            "predicted": self.funding_from_premium(premium_avg),
+            "lower": self.funding_from_premium(premium_avg - half_width),
+            "upper": self.funding_from_premium(premium_avg + half_width),
+            "current": self.current_funding,
+            "elapsed_fraction": elapsed,
+            "samples": self.samples,
+            "ready": self.total_samples >= self.min_samples,
+            "next_settlement": datetime.fromtimestamp(next_settlement).strftime('%Y-%m-%d %H:%M:%S')
+        }
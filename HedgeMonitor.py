@@ -0,0 +1,99 @@
+import math
+
+from Payloads import AccountState, SpotState
+
+
+class HedgeMonitor:
+    """
+    HedgeMonitor compares the spot holding of a coin with its perp short and sizes the
+    smallest corrective order that brings the net delta back inside a USD band.
+
+    The two legs are rounded separately (spot by _round_spot_px_sz, perp by _round_perp_px_sz)
+    and spot fees are charged in the bought token, so the legs drift apart after entry.
+    Corrections are placed on the perp leg when its lot size allows it, otherwise on the spot leg.
+    """
+    def __init__(self, coin, perp_sz_decimals, spot_sz_decimals, band_usd=10.0, min_order_usd=10.0):
+        """
+        :param coin: str, the coin we hold on spot and short on perp.
+        :param perp_sz_decimals: int, szDecimals of the perp.
+        :param spot_sz_decimals: int, szDecimals of the spot token.
+        :param band_usd: float, the net delta in USDC we tolerate before correcting.
+        :param min_order_usd: float, the smallest order value the exchange accepts.
+        """
+        self.coin = coin
+        self.perp_lot = 10 ** -perp_sz_decimals
+        self.spot_lot = 10 ** -spot_sz_decimals
+        self.perp_sz_decimals = perp_sz_decimals
+        self.spot_sz_decimals = spot_sz_decimals
+        self.band_usd = band_usd
+        self.min_order_usd = min_order_usd
+        self.residual_delta_usd = None
+
+    def measure(self, user_state, spot_user_state, mark_price):
+        """
+        Measures the net delta from one user_state and one spot_user_state.
+
+        :param user_state: dict, info.user_state(address), or an AccountState decoded from it.
+        :param spot_user_state: dict, info.spot_user_state(address), or a SpotState decoded from it.
+        :param mark_price: float, the perp mark price of coin.
+        :return: dict with spot_size, perp_size (signed szi), net_delta and net_delta_usd.
+        """
+        spot_size = SpotState.of(spot_user_state).total(self.coin)
+        position = AccountState.of(user_state).position(self.coin)
+        perp_size = position.szi if position is not None else 0.0
+
+        net_delta = spot_size + perp_size
+        net_delta_usd = net_delta * mark_price
+        self.residual_delta_usd = net_delta_usd
+
+        return {
+            "spot_size": spot_size,
+            "perp_size": perp_size,
+            "net_delta": net_delta,
+            "net_delta_usd": net_delta_usd,
+            "mark_price": mark_price
+        }
+
+    def _minimal_size(self, net_delta, mark_price, lot, decimals):
+        """
+        Returns the smallest multiple of lot that brings |net_delta| inside the band without
+        overshooting it on the other side, or None if the lot size makes that impossible.
+        """
+        band = self.band_usd / mark_price
+        excess = abs(net_delta) - band
+        if excess <= 0:
+            return 0.0
+
+        size = math.ceil(excess / lot - 1e-9) * lot
+        min_size = math.ceil(self.min_order_usd / mark_price / lot - 1e-9) * lot
+        size = max(size, min_size)
+
+        if size > abs(net_delta) + band:
+            return None
+        return round(size, decimals)
+
+    def corrective_order(self, measurement):
+        """
+        Sizes the corrective order for a measurement.
+
+        :param measurement: dict, the result of measure().
+        :return: None if delta is inside the band or cannot be corrected with the lot sizes,
+                 otherwise dict with 'leg' ('perp' or 'spot'), 'is_buy' and 'size'.
+        """
+        net_delta = measurement["net_delta"]
+        mark_price = measurement["mark_price"]
+        if abs(measurement["net_delta_usd"]) <= self.band_usd or mark_price <= 0:
+            return None
+
+        # Long delta: short more perp or sell spot. Short delta: buy back perp or buy spot.
+        is_buy = net_delta < 0
+
+        size = self._minimal_size(net_delta, mark_price, self.perp_lot, self.perp_sz_decimals)
+        if size:
+            return {"leg": "perp", "is_buy": is_buy, "size": size}
+
+        size = self._minimal_size(net_delta, mark_price, self.spot_lot, self.spot_sz_decimals)
+        if size:
+            return {"leg": "spot", "is_buy": is_buy, "size": size}
+
+        return None
@@ -0,0 +1,321 @@
+import json
+import math
+import random
+
+
+class PriceProcess:
+    """
+    A geometric random walk of the mid price, sampled on a fixed time step.
+    Several feeds can share one process so that spot and perp books move together.
+
+    Only a window of recent samples is kept. When nobody needs the steps in between,
+    mid_at(index, jump=True) samples the walk at index directly, which is exact for a
+    driftless geometric walk.
+    """
+    WINDOW = 8192
+
+    def __init__(self, mid, volatility=0.8, step=1.0, seed=None):
+        """
+        :param mid: float, the starting mid price.
+        :param volatility: float, annualized volatility of the mid.
+        :param step: float, seconds between two samples of the walk.
+        :param seed: int, seed of the random generator, for reproducible runs.
+        """
+        self.step = step
+        self.sigma = volatility * math.sqrt(step / (365 * 24 * 3600))
+        self.random = random.Random(seed)
+        self.mids = [mid]
+        self.offset = 0     # The index of self.mids[0]
+
+    def mid_at(self, index, jump=False):
+        last = self.offset + len(self.mids) - 1
+        if jump and index > last + 1:
+            mid = self.mids[-1] * math.exp(self.random.gauss(0.0, self.sigma * math.sqrt(index - last)))
+            self.mids = [mid]
+            self.offset = index
+            return mid
+
+        while self.offset + len(self.mids) <= index:
+            self.mids.append(self.mids[-1] * math.exp(self.random.gauss(0.0, self.sigma)))
+        if len(self.mids) > 2 * self.WINDOW:
+            del self.mids[:self.WINDOW]
+            self.offset += self.WINDOW
+        return self.mids[index - self.offset]
+
+
+class SyntheticFeed:
+    """
+    Generates l2 books and trade prints around a PriceProcess.
+
+    Each step yields a book of `levels` price levels per side and a Poisson number of
+    trades at the touch, so resting orders at the best price see realistic queue depletion.
+    """
+    def __init__(self, process, tick=0.001, spread_ticks=1, levels=20, level_size=50.0,
+                 trade_rate=0.5, trade_size=10.0, offset=0.0, seed=None):
+        """
+        :param process: PriceProcess, the mid price this book is built around.
+        :param tick: float, the price increment of the book.
+        :param spread_ticks: int, half the spread, in ticks.
+        :param levels: int, the number of levels per side.
+        :param level_size: float, the mean size of a level.
+        :param trade_rate: float, trades per second at the touch.
+        :param trade_size: float, the mean size of a trade.
+        :param offset: float, relative offset of this book's mid from the process, e.g. the perp basis.
+        :param seed: int, seed of the random generator.
+        """
+        self.process = process
+        self.tick = tick
+        self.spread_ticks = spread_ticks
+        self.levels = levels
+        self.level_size = level_size
+        self.trade_rate = trade_rate
+        self.trade_size = trade_size
+        self.offset = offset
+        self.random = random.Random(seed)
+        self.index = 0
+        self.sizes = {}
+
+    def _poisson(self, lam):
+        # Knuth's method; lam is small here (trades per step)
+        threshold = math.exp(-lam)
+        k, p = 0, self.random.random()
+        while p > threshold:
+            k += 1
+            p *= self.random.random()
+        return k
+
+    def _evolve(self, key):
+        # Level sizes persist between steps and drift, so queues behave like a real book
+        if key not in self.sizes:
+            self.sizes[key] = self.random.expovariate(1 / self.level_size)
+        else:
+            self.sizes[key] *= math.exp(self.random.gauss(0.0, 0.1))
+            self.sizes[key] += self.random.expovariate(1 / self.level_size) * 0.05
+        return self.sizes[key]
+
+    def advance(self, until, full=True):
+        """
+        Returns the events of every step up to time `until`, each a dict in the format of
+        info.l2_snapshot() plus a 'trades' list of {'side': 'B'/'A', 'px', 'sz'}.
+        'side' is the aggressor: 'B' buys at the ask, 'A' sells at the bid.
+
+        With full=False only the book of the last step is built, without trades. That is all
+        a book without our resting orders needs, and it keeps long sleeps cheap.
+        """
+        last_index = int(until / self.process.step + 1e-9)
+        if last_index <= self.index:
+            return []
+        if not full:
+            self.index = last_index
+            return [self._step(jump=True)]
+
+        events = []
+        while self.index < last_index:
+            self.index += 1
+            events.append(self._step())
+        return events
+
+    def _step(self, jump=False):
+        t = self.index * self.process.step
+        mid = self.process.mid_at(self.index, jump=jump) * (1 + self.offset)
+        best_bid = (math.floor(mid / self.tick) - self.spread_ticks + 1) * self.tick
+        best_ask = (math.ceil(mid / self.tick) + self.spread_ticks - 1) * self.tick
+        if best_ask <= best_bid:
+            best_ask = best_bid + self.tick
+
+        bid_ticks = [round(best_bid / self.tick) - i for i in range(self.levels)]
+        ask_ticks = [round(best_ask / self.tick) + i for i in range(self.levels)]
+
+        trades = []
+        if not jump:
+            for _ in range(self._poisson(self.trade_rate * self.process.step)):
+                side = "B" if self.random.random() < 0.5 else "A"
+                key = ask_ticks[0] if side == "B" else bid_ticks[0]
+                trade_sz = self.random.expovariate(1 / self.trade_size)
+                trades.append({"side": side, "px": round(key * self.tick, 10), "sz": trade_sz})
+                # The trade takes liquidity from the touch
+                if key in self.sizes:
+                    self.sizes[key] = max(self.sizes[key] - trade_sz, 0.0)
+
+        bids = [{"px": round(key * self.tick, 10), "sz": self._evolve(key), "n": 1} for key in bid_ticks]
+        asks = [{"px": round(key * self.tick, 10), "sz": self._evolve(key), "n": 1} for key in ask_ticks]
+        # Forget levels that left the book
+        live = set(bid_ticks) | set(ask_ticks)
+        self.sizes = {key: sz for key, sz in self.sizes.items() if key in live}
+
+        return {"time": int(t * 1000), "levels": [bids, asks], "trades": trades}
+
+
+class RecordedFeed:
+    """
+    Replays recorded books, e.g. info.l2_snapshot() responses saved one JSON object per line.
+    Events may carry a 'trades' list in the same format as SyntheticFeed.
+    Times are shifted so the first event is at time 0 of the simulation clock.
+    """
+    def __init__(self, events):
+        self.events = sorted(events, key=lambda e: e["time"])
+        self.start = self.events[0]["time"] if self.events else 0
+        self.index = 0
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls([json.loads(line) for line in f if line.strip()])
+
+    def advance(self, until, full=True):
+        """Returns the recorded events up to time `until`, or only the last of them if not full."""
+        events = []
+        while self.index < len(self.events) and (self.events[self.index]["time"] - self.start) / 1000 <= until:
+            event = dict(self.events[self.index])
+            event["time"] = event["time"] - self.start
+            events.append(event)
+            self.index += 1
+        return events if full else events[-1:]
+
+
+class RestingOrder:
+    """One of our orders resting in an OrderBook."""
+    def __init__(self, oid, cloid, is_buy, px, sz, queue_ahead, timestamp):
+        self.oid = oid
+        self.cloid = cloid
+        self.is_buy = is_buy
+        self.px = px
+        self.orig_sz = sz
+        self.remaining = sz
+        self.queue_ahead = queue_ahead
+        self.timestamp = timestamp
+
+
+class OrderBook:
+    """
+    A price-time priority book for one market, mixing external liquidity from a feed with
+    our own resting orders.
+
+    External size at a price is always ahead of our orders at that price. When we join a level,
+    our queue_ahead is the size already there (plus our own earlier orders). Trades at our price
+    consume the queue ahead of us before filling us; trades through our price, or a book that
+    crosses our price, fill us completely. A decrease in level size without a trade is a
+    cancellation, and queue_decay of it is assumed to come from ahead of us.
+    """
+    def __init__(self, name, queue_decay=0.5):
+        self.name = name
+        self.queue_decay = queue_decay
+        self.bids = []
+        self.asks = []
+        self.resting = {}
+
+    def _level_size(self, levels, px):
+        for level in levels:
+            if abs(level[0] - px) < 1e-9:
+                return level[1]
+        return 0.0
+
+    def best_bid(self):
+        return self.bids[0][0] if self.bids else None
+
+    def best_ask(self):
+        return self.asks[0][0] if self.asks else None
+
+    def mid(self):
+        if not self.bids or not self.asks:
+            return None
+        return (self.bids[0][0] + self.asks[0][0]) / 2
+
+    def snapshot(self, depth=20):
+        """Returns the book in the 'levels' format of info.l2_snapshot(), our orders included."""
+        def side(levels, is_buy):
+            merged = {}
+            for px, sz in levels:
+                merged[px] = merged.get(px, 0.0) + sz
+            for order in self.resting.values():
+                if order.is_buy == is_buy:
+                    merged[order.px] = merged.get(order.px, 0.0) + order.remaining
+            prices = sorted(merged, reverse=is_buy)[:depth]
+            return [{"px": str(px), "sz": str(round(merged[px], 8)), "n": 1} for px in prices]
+        return [side(self.bids, True), side(self.asks, False)]
+
+    def apply_event(self, event):
+        """
+        Applies one feed event and returns the fills of our resting orders
+        as a list of (order, px, sz).
+        """
+        bids = [(float(level["px"]), float(level["sz"])) for level in event["levels"][0]]
+        asks = [(float(level["px"]), float(level["sz"])) for level in event["levels"][1]]
+        fills = []
+        traded = {}
+        for trade in event.get("trades", []):
+            px, sz = float(trade["px"]), float(trade["sz"])
+            traded[px] = traded.get(px, 0.0) + sz
+            fills.extend(self._apply_trade(trade["side"] == "B", px, sz))
+
+        for order in list(self.resting.values()):
+            levels, new_levels = (self.bids, bids) if order.is_buy else (self.asks, asks)
+            before = self._level_size(levels, order.px)
+            after = self._level_size(new_levels, order.px)
+            cancelled = max(before - after - traded.get(order.px, 0.0), 0.0)
+            order.queue_ahead = max(min(order.queue_ahead - cancelled * self.queue_decay, after), 0.0)
+
+        self.bids, self.asks = bids, asks
+
+        # The other side moved through our price
+        for order in list(self.resting.values()):
+            crossed = (order.is_buy and asks and asks[0][0] <= order.px) or \
+                      (not order.is_buy and bids and bids[0][0] >= order.px)
+            if crossed:
+                fills.append(self._fill_resting(order, order.remaining))
+        return fills
+
+    def _apply_trade(self, is_buy_aggressor, px, sz):
+        fills = []
+        for order in sorted(self.resting.values(), key=lambda o: o.timestamp):
+            # A buy aggressor hits resting asks, a sell aggressor hits resting bids
+            if order.is_buy == is_buy_aggressor:
+                continue
+            through = px < order.px if order.is_buy else px > order.px
+            if through:
+                fills.append(self._fill_resting(order, order.remaining))
+            elif abs(px - order.px) < 1e-9:
+                fill = min(max(sz - order.queue_ahead, 0.0), order.remaining)
+                order.queue_ahead = max(order.queue_ahead - sz, 0.0)
+                if fill > 0:
+                    fills.append(self._fill_resting(order, fill))
+        return fills
+
+    def _fill_resting(self, order, sz):
+        order.remaining -= sz
+        if order.remaining <= 1e-12:
+            del self.resting[order.oid]
+        return order, order.px, sz
+
+    def match(self, is_buy, sz, limit_px):
+        """
+        Matches an incoming order against external liquidity up to limit_px.
+        Returns the taker fills as a list of (px, sz) and removes the liquidity taken.
+        """
+        levels = self.asks if is_buy else self.bids
+        fills = []
+        remaining = sz
+        while remaining > 1e-12 and levels:
+            px, level_sz = levels[0]
+            if (is_buy and px > limit_px) or (not is_buy and px < limit_px):
+                break
+            take = min(remaining, level_sz)
+            fills.append((px, take))
+            remaining -= take
+            if take >= level_sz - 1e-12:
+                levels.pop(0)
+            else:
+                levels[0] = (px, level_sz - take)
+        return fills
+
+    def rest(self, oid, cloid, is_buy, px, sz, timestamp):
+        """Adds one of our orders at the back of the queue at px."""
+        levels = self.bids if is_buy else self.asks
+        queue_ahead = self._level_size(levels, px)
+        queue_ahead += sum(o.remaining for o in self.resting.values() if o.is_buy == is_buy and abs(o.px - px) < 1e-9)
+        order = RestingOrder(oid, cloid, is_buy, px, sz, queue_ahead, timestamp)
+        self.resting[oid] = order
+        return order
+
+    def cancel(self, oid):
+        return self.resting.pop(oid, None)
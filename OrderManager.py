@@ -0,0 +1,380 @@
+import json
+import os
+import secrets
+import threading
+import time
+
+from hyperliquid.exchange import Exchange
+from hyperliquid.utils.types import Cloid
+
+
+def _cloid_key(cloid):
+    return cloid.to_raw() if hasattr(cloid, "to_raw") else str(cloid)
+
+
+class OrderRecord:
+    """The lifecycle of one order: pending (sent, no answer yet), open, filled, canceled or rejected."""
+    CLOSED = ("filled", "canceled", "rejected")
+
+    def __init__(self, cloid, coin, leg, is_buy, sz, limit_px=None, tif=None, step=None, created=None):
+        self.cloid = cloid
+        self.oid = None
+        self.coin = coin
+        self.leg = leg
+        self.is_buy = is_buy
+        self.sz = sz
+        self.limit_px = limit_px
+        self.tif = tif
+        self.step = step
+        self.status = "pending"
+        self.error = None
+        self.filled_sz = 0.0
+        self.notional = 0.0
+        self.fill_ids = set()
+        self.created = created
+        self.updated = created
+
+    @property
+    def closed(self):
+        return self.status in self.CLOSED
+
+    @property
+    def avg_px(self):
+        return self.notional / self.filled_sz if self.filled_sz else None
+
+    def to_dict(self):
+        data = {key: getattr(self, key) for key in ("cloid", "oid", "coin", "leg", "is_buy", "sz", "limit_px", "tif",
+                                                    "step", "status", "error", "filled_sz", "notional", "created", "updated")}
+        data["fill_ids"] = sorted(self.fill_ids)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls(data["cloid"], data["coin"], data["leg"], data["is_buy"], data["sz"], data["limit_px"],
+                     data["tif"], data["step"], data["created"])
+        for key in ("oid", "status", "error", "filled_sz", "notional", "updated"):
+            setattr(record, key, data[key])
+        record.fill_ids = set(data["fill_ids"])
+        return record
+
+
+class OrderManager:
+    """
+    OrderManager gives every order a cloid and tracks it until it is filled, canceled or rejected.
+
+    Records are indexed by cloid, oid, coin and leg ('spot' or 'perp'), so status lookups are
+    dictionary reads. refresh() updates every open order at once from one open_orders call,
+    and fetches fills only when an order left the book or shrank, instead of one
+    query_order_by_oid round trip per order.
+
+    Every change is appended to a JSONL file before and after the order is sent, so after a
+    restart reconcile() can tell which orders of the previous run are still live.
+    """
+    def __init__(self, info, exchange, address, path="orders.jsonl", recent=500, clock=time, logger=None):
+        """
+        :param info: Info, for open_orders, user_fills_by_time and query_order_by_cloid.
+        :param exchange: Exchange, to place orders with.
+        :param address: str, the account address.
+        :param path: str, the JSONL file records are persisted to, or None to keep them in memory.
+        :param recent: int, the number of closed records kept in memory.
+        :param clock: object with time() and sleep(), the time module unless simulating.
+        :param logger: logging.Logger.
+        """
+        self.info = info
+        self.exchange = exchange
+        self.address = address
+        self.path = path
+        self.recent = recent
+        self.clock = clock
+        self.logger = logger
+        self.by_cloid = {}
+        self.by_oid = {}
+        self.by_coin = {}
+        self.by_leg = {}
+        self.open = set()
+        # Orders may be placed from several strategy threads
+        self.lock = threading.RLock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def new_cloid(self):
+        return Cloid.from_str("0x" + secrets.token_hex(16))
+
+    # ---- index ---------------------------------------------------------------------------
+
+    def _index(self, record):
+        self.by_cloid[record.cloid] = record
+        if record.oid is not None:
+            self.by_oid[record.oid] = record
+        self.by_coin.setdefault(record.coin, set()).add(record.cloid)
+        self.by_leg.setdefault(record.leg, set()).add(record.cloid)
+        if record.closed:
+            self.open.discard(record.cloid)
+        else:
+            self.open.add(record.cloid)
+
+    def _forget_old(self):
+        closed = [record for record in self.by_cloid.values() if record.closed]
+        if len(closed) <= self.recent:
+            return
+        closed.sort(key=lambda record: record.updated or 0)
+        for record in closed[:len(closed) - self.recent]:
+            del self.by_cloid[record.cloid]
+            self.by_oid.pop(record.oid, None)
+            self.by_coin[record.coin].discard(record.cloid)
+            self.by_leg[record.leg].discard(record.cloid)
+
+    def get(self, cloid):
+        return self.by_cloid.get(_cloid_key(cloid))
+
+    def get_by_oid(self, oid):
+        return self.by_oid.get(oid)
+
+    def status(self, cloid):
+        record = self.get(cloid)
+        return record.status if record else None
+
+    def open_orders(self, coin=None, leg=None):
+        """Returns the live records, optionally of one coin or leg."""
+        with self.lock:
+            cloids = set(self.open)
+            if coin is not None:
+                cloids &= self.by_coin.get(coin, set())
+            if leg is not None:
+                cloids &= self.by_leg.get(leg, set())
+            return [self.by_cloid[cloid] for cloid in cloids]
+
+    def snapshot(self):
+        """The live records as dicts, copied under the lock so that another thread can read them."""
+        with self.lock:
+            return [record.to_dict() for record in self.open_orders()]
+
+    # ---- persistence ---------------------------------------------------------------------
+
+    def _save(self, record):
+        with self.lock:
+            record.updated = self.clock.time()
+            self._index(record)
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record.to_dict()) + "\n")
+
+    def _load(self):
+        # The last line of a cloid is its latest state
+        with open(self.path) as f:
+            lines = [line for line in f if line.strip()]
+        for line in lines:
+            self._index(OrderRecord.from_dict(json.loads(line)))
+        self._forget_old()
+        # Keep the file from growing without bound
+        if len(lines) > 4 * max(len(self.by_cloid), 1):
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                for record in self.by_cloid.values():
+                    f.write(json.dumps(record.to_dict()) + "\n")
+            os.replace(tmp_path, self.path)
+
+    # ---- placing -------------------------------------------------------------------------
+
+    def _register(self, cloid, coin, leg, is_buy, sz, limit_px, tif, step):
+        record = OrderRecord(_cloid_key(cloid), coin, leg, is_buy, sz, limit_px, tif, step, self.clock.time())
+        self._save(record)
+        return record
+
+    def apply_response(self, record, response):
+        """Updates a record from the response of exchange.order, market_open or market_close."""
+        if response is None:
+            record.status, record.error = "rejected", "No response."
+        elif response.get("status") != "ok":
+            record.status, record.error = "rejected", str(response.get("response"))
+        else:
+            status = response["response"]["data"]["statuses"][0]
+            if "resting" in status:
+                record.oid = status["resting"]["oid"]
+                record.status = "open"
+            elif "filled" in status:
+                filled = status["filled"]
+                record.oid = filled["oid"]
+                record.filled_sz = float(filled["totalSz"])
+                record.notional = record.filled_sz * float(filled["avgPx"])
+                # An Ioc order is done even when it filled only partly
+                record.status = "filled" if record.filled_sz >= record.sz - 1e-9 or record.tif != "Gtc" else "open"
+            else:
+                record.status, record.error = "rejected", status.get("error")
+        self._save(record)
+        return record
+
+    def order(self, coin, leg, is_buy, sz, limit_px, order_type, reduce_only=False, cloid=None, step=None):
+        """Places exchange.order with a cloid and tracks it. Returns the exchange response."""
+        cloid = cloid or self.new_cloid()
+        tif = order_type.get("limit", {}).get("tif")
+        record = self._register(cloid, coin, leg, is_buy, sz, limit_px, tif, step)
+        response = self.exchange.order(coin, is_buy, sz, limit_px, order_type, reduce_only=reduce_only, cloid=cloid)
+        self.apply_response(record, response)
+        return response
+
+    def market_open(self, coin, is_buy, sz, slippage, cloid=None, step=None):
+        cloid = cloid or self.new_cloid()
+        record = self._register(cloid, coin, "perp", is_buy, sz, None, "Ioc", step)
+        response = self.exchange.market_open(coin, is_buy, sz, slippage=slippage, cloid=cloid)
+        self.apply_response(record, response)
+        return response
+
+    def market_close(self, coin, is_buy, sz=None, slippage=Exchange.DEFAULT_SLIPPAGE, cloid=None, step=None):
+        """
+        :param is_buy: bool, the side of the closing order, True when closing a short.
+        :param sz: float, the size to close, or None for the whole position.
+        """
+        cloid = cloid or self.new_cloid()
+        record = self._register(cloid, coin, "perp", is_buy, sz or 0.0, None, "Ioc", step)
+        response = self.exchange.market_close(coin, sz=sz, slippage=slippage, cloid=cloid)
+        self.apply_response(record, response)
+        return response
+
+    def cancel(self, cloid):
+        """Cancels the open order with this cloid. Its record is updated by the next refresh()."""
+        record = self.get(cloid)
+        if record is None or record.closed or record.oid is None:
+            return None
+        return self.exchange.cancel(record.coin, record.oid)
+
+    # ---- tracking ------------------------------------------------------------------------
+
+    def resolve(self, cloid):
+        """
+        Asks the exchange for the order with this cloid, updates its record, and returns the
+        response exchange.order would have returned, or None if the exchange never got it.
+        Only needed when a placement failed ambiguously or after a restart.
+        """
+        if isinstance(cloid, str):
+            cloid = Cloid.from_str(cloid)
+        order_status = self.info.query_order_by_cloid(self.address, cloid)
+        if order_status.get("status") != "order":
+            record = self.get(cloid)
+            if record is not None and record.status == "pending":
+                record.status, record.error = "rejected", "Never reached the exchange."
+                self._save(record)
+            return None
+
+        order = order_status["order"]["order"]
+        status = order_status["order"]["status"]
+        record = self.get(cloid)
+        if record is None:
+            record = OrderRecord(_cloid_key(cloid), order["coin"], "spot" if "/" in order["coin"] or order["coin"].startswith("@") else "perp",
+                                 order["side"] == "B", float(order["origSz"]), float(order["limitPx"]), None, None, self.clock.time())
+        record.oid = order["oid"]
+        if status == "open":
+            statuses = [{"resting": {"oid": order["oid"]}}]
+            record.status = "open"
+        elif status == "filled":
+            # For filled orders, avgPx is reported as the limit price
+            statuses = [{"filled": {"oid": order["oid"], "totalSz": order["origSz"], "avgPx": order["limitPx"]}}]
+            record.status = "filled"
+            if record.filled_sz < float(order["origSz"]):
+                record.filled_sz = float(order["origSz"])
+                record.notional = record.filled_sz * float(order["limitPx"])
+        else:
+            statuses = [{"error": f"Order {order['oid']} is {status}."}]
+            record.status = "canceled"
+        self._save(record)
+        return {"status": "ok", "response": {"type": "order", "data": {"statuses": statuses}}}
+
+    def refresh(self):
+        """
+        Updates every open record from one open_orders call, plus one user_fills_by_time
+        call when an order left the book or shrank. Returns the records that changed.
+        """
+        with self.lock:
+            return self._refresh()
+
+    def _refresh(self):
+        if not self.open:
+            return []
+
+        live = {order["oid"]: order for order in self.info.open_orders(self.address)}
+        changed = []
+        need_fills = False
+        for cloid in list(self.open):
+            record = self.by_cloid[cloid]
+            if record.oid is None:
+                continue
+            order = live.get(record.oid)
+            if order is None or float(order["sz"]) < record.sz - record.filled_sz - 1e-9:
+                need_fills = True
+
+        if need_fills:
+            # Fills already counted are skipped by their id
+            since = min(self.by_cloid[cloid].created for cloid in self.open)
+            fills = self.info.user_fills_by_time(self.address, int(since * 1000))
+            for fill in fills:
+                record = self.by_oid.get(fill["oid"])
+                # A closed record is final, e.g. an Ioc order whose fills came with its response
+                if record is None or record.cloid not in self.open:
+                    continue
+                fill_id = fill.get("tid") or f"{fill['oid']}-{fill['time']}-{fill['px']}-{fill['sz']}"
+                if fill_id in record.fill_ids:
+                    continue
+                if not record.fill_ids:
+                    # Every fill of an open order is after since, including any its response reported
+                    record.filled_sz = record.notional = 0.0
+                record.fill_ids.add(fill_id)
+                record.filled_sz += float(fill["sz"])
+                record.notional += float(fill["sz"]) * float(fill["px"])
+                if record not in changed:
+                    changed.append(record)
+
+        for cloid in list(self.open):
+            record = self.by_cloid[cloid]
+            if record.oid is None:
+                # The placement failed or we crashed before it returned; only the exchange knows
+                for order in live.values():
+                    if order.get("cloid") == record.cloid:
+                        record.oid, record.status = order["oid"], "open"
+                        changed.append(record)
+                        break
+                else:
+                    self.resolve(record.cloid)
+                continue
+            if record.oid in live:
+                continue
+            # Off the book: fully filled, or canceled with whatever filled before
+            record.status = "filled" if record.filled_sz >= record.sz - 1e-9 else "canceled"
+            if record not in changed:
+                changed.append(record)
+
+        for record in changed:
+            self._save(record)
+        self._forget_old()
+        return changed
+
+    def wait_closed(self, cloid, poll_interval=2.0, on_wait=None, timeout=None):
+        """
+        Refreshes every poll_interval seconds until the order with this cloid is no longer open.
+        Every order open meanwhile is refreshed by the same calls. Returns the record.
+
+        :param on_wait: function(record), called after each refresh that left it open.
+        :param timeout: float, seconds after which the record is returned even if still open.
+        """
+        record = self.get(cloid)
+        deadline = self.clock.time() + timeout if timeout is not None else None
+        while record is not None and not record.closed:
+            self.refresh()
+            if record.closed:
+                break
+            if deadline is not None and self.clock.time() >= deadline:
+                break
+            if on_wait:
+                on_wait(record)
+            self.clock.sleep(poll_interval if deadline is None else max(min(poll_interval, deadline - self.clock.time()), 0.0))
+        return record
+
+    def reconcile(self):
+        """
+        Brings the records of a previous run up to date, e.g. at startup:
+        pending records are resolved by cloid, the rest by refresh().
+        Returns the records still open.
+        """
+        for record in [self.by_cloid[cloid] for cloid in self.open if self.by_cloid[cloid].oid is None]:
+            self.resolve(record.cloid)
+        self.refresh()
+        return self.open_orders()
@@ -0,0 +1,588 @@
+import logging
+import statistics
+import time
+
+from FundingPredictor import FundingPredictor
+from MatchingEngine import OrderBook, PriceProcess, SyntheticFeed
+from Payloads import L2Book
+
+
+class EpisodeTimeout(Exception):
+    """Raised by a PaperMarket API call once the simulated clock passes market.deadline."""
+
+
+class SimClock:
+    """A virtual clock. sleep() advances it instantly, so a run goes as fast as the CPU allows."""
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(seconds, 0.0)
+
+
+def _cloid_key(cloid):
+    if cloid is None:
+        return None
+    return cloid.to_raw() if hasattr(cloid, "to_raw") else str(cloid)
+
+
+def _ok(response_type, statuses=None):
+    if statuses is None:
+        return {"status": "ok", "response": {"type": response_type}}
+    return {"status": "ok", "response": {"type": response_type, "data": {"statuses": statuses}}}
+
+
+class PaperMarket:
+    """
+    PaperMarket simulates HyperLiquid for one coin: a spot and a perp OrderBook fed by
+    SyntheticFeed or RecordedFeed, and the spot balances and cross-margin perp position
+    of a single account.
+
+    Use market.info and market.exchange wherever the strategy expects Info and Exchange.
+    Every API call advances market.clock by `latency` seconds and replays the feeds up to the
+    new time, so polling loops move simulated time forward without real waiting.
+    """
+    def __init__(self, coin, spot_feed, perp_feed, clock=None, maker_fee=0.0001, taker_fee=0.00035,
+                 usdc_spot=10000.0, usdc_perp=0.0, spot_sz_decimals=2, perp_sz_decimals=2,
+                 max_leverage=3, latency=0.05, queue_decay=0.5, impact_notional=20000.0,
+                 open_interest=5e7, day_volume=1e8, address="0x0000000000000000000000000000000000000000"):
+        """
+        :param coin: str, the perp name; the spot pair is coin + "/USDC".
+        :param spot_feed, perp_feed: feeds with an advance(until) method, see MatchingEngine.
+        :param clock: SimClock, shared with the strategy.
+        :param maker_fee, taker_fee: float, e.g. from setup_fees().
+        :param usdc_spot, usdc_perp: float, the starting USDC balances.
+        :param latency: float, simulated seconds per API round trip.
+        :param queue_decay: float, share of cancellations assumed to be ahead of our resting orders.
+        :param impact_notional: float, the notional HyperLiquid uses for impactPxs.
+        :param open_interest, day_volume: float, USDC notional of the rest of the market, which
+                                          bounds what CapitalAllocator puts into the coin.
+        """
+        self.coin = coin
+        self.pair = coin + "/USDC"
+        self.address = address
+        self.clock = clock or SimClock()
+        self.maker_fee = maker_fee
+        self.taker_fee = taker_fee
+        self.spot_sz_decimals = spot_sz_decimals
+        self.perp_sz_decimals = perp_sz_decimals
+        self.max_leverage = max_leverage
+        self.maintenance_rate = 1 / (2 * max_leverage)
+        self.latency = latency
+        self.impact_notional = impact_notional
+        self.open_interest = open_interest
+        self.day_volume = day_volume
+
+        self.books = {self.pair: OrderBook(self.pair, queue_decay), coin: OrderBook(coin, queue_decay)}
+        self.feeds = {self.pair: spot_feed, coin: perp_feed}
+        self.next_oid = 1
+        # The strategy waits on its maker orders forever, so episode runners bound simulated time
+        self.deadline = None
+
+        self.info = PaperInfo(self)
+        self.exchange = PaperExchange(self)
+        self.reset(usdc_spot, usdc_perp)
+
+    def reset(self, usdc_spot, usdc_perp=0.0):
+        """Cancels our resting orders and restarts the account from the given USDC balances."""
+        for book in self.books.values():
+            book.resting.clear()
+        self.balances = {"USDC": usdc_spot, self.coin: 0.0}
+        self.perp_usdc = usdc_perp
+        self.szi = 0.0
+        self.entry_px = 0.0
+        self.fills = []
+        self.orders = {}
+        self.cloids = {}
+        self.funding = []
+        self.funding_hour = int(self.clock.time() // 3600)
+
+    def now_ms(self):
+        return int(self.clock.time() * 1000)
+
+    def sync(self):
+        """Replays both feeds up to the clock and settles the fills of our resting orders."""
+        now = self.clock.time()
+        # Intermediate books only matter while we have orders resting. Both feeds use the same
+        # mode, since they share one price process.
+        full = any(book.resting for book in self.books.values())
+        for name, feed in self.feeds.items():
+            for event in feed.advance(now, full=full):
+                for order, px, sz in self.books[name].apply_event(event):
+                    self._settle(name, order.oid, order.is_buy, px, sz, crossed=False, timestamp=event["time"])
+        self._settle_funding(now)
+
+    def round_trip(self):
+        """Called at the start of every simulated API request."""
+        self.clock.sleep(self.latency)
+        if self.deadline is not None and self.clock.time() > self.deadline:
+            raise EpisodeTimeout(f"Simulated time passed the deadline {self.deadline}.")
+        self.sync()
+
+    def mark_price(self):
+        return self.books[self.coin].mid() or 0.0
+
+    def asset_ctx(self):
+        """The perp's asset context, with impactPxs and funding computed from the simulated books."""
+        perp_book = self.books[self.coin]
+        oracle_px = self.books[self.pair].mid() or perp_book.mid() or 0.0
+        mark_px = perp_book.mid() or oracle_px
+        book = L2Book({"levels": perp_book.snapshot()})
+        size = self.impact_notional / mark_px if mark_px else 0.0
+        impact_bid = book.vwap(True, size) or perp_book.best_bid() or mark_px
+        impact_ask = book.vwap(False, size) or perp_book.best_ask() or mark_px
+        ctx = {"impactPxs": [str(impact_bid), str(impact_ask)], "oraclePx": str(oracle_px)}
+        premium = FundingPredictor.premium_from_ctx(ctx)
+        ctx.update({
+            "funding": str(FundingPredictor.funding_from_premium(premium)),
+            "premium": str(premium),
+            "markPx": str(mark_px),
+            "midPx": str(mark_px),
+            "openInterest": str(abs(self.szi) + (self.open_interest / mark_px if mark_px else 0.0)),
+            "prevDayPx": str(mark_px),
+            "dayNtlVlm": str(self.day_volume),
+            "dayBaseVlm": "0.0"
+        })
+        return ctx
+
+    def _settle_funding(self, now):
+        """Pays or charges funding on the perp position for every hour boundary crossed."""
+        hour = int(now // 3600)
+        if hour <= self.funding_hour:
+            return
+        if self.szi != 0:
+            # The rate is taken from the current books, for every hour skipped by a long sleep as well
+            rate = float(self.asset_ctx()["funding"])
+            mark = self.mark_price()
+            for settled in range(self.funding_hour + 1, hour + 1):
+                usdc = -self.szi * mark * rate
+                self.perp_usdc += usdc
+                self.funding.append({
+                    "time": settled * 3600 * 1000, "hash": "",
+                    "delta": {"type": "funding", "coin": self.coin, "usdc": str(usdc), "szi": str(self.szi),
+                              "fundingRate": str(rate), "nSamples": None}
+                })
+        self.funding_hour = hour
+
+    # ---- account -------------------------------------------------------------------------
+
+    def account_value(self):
+        return self.perp_usdc + self.szi * (self.mark_price() - self.entry_px)
+
+    def margin_used(self):
+        return abs(self.szi) * self.mark_price() / self.max_leverage
+
+    def liquidation_px(self):
+        if self.szi == 0:
+            return None
+        q = abs(self.szi)
+        if self.szi < 0:
+            return (self.perp_usdc + q * self.entry_px) / (q * (1 + self.maintenance_rate))
+        return (q * self.entry_px - self.perp_usdc) / (q * (1 - self.maintenance_rate))
+
+    def _settle(self, name, oid, is_buy, px, sz, crossed, timestamp):
+        fee_rate = self.taker_fee if crossed else self.maker_fee
+        start_position = self.balances[self.coin] if name == self.pair else self.szi
+        closed_pnl = 0.0
+
+        if name == self.pair:
+            # Spot fees are charged in the token received
+            if is_buy:
+                fee, fee_token = sz * fee_rate, self.coin
+                self.balances["USDC"] -= px * sz
+                self.balances[self.coin] += sz - fee
+            else:
+                fee, fee_token = px * sz * fee_rate, "USDC"
+                self.balances[self.coin] -= sz
+                self.balances["USDC"] += px * sz - fee
+            direction = "Buy" if is_buy else "Sell"
+        else:
+            fee, fee_token = px * sz * fee_rate, "USDC"
+            self.perp_usdc -= fee
+            signed = sz if is_buy else -sz
+            if self.szi == 0 or (self.szi > 0) == is_buy:
+                direction = "Open Long" if is_buy else "Open Short"
+                self.entry_px = (abs(self.szi) * self.entry_px + sz * px) / (abs(self.szi) + sz)
+                self.szi += signed
+            else:
+                direction = "Close Short" if is_buy else "Close Long"
+                closed = min(sz, abs(self.szi))
+                closed_pnl = closed * (px - self.entry_px) * (1 if self.szi > 0 else -1)
+                self.perp_usdc += closed_pnl
+                self.szi += signed
+                if abs(self.szi) < 1e-12:
+                    self.szi, self.entry_px = 0.0, 0.0
+                elif (self.szi > 0) == is_buy:
+                    # The order flipped the position; the rest opens at px
+                    self.entry_px = px
+
+        self.fills.append({
+            "coin": name, "px": str(px), "sz": str(sz), "side": "B" if is_buy else "A",
+            "time": timestamp, "startPosition": str(start_position), "dir": direction,
+            "closedPnl": str(closed_pnl), "hash": "", "oid": oid, "crossed": crossed,
+            "fee": str(fee), "feeToken": fee_token
+        })
+
+        record = self.orders[oid]
+        record["sz"] = max(record["sz"] - sz, 0.0)
+        record["filled_sz"] += sz
+        record["notional"] += px * sz
+        if record["first_fill"] is None:
+            record["first_fill"] = timestamp / 1000
+        if record["sz"] <= 1e-12:
+            record["status"] = "filled"
+            record["filled_at"] = timestamp / 1000
+            record["statusTimestamp"] = timestamp
+
+    # ---- orders --------------------------------------------------------------------------
+
+    def place(self, name, is_buy, sz, limit_px, tif, reduce_only=False, cloid=None):
+        self.round_trip()
+        book = self.books.get(name)
+        if book is None:
+            return _ok("order", [{"error": f"Unknown asset {name}."}])
+
+        decimals = self.spot_sz_decimals if name == self.pair else self.perp_sz_decimals
+        if sz <= 0 or abs(round(sz, decimals) - sz) > 1e-12:
+            return _ok("order", [{"error": "Order has invalid size."}])
+
+        if name == self.pair:
+            if is_buy:
+                committed = sum(o.remaining * o.px for o in book.resting.values() if o.is_buy)
+                if sz * limit_px > self.balances["USDC"] - committed + 1e-9:
+                    return _ok("order", [{"error": "Insufficient spot balance."}])
+            else:
+                committed = sum(o.remaining for o in book.resting.values() if not o.is_buy)
+                if sz > self.balances[self.coin] - committed + 1e-9:
+                    return _ok("order", [{"error": "Insufficient spot balance."}])
+        elif reduce_only:
+            if self.szi == 0 or (self.szi > 0) == is_buy:
+                return _ok("order", [{"error": "Reduce only order would increase position."}])
+            sz = min(sz, abs(self.szi))
+        elif (abs(self.szi) + sz) * limit_px / self.max_leverage > self.account_value() + 1e-9 and (self.szi > 0) == is_buy:
+            return _ok("order", [{"error": "Insufficient margin to place order."}])
+
+        would_cross = (is_buy and book.best_ask() is not None and book.best_ask() <= limit_px) or \
+                      (not is_buy and book.best_bid() is not None and book.best_bid() >= limit_px)
+        if tif == "Alo" and would_cross:
+            return _ok("order", [{"error": "Post only order would have immediately matched."}])
+
+        oid = self.next_oid
+        self.next_oid += 1
+        now = self.now_ms()
+        self.orders[oid] = {
+            "coin": name, "side": "B" if is_buy else "A", "limitPx": str(limit_px), "sz": sz,
+            "origSz": sz, "oid": oid, "timestamp": now, "cloid": _cloid_key(cloid),
+            "status": "open", "statusTimestamp": now, "tif": tif,
+            "placed": now / 1000, "first_fill": None, "filled_at": None,
+            "filled_sz": 0.0, "notional": 0.0
+        }
+        if cloid is not None:
+            self.cloids[_cloid_key(cloid)] = oid
+
+        for px, fill_sz in book.match(is_buy, sz, limit_px):
+            self._settle(name, oid, is_buy, px, fill_sz, crossed=True, timestamp=now)
+
+        record = self.orders[oid]
+        if record["status"] == "filled":
+            avg_px = record["notional"] / record["filled_sz"]
+            return _ok("order", [{"filled": {"totalSz": str(record["filled_sz"]), "avgPx": str(avg_px), "oid": oid}}])
+        if tif == "Ioc":
+            record["status"] = "canceled"
+            if record["filled_sz"] > 0:
+                avg_px = record["notional"] / record["filled_sz"]
+                return _ok("order", [{"filled": {"totalSz": str(record["filled_sz"]), "avgPx": str(avg_px), "oid": oid}}])
+            return _ok("order", [{"error": "Order could not immediately match against any resting orders."}])
+
+        book.rest(oid, record["cloid"], is_buy, limit_px, record["sz"], now)
+        return _ok("order", [{"resting": {"oid": oid}}])
+
+    def cancel(self, name, oid):
+        self.round_trip()
+        if self.books[name].cancel(oid) is None:
+            return _ok("cancel", [{"error": "Order was never placed, already canceled, or filled."}])
+        self.orders[oid]["status"] = "canceled"
+        self.orders[oid]["statusTimestamp"] = self.now_ms()
+        return _ok("cancel", ["success"])
+
+    def order_status(self, oid):
+        record = self.orders.get(oid)
+        if record is None:
+            return {"status": "unknownOid"}
+        order = {key: record[key] for key in ("coin", "side", "limitPx", "oid", "timestamp", "cloid")}
+        order["sz"] = str(record["sz"])
+        order["origSz"] = str(record["origSz"])
+        return {"status": "order", "order": {"order": order, "status": record["status"],
+                                             "statusTimestamp": record["statusTimestamp"]}}
+
+    def episode_orders(self, since):
+        """Returns the order records placed at or after simulated time since."""
+        return [record for record in self.orders.values() if record["placed"] >= since]
+
+
+class PaperInfo:
+    """The subset of hyperliquid.info.Info the strategy uses, served by a PaperMarket."""
+    def __init__(self, market):
+        self.market = market
+
+    def l2_snapshot(self, name):
+        self.market.round_trip()
+        return {"coin": name, "time": self.market.now_ms(), "levels": self.market.books[name].snapshot()}
+
+    def all_mids(self):
+        self.market.round_trip()
+        return {name: str(book.mid()) for name, book in self.market.books.items() if book.mid() is not None}
+
+    def user_state(self, address):
+        market = self.market
+        market.round_trip()
+        account_value = market.account_value()
+        margin_used = market.margin_used()
+        summary = {
+            "accountValue": str(account_value),
+            "totalNtlPos": str(abs(market.szi) * market.mark_price()),
+            "totalRawUsd": str(market.perp_usdc - market.szi * market.entry_px),
+            "totalMarginUsed": str(margin_used)
+        }
+        positions = []
+        if market.szi != 0:
+            mark = market.mark_price()
+            positions.append({
+                "type": "oneWay",
+                "position": {
+                    "coin": market.coin,
+                    "szi": str(market.szi),
+                    "leverage": {"type": "cross", "value": market.max_leverage},
+                    "entryPx": str(market.entry_px),
+                    "positionValue": str(abs(market.szi) * mark),
+                    "unrealizedPnl": str(market.szi * (mark - market.entry_px)),
+                    "returnOnEquity": "0.0",
+                    "liquidationPx": str(market.liquidation_px()),
+                    "marginUsed": str(margin_used),
+                    "maxLeverage": market.max_leverage,
+                    "cumFunding": {"allTime": "0.0", "sinceOpen": "0.0", "sinceChange": "0.0"}
+                }
+            })
+        return {
+            "marginSummary": summary,
+            "crossMarginSummary": summary,
+            "crossMaintenanceMarginUsed": str(abs(market.szi) * market.mark_price() * market.maintenance_rate),
+            "withdrawable": str(max(account_value - margin_used, 0.0)),
+            "assetPositions": positions,
+            "time": market.now_ms()
+        }
+
+    def spot_user_state(self, address):
+        market = self.market
+        market.round_trip()
+        book = market.books[market.pair]
+        holds = {
+            "USDC": sum(o.remaining * o.px for o in book.resting.values() if o.is_buy),
+            market.coin: sum(o.remaining for o in book.resting.values() if not o.is_buy)
+        }
+        return {"balances": [
+            {"coin": token, "token": index, "hold": str(holds[token]), "total": str(total), "entryNtl": "0.0"}
+            for index, (token, total) in enumerate(market.balances.items())
+        ]}
+
+    def meta(self):
+        self.market.round_trip()
+        return {"universe": [{"name": self.market.coin, "szDecimals": self.market.perp_sz_decimals,
+                              "maxLeverage": self.market.max_leverage}]}
+
+    def spot_meta(self):
+        self.market.round_trip()
+        return {
+            "tokens": [{"name": "USDC", "szDecimals": 8, "weiDecimals": 8, "index": 0},
+                       {"name": self.market.coin, "szDecimals": self.market.spot_sz_decimals, "weiDecimals": 8, "index": 1}],
+            "universe": [{"name": self.market.pair, "tokens": [1, 0], "index": 0}]
+        }
+
+    def meta_and_asset_ctxs(self):
+        meta = self.meta()
+        return [meta, [self.market.asset_ctx()]]
+
+    def query_order_by_oid(self, user, oid):
+        self.market.round_trip()
+        return self.market.order_status(oid)
+
+    def query_order_by_cloid(self, user, cloid):
+        self.market.round_trip()
+        oid = self.market.cloids.get(_cloid_key(cloid))
+        return self.market.order_status(oid) if oid is not None else {"status": "unknownOid"}
+
+    def open_orders(self, address):
+        self.market.round_trip()
+        return [{"coin": r["coin"], "side": r["side"], "limitPx": r["limitPx"], "sz": str(r["sz"]),
+                 "oid": r["oid"], "timestamp": r["timestamp"], "origSz": str(r["origSz"]), "cloid": r["cloid"]}
+                for r in self.market.orders.values() if r["status"] == "open"]
+
+    def user_fills(self, address):
+        self.market.round_trip()
+        return list(reversed(self.market.fills))
+
+    def user_funding_history(self, user, startTime, endTime=None):
+        self.market.round_trip()
+        history = [item for item in self.market.funding
+                   if item["time"] >= startTime and (endTime is None or item["time"] <= endTime)]
+        return history[:500]
+
+    def user_fills_by_time(self, address, start_time, end_time=None):
+        self.market.round_trip()
+        return [fill for fill in self.market.fills
+                if fill["time"] >= start_time and (end_time is None or fill["time"] <= end_time)]
+
+
+class PaperExchange:
+    """The subset of hyperliquid.exchange.Exchange the strategy uses, served by a PaperMarket."""
+    DEFAULT_SLIPPAGE = 0.05
+
+    def __init__(self, market):
+        self.market = market
+        self.info = market.info
+
+    def order(self, name, is_buy, sz, limit_px, order_type, reduce_only=False, cloid=None, builder=None):
+        tif = order_type.get("limit", {}).get("tif", "Gtc")
+        return self.market.place(name, is_buy, sz, limit_px, tif, reduce_only=reduce_only, cloid=cloid)
+
+    def _slippage_price(self, name, is_buy, slippage, px=None):
+        if px is None:
+            px = self.market.books[name].mid()
+        return px * (1 + slippage) if is_buy else px * (1 - slippage)
+
+    def market_open(self, name, is_buy, sz, px=None, slippage=DEFAULT_SLIPPAGE, cloid=None, builder=None):
+        px = self._slippage_price(name, is_buy, slippage, px)
+        return self.market.place(name, is_buy, sz, px, "Ioc", cloid=cloid)
+
+    def market_close(self, coin, sz=None, px=None, slippage=DEFAULT_SLIPPAGE, cloid=None, builder=None):
+        # Like the SDK, returns None when there is no position to close
+        if self.market.szi == 0:
+            return None
+        is_buy = self.market.szi < 0
+        sz = sz or abs(self.market.szi)
+        px = self._slippage_price(coin, is_buy, slippage, px)
+        return self.market.place(coin, is_buy, sz, px, "Ioc", reduce_only=True, cloid=cloid)
+
+    def cancel(self, name, oid):
+        return self.market.cancel(name, oid)
+
+    def usd_class_transfer(self, amount, to_perp):
+        market = self.market
+        market.round_trip()
+        if to_perp:
+            if amount > market.balances["USDC"] + 1e-9:
+                return {"status": "err", "response": "Insufficient balance for transfer."}
+            market.balances["USDC"] -= amount
+            market.perp_usdc += amount
+        else:
+            withdrawable = market.account_value() - market.margin_used()
+            if amount > withdrawable + 1e-9:
+                return {"status": "err", "response": "Insufficient balance for transfer."}
+            market.perp_usdc -= amount
+            market.balances["USDC"] += amount
+        return _ok("default")
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def run_episodes(episodes=100, coin="HYPE", mid=25.0, usdc=10000.0, fill_horizon=60.0,
+                 basis_wait=False, gap=600.0, episode_timeout=900.0, seed=0, quiet=True):
+    """
+    Runs entry/exit episodes of HypeSpotPerpArbitrage against a synthetic PaperMarket and
+    returns fill statistics:
+        fill_probability  share of maker spot orders filled within fill_horizon seconds
+        fill_time         seconds from placing a maker spot order to its full fill
+        legging           seconds between the spot fill and the perp fill, i.e. time unhedged
+    Fees come from setup_fees().
+
+    :param episodes: int, the number of entry/exit round trips.
+    :param basis_wait: bool, whether the strategy waits for a favorable basis as configured.
+    :param gap: float, simulated seconds between two episodes.
+    :param episode_timeout: float, simulated seconds after which an unfinished episode is abandoned.
+    :param quiet: bool, silence the strategy's INFO logs during the run.
+    """
+    from basic_spot_perp_arb import HypeSpotPerpArbitrage
+    from example_utils import setup_fees
+
+    taker_fee, maker_fee = setup_fees()
+    process = PriceProcess(mid, seed=seed)
+    market = PaperMarket(coin,
+                         SyntheticFeed(process, seed=seed + 1),
+                         SyntheticFeed(process, offset=0.0005, seed=seed + 2),
+                         maker_fee=maker_fee, taker_fee=taker_fee, usdc_spot=usdc)
+    market.clock.sleep(process.step)
+    market.sync()
+
+    strategy = HypeSpotPerpArbitrage(coin, info=market.info, exchange=market.exchange,
+                                     address=market.address, clock=market.clock, notify=False)
+    if not basis_wait:
+        strategy.basis_max_wait = 0
+    # Keep simulated funding and fees out of the real ledger files
+    strategy.funding_ledger = None
+    if quiet:
+        strategy.logger.setLevel(logging.WARNING)
+
+    fill_times, legging = [], []
+    filled_in_horizon = maker_orders = timeouts = 0
+    wall_start = time.time()
+    sim_start = market.clock.time()
+
+    for _ in range(episodes):
+        market.reset(usdc)
+        strategy.is_spot_open = strategy.is_perp_open = False
+        strategy.allocation = None
+        strategy.entry_step = strategy.exit_step = None
+        strategy.step_cloids.clear()
+        market.deadline = market.clock.time() + episode_timeout
+
+        for action in (strategy.open_positions, strategy.close_positions):
+            since = market.clock.time()
+            try:
+                action()
+            except EpisodeTimeout:
+                timeouts += 1
+            orders = market.episode_orders(since)
+            spot = [o for o in orders if o["coin"] == market.pair and o["tif"] == "Gtc"]
+            perp = [o for o in orders if o["coin"] == coin and o["filled_at"] is not None]
+            for order in spot:
+                maker_orders += 1
+                if order["filled_at"] is not None:
+                    fill_times.append(order["filled_at"] - order["placed"])
+                    if fill_times[-1] <= fill_horizon:
+                        filled_in_horizon += 1
+            if spot and perp and spot[-1]["filled_at"] is not None:
+                legging.append(abs(perp[-1]["filled_at"] - spot[-1]["filled_at"]))
+            if market.clock.time() > market.deadline:
+                break
+
+        market.deadline = None
+        market.clock.sleep(gap)
+
+    wall = time.time() - wall_start
+    sim = market.clock.time() - sim_start
+    return {
+        "episodes": episodes,
+        "timeouts": timeouts,
+        "maker_orders": maker_orders,
+        "fill_probability": filled_in_horizon / maker_orders if maker_orders else None,
+        "fill_time_median": statistics.median(fill_times) if fill_times else None,
+        "fill_time_p90": _percentile(fill_times, 0.9),
+        "legging_median": statistics.median(legging) if legging else None,
+        "legging_p90": _percentile(legging, 0.9),
+        "simulated_seconds": sim,
+        "wall_seconds": wall,
+        "speedup": sim / wall if wall > 0 else None
+    }
+
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(run_episodes(episodes=200), indent=4))
@@ -0,0 +1,209 @@
+"""
+Typed views of Info responses, decoded once.
+
+The API sends every number as a string, so reading a raw response parses the same strings on
+every lookup. Each class here parses what is read of one response once, into __slots__ records or
+lists of floats, indexed by coin. Use Class.of(response), which decodes a raw response and
+passes an already decoded one through, so callers accept either.
+"""
+from itertools import islice
+
+
+class L2Book:
+    """
+    An l2_snapshot whose levels are parsed into lists of floats by the first walk that reaches
+    them, and never again: a small order only parses the top of the book, and the PnL engine
+    and the basis monitor walk the same book several times.
+    Lists rather than array('d'), since reading an array creates a new float every time.
+    """
+    __slots__ = ("coin", "time", "levels", "prices", "sizes")
+
+    def __init__(self, snapshot):
+        self.coin = snapshot.get("coin")
+        self.time = snapshot.get("time")
+        self.levels = snapshot["levels"]
+        # Index 0 is the bids, 1 the asks, as in 'levels'
+        self.prices = ([], [])
+        self.sizes = ([], [])
+
+    @classmethod
+    def of(cls, book):
+        return book if isinstance(book, cls) else cls(book)
+
+    def _best(self, side):
+        prices = self.prices[side]
+        if not prices:
+            levels = self.levels[side]
+            if not levels:
+                return None
+            prices.append(float(levels[0]["px"]))
+            self.sizes[side].append(float(levels[0]["sz"]))
+        return prices[0]
+
+    def best_bid(self):
+        return self._best(0)
+
+    def best_ask(self):
+        return self._best(1)
+
+    def mid(self):
+        bid, ask = self._best(0), self._best(1)
+        if bid is None or ask is None:
+            return None
+        return (bid + ask) / 2
+
+    def top(self, is_bid, depth):
+        """The prices and sizes of the best depth levels of the bids or the asks, best first."""
+        side = 0 if is_bid else 1
+        prices, sizes = self.prices[side], self.sizes[side]
+        for level in islice(self.levels[side], len(prices), depth):
+            prices.append(float(level["px"]))
+            sizes.append(float(level["sz"]))
+        return prices[:depth], sizes[:depth]
+
+    def sweep(self, is_bid, size):
+        """
+        Walks the bids (selling) or the asks (buying) for size.
+        Returns (executed, cost): the size the book could fill and what it cost in USDC.
+        """
+        executed, cost, _ = self._walk(0 if is_bid else 1, size)
+        return executed, cost
+
+    def _walk(self, side, size):
+        prices, sizes = self.prices[side], self.sizes[side]
+        remaining = size
+        executed = cost = 0.0
+        for px, sz in zip(prices, sizes):
+            if remaining <= 0:
+                break
+            take = min(remaining, sz)
+            cost += take * px
+            executed += take
+            remaining -= take
+        if remaining > 0:
+            # Past what earlier walks parsed: parse as we go and keep it
+            for level in islice(self.levels[side], len(prices), None):
+                px = float(level["px"])
+                sz = float(level["sz"])
+                prices.append(px)
+                sizes.append(sz)
+                take = min(remaining, sz)
+                cost += take * px
+                executed += take
+                remaining -= take
+                if remaining <= 0:
+                    break
+        return executed, cost, remaining
+
+    def vwap(self, is_bid, size):
+        """The average price of size, or None if the side cannot fill all of it."""
+        _, cost, remaining = self._walk(0 if is_bid else 1, size)
+        return cost / size if size > 0 and remaining <= 0 else None
+
+
+class Position:
+    __slots__ = ("coin", "szi", "entry_px", "position_value", "unrealized_pnl", "liquidation_px",
+                 "margin_used", "cum_funding")
+
+    def __init__(self, position):
+        self.coin = position["coin"]
+        self.szi = float(position["szi"])
+        self.entry_px = float(position["entryPx"]) if position.get("entryPx") is not None else None
+        self.position_value = float(position.get("positionValue") or 0.0)
+        self.unrealized_pnl = float(position.get("unrealizedPnl") or 0.0)
+        # Null when the account cannot be liquidated, e.g. a fully collateralized short
+        self.liquidation_px = float(position["liquidationPx"]) if position.get("liquidationPx") is not None else None
+        self.margin_used = float(position.get("marginUsed") or 0.0)
+        self.cum_funding = position.get("cumFunding")
+
+    @property
+    def mark_px(self):
+        return abs(self.position_value / self.szi) if self.szi else None
+
+
+class AccountState:
+    """
+    A user_state with its positions indexed by coin. A position is decoded the first time it
+    is read, so an account with many positions costs nothing for the ones we never look at.
+    """
+    __slots__ = ("raw", "positions", "decoded")
+
+    def __init__(self, user_state):
+        self.raw = user_state
+        self.positions = {item["position"]["coin"]: item["position"] for item in user_state.get("assetPositions", [])}
+        self.decoded = {}
+
+    @classmethod
+    def of(cls, user_state):
+        return user_state if isinstance(user_state, cls) else cls(user_state)
+
+    def position(self, coin):
+        """The Position in coin, or None if there is none."""
+        position = self.decoded.get(coin)
+        if position is None and coin in self.positions:
+            position = self.decoded[coin] = Position(self.positions[coin])
+        return position
+
+    @property
+    def account_value(self):
+        summary = self.raw.get("crossMarginSummary") or self.raw.get("marginSummary") or {}
+        return float(summary.get("accountValue") or 0.0)
+
+    @property
+    def maintenance_margin(self):
+        return float(self.raw.get("crossMaintenanceMarginUsed") or 0.0)
+
+    @property
+    def withdrawable(self):
+        return float(self.raw["withdrawable"]) if self.raw.get("withdrawable") is not None else None
+
+
+class SpotState:
+    """A spot_user_state: the total amount of each token."""
+    __slots__ = ("totals",)
+
+    def __init__(self, spot_user_state):
+        self.totals = {}
+        for balance in spot_user_state.get("balances", []):
+            try:
+                self.totals[balance["coin"]] = float(balance.get("total", 0.0))
+            except ValueError:
+                continue
+
+    @classmethod
+    def of(cls, spot_user_state):
+        return spot_user_state if isinstance(spot_user_state, cls) else cls(spot_user_state)
+
+    def total(self, token, default=0.0):
+        return self.totals.get(token, default)
+
+
+class AssetContexts:
+    """
+    A meta_and_asset_ctxs response indexed by perp name. Only the index is built up front:
+    reading one coin's field parses that one string, not the whole universe.
+    """
+    __slots__ = ("index", "universe", "contexts")
+
+    def __init__(self, meta_and_asset_ctxs):
+        meta, contexts = meta_and_asset_ctxs[0], meta_and_asset_ctxs[1]
+        self.universe = meta["universe"][:len(contexts)]
+        self.contexts = contexts
+        self.index = {asset["name"]: i for i, asset in enumerate(self.universe)}
+
+    @classmethod
+    def of(cls, meta_and_asset_ctxs):
+        return meta_and_asset_ctxs if isinstance(meta_and_asset_ctxs, cls) else cls(meta_and_asset_ctxs)
+
+    def __contains__(self, coin):
+        return coin in self.index
+
+    def ctx(self, coin):
+        """The raw asset context of coin, or None if it is not listed."""
+        i = self.index.get(coin)
+        return self.contexts[i] if i is not None else None
+
+    def value(self, coin, field):
+        """One numeric field of coin's context, e.g. "markPx", or None."""
+        ctx = self.ctx(coin)
+        return float(ctx[field]) if ctx is not None and ctx.get(field) is not None else None
@@ -1,5 +1,6 @@
 import json
-from example_utils import setup, setup_fees
+from example_utils import setup_fees, setup_info
+from Payloads import AccountState, L2Book
 from hyperliquid.utils import constants
 from datetime import datetime
 
@@ -10,35 +11,30 @@ class PnLCalculator:
 
     Closing short uses taker fee, whereas selling spot uses maker fee.
     """
-    def __init__(self, base_url=constants.MAINNET_API_URL):
-        self.address, self.info, self.exchange = setup(base_url=base_url, skip_ws=True)
+    def __init__(self, base_url=constants.MAINNET_API_URL, info=None, address=None):
+        """
+        :param base_url: str, the API to connect to when no info is given.
+        :param info: an Info instance to reuse, e.g. the strategy's. Skips setup_info() when given.
+        :param address: str, the account address that goes with info.
+        """
+        # We only read, so no wallet or Exchange is needed
+        if info is None:
+            self.address, self.info = setup_info(base_url=base_url)
+        else:
+            self.address, self.info = address, info
         self.taker_fee, self.maker_fee = setup_fees()
         print(f"Taker Fee: {self.taker_fee}, Maker Fee: {self.maker_fee}")
 
     def calculate_perp_pnl(self, l2_snapshot, position_size, entry_price, position_type="short"):
+        """
+        :param l2_snapshot: dict from info.l2_snapshot, or an L2Book already decoded from it.
+        """
         if position_type not in ["short", "long"]:
             return {"error": "Invalid position_type. Use 'short' or 'long'."}
-        
-        if position_type == "short":
-            orders = l2_snapshot['levels'][1]
-        else:
-            orders = l2_snapshot['levels'][0]
-
-        remaining_size = position_size
-        total_cost = 0.0
-        total_executed = 0.0
-
-        for order in orders:
-            px = float(order['px'])
-            sz = float(order['sz'])
-            
-            if remaining_size <= 0:
-                break
-            
-            size_to_execute = min(remaining_size, sz)
-            total_cost += size_to_execute * px
-            total_executed += size_to_execute
-            remaining_size -= size_to_execute
+
+        # Closing a short buys from the asks, closing a long sells into the bids
+        book = L2Book.of(l2_snapshot)
+        total_executed, total_cost = book.sweep(position_type == "long", position_size)
 
         if total_executed == 0:
             return {"error": "No liquidity in the order book"}
@@ -54,7 +50,7 @@ class PnLCalculator:
         fee = total_cost * self.taker_fee
         pnl = pnl_before_fees - fee
 
-        timestamp = l2_snapshot['time']
+        timestamp = book.time
         human_readable_time = datetime.fromtimestamp(timestamp=timestamp/1000).strftime('%Y-%m-%d %H:%M:%S')
 
         return {
@@ -69,47 +65,25 @@ class PnLCalculator:
         }
 
     def extract_entry_price_and_size(self, user_state, coin_name):
-        positions = user_state.get("assetPositions", [])
-        
-        for item in positions:
-            position = item.get("position", {})
-            coin = position.get("coin", "Unknown")
-            
-            if coin == coin_name:
-                entry_px = position.get("entryPx", None)
-                size = position.get("szi", None)
-                
-                entry_px = float(entry_px) if entry_px is not None else None
-                size = float(size) if size is not None else None
-                
-                if size is not None and size < 0:
-                    size = abs(size)
-                
-                return entry_px, size
-        
-        return None, None
+        """
+        Returns (entry price, absolute size) of the perp position in coin_name, or (None, None).
 
-    def calculate_spot_pnl(self, l2_snapshot, position_size, entry_price):
-        bids = l2_snapshot['levels'][0]
+        :param user_state: dict from info.user_state, or an AccountState already decoded from it.
+        """
+        position = AccountState.of(user_state).position(coin_name)
+        if position is None:
+            return None, None
+        return position.entry_px, abs(position.szi)
 
-        if not bids:
+    def calculate_spot_pnl(self, l2_snapshot, position_size, entry_price):
+        """
+        :param l2_snapshot: dict from info.l2_snapshot, or an L2Book already decoded from it.
+        """
+        book = L2Book.of(l2_snapshot)
+        if not book.levels[0]:
             return {"error": "No liquidity in the order book"}
 
-        remaining_size = position_size
-        total_revenue = 0.0
-        total_executed = 0.0
-
-        for order in bids:
-            px = float(order['px'])
-            sz = float(order['sz'])
-
-            if remaining_size <= 0:
-                break
-            
-            size_to_execute = min(remaining_size, sz)
-            total_revenue += size_to_execute * px
-            total_executed += size_to_execute
-            remaining_size -= size_to_execute
+        total_executed, total_revenue = book.sweep(True, position_size)
 
         if total_executed == 0:
             return {"error": "No liquidity in the order book"}
@@ -122,7 +96,7 @@ class PnLCalculator:
         fee = total_revenue * self.maker_fee
         pnl = pnl_before_fee - fee
 
-        timestamp = l2_snapshot['time']
+        timestamp = book.time
         human_readable_time = datetime.fromtimestamp(timestamp=timestamp/1000).strftime('%Y-%m-%d %H:%M:%S')
 
         return {
@@ -201,6 +175,9 @@ class PnLCalculator:
 
         spot_l2_snapshot = self.info.l2_snapshot(hype_spot)
         accum_result = self.get_latest_consecutive_trades(self.info.user_fills(address=self.address), "Buy")
+        if "error" in accum_result:
+            print(f"No {hype_spot} Position Found")
+            return
         spot_size = accum_result['total_trade_size']
         spot_entry_price = accum_result['average_trade_price']
         spot_result = self.calculate_spot_pnl(spot_l2_snapshot, spot_size, spot_entry_price)
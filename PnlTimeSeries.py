@@ -0,0 +1,227 @@
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+
+
+class RingBuffer:
+    """
+    A fixed-size, array-backed ring of (time, close, low, high) points.
+    Appends are O(1) and the memory used is fixed at construction.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('d', [0.0] * capacity)
+        self.close = array('d', [0.0] * capacity)
+        self.low = array('d', [0.0] * capacity)
+        self.high = array('d', [0.0] * capacity)
+        self.head = 0
+        self.count = 0
+
+    def append(self, t, close, low, high):
+        self.times[self.head] = t
+        self.close[self.head] = close
+        self.low[self.head] = low
+        self.high[self.head] = high
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def points(self):
+        """Yields (time, close, low, high), oldest first."""
+        start = (self.head - self.count) % self.capacity
+        for i in range(self.count):
+            j = (start + i) % self.capacity
+            yield self.times[j], self.close[j], self.low[j], self.high[j]
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def oldest_time(self):
+        if self.count == 0:
+            return None
+        return self.times[(self.head - self.count) % self.capacity]
+
+
+class PnlHistory:
+    """
+    PnL history in tiers of ring buffers. Tier 0 keeps every sample; each further tier keeps
+    one bar (close, low, high) per `factor` bars of the tier below, so older data is kept at
+    a coarser resolution in fixed memory.
+
+    With the defaults and one sample a minute: a day of raw samples, then 10-minute bars
+    for 10 days, then 100-minute bars for about 70 days.
+    """
+    def __init__(self, capacities=(1440, 1440, 1000), factor=10):
+        self.tiers = [RingBuffer(capacity) for capacity in capacities]
+        self.factor = factor
+        # The bar being built for each tier above 0: [count, time, close, low, high]
+        self.pending = [[0, 0.0, 0.0, float("inf"), float("-inf")] for _ in capacities[1:]]
+
+    def append(self, t, value):
+        self._push(0, t, value, value, value)
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+        self.pending = [[0, 0.0, 0.0, float("inf"), float("-inf")] for _ in self.tiers[1:]]
+
+    def _push(self, tier, t, close, low, high):
+        self.tiers[tier].append(t, close, low, high)
+        if tier + 1 >= len(self.tiers):
+            return
+        bar = self.pending[tier]
+        bar[0] += 1
+        bar[1], bar[2] = t, close
+        bar[3] = min(bar[3], low)
+        bar[4] = max(bar[4], high)
+        if bar[0] == self.factor:
+            self.pending[tier] = [0, 0.0, 0.0, float("inf"), float("-inf")]
+            self._push(tier + 1, bar[1], bar[2], bar[3], bar[4])
+
+    def points(self, since=None):
+        """
+        Yields (time, close, low, high), oldest first, at the finest resolution available
+        for each period.
+        """
+        # Coarse tiers only contribute the period before the finer tier's oldest point
+        covered_from = float("inf")
+        chunks = []
+        for tier in self.tiers:
+            chunk = [p for p in tier.points() if p[0] < covered_from and (since is None or p[0] >= since)]
+            chunks.append(chunk)
+            oldest = tier.oldest_time()
+            if oldest is not None:
+                covered_from = min(covered_from, oldest)
+        for chunk in reversed(chunks):
+            yield from chunk
+
+    def latest(self):
+        tier = self.tiers[0]
+        if tier.count == 0:
+            return None
+        j = (tier.head - 1) % tier.capacity
+        return tier.times[j], tier.close[j]
+
+    def max_drawdown(self, since=None):
+        """Returns the largest peak-to-trough fall of PnL since the given time."""
+        peak = float("-inf")
+        drawdown = 0.0
+        for _, _, low, high in self.points(since):
+            peak = max(peak, high)
+            drawdown = max(drawdown, peak - low)
+        return drawdown
+
+    def value_at(self, t):
+        """Returns the last PnL at or before time t, or None."""
+        value = None
+        for point_time, close, _, _ in self.points():
+            if point_time > t:
+                break
+            value = close
+        return value
+
+
+class PnlEngine:
+    """
+    PnlEngine marks both legs to their liquidation value on every book update, using entry
+    prices and sizes cached by refresh(), and keeps the result in a PnlHistory.
+
+    The liquidation value is what PnLCalculator computes: closing the short by walking the
+    perp asks at the taker fee and selling spot into the bids at the maker fee.
+    """
+    def __init__(self, pnl_calculator, coin, history=None):
+        """
+        :param pnl_calculator: PnLCalculator, used for the book walking and fees.
+        :param coin: str, the perp name.
+        :param history: PnlHistory, defaults to PnlHistory().
+        """
+        self.pnl_calculator = pnl_calculator
+        self.coin = coin
+        self.history = history or PnlHistory()
+        self.perp_entry_px = None
+        self.perp_size = None
+        self.spot_entry_px = None
+        self.spot_size = None
+        self.last = None
+        # The trading threads update and clear the history while the status server reads it
+        self.lock = threading.Lock()
+
+    def refresh(self, user_state, user_fills):
+        """
+        Caches entry prices and sizes of both legs. Call it after every trade.
+
+        :param user_state: dict, info.user_state(address).
+        :param user_fills: list, info.user_fills(address).
+        """
+        perp_entry_px, perp_size = self.pnl_calculator.extract_entry_price_and_size(user_state, self.coin)
+        spot = self.pnl_calculator.get_latest_consecutive_trades(user_fills, "Buy") if user_fills else {"error": "No fills"}
+        with self.lock:
+            self.perp_entry_px, self.perp_size = perp_entry_px, perp_size
+            if "error" in spot:
+                self.spot_entry_px, self.spot_size = None, None
+            else:
+                self.spot_entry_px, self.spot_size = spot["average_trade_price"], spot["total_trade_size"]
+
+    def clear(self):
+        """
+        Forgets the cached positions and their PnL history, e.g. after closing them, so the
+        latest PnL, drawdown and intraday PnL of the next position start afresh.
+        """
+        with self.lock:
+            self.perp_entry_px = self.perp_size = self.spot_entry_px = self.spot_size = None
+            self.history.clear()
+            self.last = None
+
+    @property
+    def has_positions(self):
+        return self.perp_size is not None or self.spot_size is not None
+
+    def update(self, spot_book, perp_book, timestamp=None):
+        """
+        Marks both legs against one spot and one perp l2 snapshot, raw or as L2Book, and records the total.
+
+        :return: dict with perp_pnl, spot_pnl and total, or None if we hold nothing or a book is empty.
+        """
+        if not self.has_positions:
+            return None
+        if timestamp is None:
+            timestamp = time.time()
+
+        perp_pnl = spot_pnl = 0.0
+        if self.perp_size:
+            result = self.pnl_calculator.calculate_perp_pnl(perp_book, self.perp_size, self.perp_entry_px)
+            if "error" in result:
+                return None
+            perp_pnl = result["pnl"]
+        if self.spot_size:
+            result = self.pnl_calculator.calculate_spot_pnl(spot_book, self.spot_size, self.spot_entry_px)
+            if "error" in result:
+                return None
+            spot_pnl = result["pnl"]
+
+        total = perp_pnl + spot_pnl
+        last = {"timestamp": timestamp, "perp_pnl": perp_pnl, "spot_pnl": spot_pnl, "total": total}
+        with self.lock:
+            self.history.append(timestamp, total)
+            self.last = last
+        return last
+
+    def max_drawdown(self, since=None):
+        with self.lock:
+            return self.history.max_drawdown(since)
+
+    def intraday_pnl(self, now=None):
+        """Returns the change in PnL since the start of the current UTC day, or None without history."""
+        with self.lock:
+            latest = self.history.latest()
+            if latest is None:
+                return None
+            if now is None:
+                now = latest[0]
+            day_start = datetime.fromtimestamp(now, tz=timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+            start_value = self.history.value_at(day_start)
+            if start_value is None:
+                # We started today; measure from the first sample
+                start_value = next(self.history.points(day_start))[1]
+            return latest[1] - start_value
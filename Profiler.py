@@ -0,0 +1,195 @@
+import logging
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime
+
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    # co_qualname (3.11+) names the class too, e.g. HypeSpotPerpArbitrage.place_spot_limit_order
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    SamplingProfiler records the stack of every thread every `interval` seconds from a
+    background thread, using sys._current_frames(), so the threads being profiled run
+    unmodified and pay nothing while it is stopped.
+
+    stop() writes the samples in collapsed-stack format, one 'thread;outer;...;inner count'
+    line per distinct stack, which flamegraph.pl, speedscope and inferno read directly.
+    """
+    def __init__(self, interval=0.01, output_dir="profiles", logger=None):
+        """
+        :param interval: float, seconds between two samples.
+        :param output_dir: str, where profiles and thread dumps are written.
+        :param logger: logging.Logger to report to.
+        """
+        self.interval = interval
+        self.output_dir = output_dir
+        self.logger = logger or logging.getLogger(__name__)
+        self.samples = Counter()
+        self.sample_count = 0
+        self.project_labels = set()
+        self.started_at = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return False
+            self.samples = Counter()
+            self.sample_count = 0
+            self.project_labels = set()
+            self.started_at = time.time()
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+            self.thread.start()
+        self.logger.info(f"Profiler started, sampling every {self.interval * 1000:.0f} ms.")
+        return True
+
+    def stop(self):
+        """Stops sampling and writes the collapsed stacks. Returns the file path, or None if not running."""
+        with self.lock:
+            if not self.running:
+                return None
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+        path = self.write_collapsed()
+        self.logger.info(f"Profiler stopped after {self.sample_count} samples, written to {path}.")
+        for name, share in self.top_functions():
+            self.logger.info(f"  {share:6.1%}  {name}")
+        return path
+
+    def toggle(self):
+        if self.running:
+            return self.stop()
+        self.start()
+        return None
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    label = _frame_label(frame)
+                    if frame.f_code.co_filename.startswith(PROJECT_DIR):
+                        self.project_labels.add(label)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def write_collapsed(self, path=None):
+        if path is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"profile_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.folded")
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def top_functions(self, n=15, project_only=True):
+        """
+        Returns the n functions on the stack in the largest share of samples, as (name, share),
+        i.e. inclusive time, which is what we want for methods that wait, like place_spot_limit_order.
+
+        :param project_only: bool, only rank functions of this repository, not the SDK or stdlib.
+        """
+        inclusive = Counter()
+        total = sum(self.samples.values())
+        for stack, count in self.samples.items():
+            # A recursive function counts once per sample; the first frame is the thread name
+            for name in set(stack.split(";")[1:]):
+                if not project_only or name in self.project_labels:
+                    inclusive[name] += count
+        return [(name, count / total) for name, count in inclusive.most_common(n)] if total else []
+
+    def dump_threads(self):
+        """Writes and logs the current stack of every thread. Returns the file path."""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        lines = [f"Thread dump at {datetime.now().isoformat()}"]
+        for thread_id, frame in sys._current_frames().items():
+            lines.append(f"\n--- {names.get(thread_id, thread_id)} ({thread_id}) ---")
+            lines.extend(line.rstrip("\n") for line in traceback.format_stack(frame))
+        dump = "\n".join(lines)
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"threads_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.txt")
+        with open(path, "w") as f:
+            f.write(dump + "\n")
+        self.logger.info(f"{dump}\nThread dump written to {path}.")
+        return path
+
+    def status(self):
+        return {
+            "running": self.running,
+            "samples": self.sample_count,
+            "seconds": time.time() - self.started_at if self.running else 0.0,
+            "interval": self.interval
+        }
+
+    def install_signal_handlers(self):
+        """
+        SIGUSR1 starts or stops the profiler, SIGUSR2 dumps every thread's stack:
+            kill -USR1 <pid>
+        Must be called from the main thread. Returns False where the signals do not exist.
+        """
+        if not hasattr(signal, "SIGUSR1"):
+            return False
+        # The work happens on a new thread, since a signal handler interrupts whatever the main thread was doing
+        signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(target=self.toggle, daemon=True).start())
+        signal.signal(signal.SIGUSR2, lambda signum, frame: threading.Thread(target=self.dump_threads, daemon=True).start())
+        return True
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Starts a control socket on localhost, one command per line:
+            start, stop, dump, status
+        e.g. `echo dump | nc 127.0.0.1 <port>`. Returns the server, which runs on a daemon thread.
+        """
+        profiler = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    command = line.decode().strip()
+                    if command == "start":
+                        reply = "started" if profiler.start() else "already running"
+                    elif command == "stop":
+                        reply = profiler.stop() or "not running"
+                    elif command == "dump":
+                        reply = profiler.dump_threads()
+                    elif command == "status":
+                        reply = str(profiler.status())
+                    else:
+                        reply = "commands: start, stop, dump, status"
+                    self.wfile.write((reply + "\n").encode())
+
+        server = socketserver.ThreadingTCPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="profiler-control", daemon=True).start()
+        self.logger.info(f"Profiler control socket listening on {host}:{server.server_address[1]}.")
+        return server
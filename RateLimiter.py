@@ -0,0 +1,217 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class RateLimitShed(Exception):
+    """Raised when a low-priority call is dropped because the request budget is under pressure."""
+
+
+class RateLimitScheduler:
+    """
+    A client-side token bucket for HyperLiquid's weight-based REST budget
+    (1200 weight per minute per IP), shared by every thread of the strategy.
+
+    Callers wait in a priority queue: order actions first, then risk queries, then PnL
+    and notifications. Low-priority calls may only spend tokens above a reserve, so a
+    burst of monitoring never uses up the budget an exit needs. When they have waited
+    longer than max_delay seconds they are shed with RateLimitShed.
+    """
+    PRIORITY_ORDER = 0
+    PRIORITY_RISK = 1
+    PRIORITY_PNL = 2
+    PRIORITY_NOTIFY = 3
+
+    PRIORITY_NAMES = {0: "order", 1: "risk", 2: "pnl", 3: "notify"}
+
+    def __init__(self, capacity=1000, refill_per_minute=1000, low_priority_reserve=0.3, max_delay=30.0, clock=None):
+        """
+        :param capacity: float, the largest burst of weight the bucket allows.
+        :param refill_per_minute: float, the weight that becomes available every minute.
+        :param low_priority_reserve: float, fraction of capacity that PnL and notification calls may not use.
+        :param max_delay: float, seconds a low-priority call may wait before it is shed.
+        :param clock: object with time() and sleep(), to run on a simulated or replayed clock
+                      instead of time.monotonic.
+        """
+        self.capacity = capacity
+        self.refill_per_second = refill_per_minute / 60
+        self.reserve = capacity * low_priority_reserve
+        self.max_delay = max_delay
+        self.clock = clock
+        self.now = clock.time if clock is not None else time.monotonic
+
+        self.tokens = capacity
+        self.last_refill = self.now()
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.counter = itertools.count()
+        self.local = threading.local()
+
+        # Weight spent over the last minute, and counters for the utilization report
+        self.spent = deque()
+        self.spent_weight = 0
+        self.calls = {name: 0 for name in self.PRIORITY_NAMES.values()}
+        self.shed = {name: 0 for name in self.PRIORITY_NAMES.values()}
+        self.total_wait = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_per_second)
+        self.last_refill = now
+
+    def _floor(self, priority):
+        return self.reserve if priority >= self.PRIORITY_PNL else 0.0
+
+    def current_priority(self, default=PRIORITY_RISK):
+        """Returns the priority set for this thread by priority(), or default."""
+        return getattr(self.local, "priority", default)
+
+    @contextmanager
+    def priority(self, priority):
+        """Runs every call made by this thread inside the block at the given priority."""
+        previous = getattr(self.local, "priority", None)
+        self.local.priority = priority
+        try:
+            yield
+        finally:
+            if previous is None:
+                del self.local.priority
+            else:
+                self.local.priority = previous
+
+    def acquire(self, weight, priority):
+        """
+        Blocks until weight tokens are available to a caller of this priority.
+        Raises RateLimitShed if a low-priority caller waited longer than max_delay.
+        """
+        # A call heavier than the whole bucket could never run; let it drain the bucket instead
+        weight = min(weight, self.capacity - self._floor(priority))
+        start = self.now()
+        deadline = start + self.max_delay if priority >= self.PRIORITY_PNL else None
+        entry = (priority, next(self.counter))
+        name = self.PRIORITY_NAMES.get(priority, str(priority))
+
+        with self.condition:
+            heapq.heappush(self.waiting, entry)
+            try:
+                while True:
+                    now = self.now()
+                    self._refill(now)
+                    available = self.tokens - self._floor(priority)
+                    if self.waiting[0] == entry and available >= weight:
+                        heapq.heappop(self.waiting)
+                        self.tokens -= weight
+                        self._record(now, weight, name, now - start)
+                        self.condition.notify_all()
+                        return
+                    if deadline is not None and now >= deadline:
+                        self.shed[name] += 1
+                        raise RateLimitShed(f"Dropped a {name} call after waiting {now - start:.1f}s for request weight.")
+
+                    wait = max((weight - available) / self.refill_per_second, 0.01)
+                    if deadline is not None:
+                        wait = min(wait, deadline - now)
+                    if self.clock is None:
+                        self.condition.wait(wait)
+                    else:
+                        # A simulated clock only moves when slept on; let other callers in meanwhile
+                        self.condition.release()
+                        try:
+                            self.clock.sleep(wait)
+                        finally:
+                            self.condition.acquire()
+            finally:
+                if entry in self.waiting:
+                    self.waiting.remove(entry)
+                    heapq.heapify(self.waiting)
+                    self.condition.notify_all()
+
+    def _record(self, now, weight, name, waited):
+        self.spent.append((now, weight))
+        self.spent_weight += weight
+        while self.spent and now - self.spent[0][0] > 60:
+            self.spent_weight -= self.spent.popleft()[1]
+        self.calls[name] += 1
+        self.total_wait += waited
+
+    def utilization(self):
+        """
+        Returns a dict describing the budget: weight spent in the last minute as a fraction
+        of the per-minute refill, tokens left, queue depth, and calls and sheds per priority.
+        """
+        with self.condition:
+            now = self.now()
+            self._refill(now)
+            while self.spent and now - self.spent[0][0] > 60:
+                self.spent_weight -= self.spent.popleft()[1]
+            calls = sum(self.calls.values())
+            return {
+                "weight_last_minute": self.spent_weight,
+                "utilization": self.spent_weight / (self.refill_per_second * 60),
+                "tokens": self.tokens,
+                "queued": len(self.waiting),
+                "calls": dict(self.calls),
+                "shed": dict(self.shed),
+                "avg_wait": self.total_wait / calls if calls else 0.0
+            }
+
+
+class ScheduledClient:
+    """
+    Wraps an Info or Exchange instance so that every public method call first acquires
+    its request weight from a RateLimitScheduler. Attributes are passed through untouched.
+    """
+    # Weights from HyperLiquid's rate limit docs. Other info requests weigh 20.
+    INFO_WEIGHTS = {
+        "l2_snapshot": 2,
+        "all_mids": 2,
+        "user_state": 2,
+        "spot_user_state": 2,
+        "query_order_by_oid": 2,
+        "query_order_by_cloid": 2
+    }
+    INFO_DEFAULT_WEIGHT = 20
+    EXCHANGE_DEFAULT_WEIGHT = 1
+    # Info methods answered from the metadata it loaded at construction, without a request
+    UNWEIGHTED = ("name_to_asset",)
+
+    def __init__(self, client, scheduler, weights=None, default_weight=INFO_DEFAULT_WEIGHT, priority=None):
+        """
+        :param client: the Info or Exchange instance to wrap.
+        :param scheduler: RateLimitScheduler, shared by all wrapped clients.
+        :param weights: dict, method name to request weight.
+        :param default_weight: int, the weight of methods not in weights.
+        :param priority: int, a fixed priority for every call. If None, the calling thread's priority is used.
+        """
+        self.client = client
+        self.scheduler = scheduler
+        self.weights = weights or {}
+        self.default_weight = default_weight
+        self.fixed_priority = priority
+
+    @classmethod
+    def for_info(cls, info, scheduler, priority=None):
+        return cls(info, scheduler, weights=cls.INFO_WEIGHTS, default_weight=cls.INFO_DEFAULT_WEIGHT, priority=priority)
+
+    @classmethod
+    def for_exchange(cls, exchange, scheduler):
+        return cls(exchange, scheduler, default_weight=cls.EXCHANGE_DEFAULT_WEIGHT,
+                   priority=RateLimitScheduler.PRIORITY_ORDER)
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if name.startswith("_") or not callable(attr) or name in self.UNWEIGHTED:
+            return attr
+
+        weight = self.weights.get(name, self.default_weight)
+
+        def call(*args, **kwargs):
+            priority = self.fixed_priority
+            if priority is None:
+                priority = self.scheduler.current_priority()
+            self.scheduler.acquire(weight, priority)
+            return attr(*args, **kwargs)
+
+        return call
@@ -0,0 +1,179 @@
+import random
+import threading
+import time
+
+import requests
+from hyperliquid.utils.error import ClientError, ServerError
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an endpoint whose circuit breaker is open."""
+
+
+def is_transient(error):
+    """
+    True for errors worth retrying: connection problems, timeouts, 5xx responses and 429s.
+    Other 4xx responses mean the request itself is wrong, so retrying would not help.
+    """
+    if isinstance(error, ServerError):
+        return True
+    if isinstance(error, ClientError):
+        return error.status_code == 429
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter."""
+    def __init__(self, max_attempts=4, base_delay=0.25, max_delay=5.0):
+        """
+        :param max_attempts: int, total attempts including the first one.
+        :param base_delay: float, the backoff ceiling in seconds after the first failure.
+        :param max_delay: float, the largest backoff ceiling in seconds.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        """Returns the jittered delay in seconds after the given (0-based) failed attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive transient failures, rejects calls for
+    reset_timeout seconds, then lets a single trial call through (half-open).
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=None):
+        """
+        :param clock: object with time(), time.monotonic unless simulating or replaying.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.now = clock.time if clock is not None else time.monotonic
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.now() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self, endpoint):
+        with self.lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self.trial_running):
+                raise CircuitOpen(f"Circuit for {endpoint} is open after {self.failures} consecutive failures.")
+            if state == "half-open":
+                self.trial_running = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = self.now()
+
+    def release(self):
+        """Ends a trial call that told nothing about the endpoint, so the next call is a trial again."""
+        with self.lock:
+            self.trial_running = False
+
+
+class ResilientClient:
+    """
+    Wraps an Info or Exchange instance with retries, jittered backoff and a circuit breaker
+    per endpoint (method name).
+
+    Info calls only read, so every transient failure is retried. Exchange calls are retried
+    only when they are idempotent: order placement carrying a client order id (cloid), where
+    resolve_order(cloid) tells us whether a previous attempt reached the exchange after all.
+    Transfers and other actions are never retried.
+    """
+    # Exchange methods that accept a cloid keyword
+    CLOID_METHODS = ("order", "market_open", "market_close")
+
+    def __init__(self, client, retry_policy=None, failure_threshold=5, reset_timeout=30.0,
+                 read_only=True, resolve_order=None, clock=None, logger=None):
+        """
+        :param client: the Info or Exchange instance to wrap.
+        :param retry_policy: RetryPolicy, defaults to RetryPolicy().
+        :param failure_threshold: int, consecutive failures that open an endpoint's breaker.
+        :param reset_timeout: float, seconds an open breaker waits before a trial call.
+        :param read_only: bool, True for Info, whose calls are always safe to retry.
+        :param resolve_order: function(cloid) returning the order response of an order already
+                              on the exchange, or None if the exchange never received it.
+        :param clock: object with time() and sleep(), for the backoff and the breakers; the time
+                      module (and time.monotonic for the breakers) unless simulating or replaying.
+        :param logger: logging.Logger used to report retries.
+        """
+        self.client = client
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.read_only = read_only
+        self.resolve_order = resolve_order
+        self.clock = clock
+        self.logger = logger
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def breaker(self, endpoint):
+        with self.lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout, self.clock)
+            return self.breakers[endpoint]
+
+    def _retryable(self, name, kwargs):
+        if self.read_only:
+            return True
+        return name in self.CLOID_METHODS and kwargs.get("cloid") is not None and self.resolve_order is not None
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            breaker = self.breaker(name)
+            retryable = self._retryable(name, kwargs)
+            attempt = 0
+            while True:
+                breaker.before_call(name)
+                try:
+                    # A retried order may have reached the exchange before the error; never place it twice.
+                    if attempt > 0 and not self.read_only:
+                        response = self.resolve_order(kwargs["cloid"])
+                        if response is not None:
+                            breaker.record_success()
+                            return response
+                    result = attr(*args, **kwargs)
+                    breaker.record_success()
+                    return result
+                except Exception as e:
+                    if not is_transient(e):
+                        # E.g. a rejected request or a shed call: no verdict on the endpoint, but a
+                        # half-open trial must not stay running or the circuit never closes again
+                        breaker.release()
+                        raise
+                    breaker.record_failure()
+                    attempt += 1
+                    if not retryable or attempt >= self.retry_policy.max_attempts:
+                        raise
+                    delay = self.retry_policy.delay(attempt - 1)
+                    if self.logger:
+                        self.logger.info(f"{name} failed ({e}), retry {attempt} in {delay:.2f}s.")
+                    (self.clock or time).sleep(delay)
+
+        return call
@@ -0,0 +1,194 @@
+import threading
+from collections import deque
+
+
+class RiskEngine:
+    """
+    RiskEngine checks the liquidation distance and the margin ratio of one perp position on
+    every mark price, at the cost of a single comparison.
+
+    refresh() takes a user_state and turns each band into the mark price at which it is
+    crossed: the nearer of the price at the band's liquidation distance and the price at
+    which maintenance margin / account value reaches the band's ratio. check(mark) then only
+    compares the mark with those prices. Call refresh() again after every trade or transfer.
+
+    Bands, from mild to severe:
+        warn      log and notify
+        transfer  move spot USDC to perp margin
+        reduce    buy back part of the short and sell the matching spot
+    """
+    BANDS = ("warn", "transfer", "reduce")
+
+    def __init__(self, coin, liq_distances=(0.2, 0.12, 0.06), margin_ratios=(0.5, 0.65, 0.8),
+                 reduce_fraction=0.25, cooldown=30.0, history=100):
+        """
+        :param coin: str, the perp name.
+        :param liq_distances: tuple, the warn, transfer and reduce bands as the distance of the
+                              mark from the liquidation price, relative to the mark.
+        :param margin_ratios: tuple, the same bands as maintenance margin / account value.
+        :param reduce_fraction: float, the share of the position the reduce band closes.
+        :param cooldown: float, seconds before a band that is still crossed triggers again.
+        :param history: int, the number of risk events kept for inspection.
+        """
+        self.coin = coin
+        self.liq_distances = dict(zip(self.BANDS, liq_distances))
+        self.margin_ratios = dict(zip(self.BANDS, margin_ratios))
+        self.reduce_fraction = reduce_fraction
+        self.cooldown = cooldown
+        self.events = deque(maxlen=history)
+        # The position is refreshed and events are recorded by the trading threads while the status
+        # server reads them; reentrant, since refresh() clears under it
+        self.lock = threading.RLock()
+        self.clear()
+
+    @staticmethod
+    def find_position(user_state, coin):
+        """Returns the position of coin in info.user_state(), or None."""
+        for item in user_state.get("assetPositions", []):
+            position = item.get("position", {})
+            if position.get("coin") == coin:
+                return position
+        return None
+
+    def clear(self):
+        """Forgets the position, e.g. after closing it. check() is a no-op until the next refresh()."""
+        with self.lock:
+            self.szi = 0.0
+            self.account_value = None
+            self.maintenance_margin = None
+            self.reference_px = None
+            self.liquidation_px = None
+            self.thresholds = []
+            self.first_threshold = None
+            self.active_band = None
+            self.last_triggered = {}
+
+    def refresh(self, user_state, mark_price):
+        """
+        Precomputes the band thresholds from one user_state.
+
+        :param user_state: dict, info.user_state(address).
+        :param mark_price: float, the mark price the user_state was taken at.
+        """
+        with self.lock:
+            position = self.find_position(user_state, self.coin)
+            if position is None or float(position["szi"]) == 0:
+                self.clear()
+                return
+
+            self.szi = float(position["szi"])
+            self.account_value = float(user_state["crossMarginSummary"]["accountValue"])
+            self.maintenance_margin = float(user_state["crossMaintenanceMarginUsed"])
+            self.reference_px = mark_price
+            self.liquidation_px = float(position["liquidationPx"]) if position.get("liquidationPx") else None
+
+            # Most severe first, so check() returns the worst band crossed. Built aside and swapped in
+            # whole, so check() on another thread never sees a list being filled.
+            thresholds = []
+            for band in reversed(self.BANDS):
+                prices = [px for px in (self._liq_distance_px(band), self._margin_ratio_px(band)) if px is not None]
+                if prices:
+                    thresholds.append((band, min(prices) if self.szi < 0 else max(prices)))
+            self.thresholds = thresholds
+            # A short is at risk when the mark rises, a long when it falls; the mild band is crossed first
+            self.first_threshold = self.thresholds[-1][1] if self.thresholds else None
+            self.active_band = None
+
+    def _liq_distance_px(self, band):
+        if self.liquidation_px is None:
+            return None
+        distance = self.liq_distances[band]
+        if self.szi < 0:
+            return self.liquidation_px / (1 + distance)
+        return self.liquidation_px / (1 - distance)
+
+    def _margin_ratio_px(self, band):
+        # Account value moves by szi per unit of mark, maintenance margin scales with the mark:
+        # ratio(m) = mm * m / m0 / (av + szi * (m - m0)); solve ratio(m) = r for m.
+        ratio = self.margin_ratios[band]
+        m0 = self.reference_px
+        denominator = self.maintenance_margin / m0 - ratio * self.szi
+        if denominator <= 0:
+            return None
+        px = ratio * (self.account_value - self.szi * m0) / denominator
+        return px if px > 0 else None
+
+    def _crossed(self, mark, threshold):
+        return mark >= threshold if self.szi < 0 else mark <= threshold
+
+    def margin_ratio(self, mark):
+        """The maintenance margin / account value estimated at mark."""
+        account_value = self.account_value + self.szi * (mark - self.reference_px)
+        if account_value <= 0:
+            return float("inf")
+        return self.maintenance_margin * mark / self.reference_px / account_value
+
+    def transfer_amount(self, mark):
+        """The USDC that brings the margin ratio at mark back to the warn band."""
+        maintenance_margin = self.maintenance_margin * mark / self.reference_px
+        account_value = self.account_value + self.szi * (mark - self.reference_px)
+        return max(maintenance_margin / self.margin_ratios["warn"] - account_value, 0.0)
+
+    def band_at(self, mark):
+        """Returns the most severe band crossed at mark, or None."""
+        if self.first_threshold is None or not self._crossed(mark, self.first_threshold):
+            return None
+        for band, threshold in self.thresholds:
+            if self._crossed(mark, threshold):
+                return band
+        return None
+
+    def check(self, mark, timestamp):
+        """
+        Checks one mark price.
+        Returns a risk event for the worst band crossed, unless that band already triggered within
+        the cooldown; otherwise None.
+
+        :param mark: float, the latest mark price.
+        :param timestamp: float, when the mark was received, in seconds.
+        """
+        band = self.band_at(mark)
+        if band is None:
+            self.active_band = None
+            return None
+
+        # Each band triggers at most once per cooldown, so a worse band still triggers at once
+        last = self.last_triggered.get(band)
+        if last is not None and timestamp - last < self.cooldown:
+            return None
+
+        self.active_band = band
+        self.last_triggered[band] = timestamp
+        return {
+            "band": band,
+            "mark": mark,
+            "detected_at": timestamp,
+            "liquidation_px": self.liquidation_px,
+            "margin_ratio": self.margin_ratio(mark),
+            "transfer_amount": self.transfer_amount(mark),
+            "reduce_size": abs(self.szi) * self.reduce_fraction
+        }
+
+    def record(self, event, action, completed_at):
+        """Stores a handled event with its detection-to-action latency in seconds."""
+        event = dict(event, action=action, latency=completed_at - event["detected_at"])
+        with self.lock:
+            self.events.append(event)
+        return event
+
+    def snapshot(self):
+        """
+        The margin figures, band thresholds and recent events, copied under the lock so that
+        another thread reads them from one refresh(). Without a position the figures are None.
+        """
+        with self.lock:
+            margin = dict.fromkeys(("account_value", "maintenance_margin", "headroom", "margin_ratio",
+                                    "liquidation_px", "reference_px"))
+            if self.account_value is not None:
+                margin.update(account_value=self.account_value,
+                              maintenance_margin=self.maintenance_margin,
+                              headroom=self.account_value - self.maintenance_margin,
+                              margin_ratio=self.margin_ratio(self.reference_px),
+                              liquidation_px=self.liquidation_px,
+                              reference_px=self.reference_px)
+            return {"margin": margin, "thresholds": dict(self.thresholds), "events": list(self.events)}
@@ -0,0 +1,88 @@
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StatusServer:
+    """
+    StatusServer serves the strategy's in-process state as JSON over HTTP on localhost:
+
+        curl 127.0.0.1:<port>/status      everything
+        curl 127.0.0.1:<port>/pnl         one section of it, e.g. pnl, risk, legs, orders
+
+    The state is read from what the trading threads already keep, never from the exchange,
+    so any number of clients cost no requests. The snapshot is built at most once every
+    max_age seconds whatever the number of clients, without taking the trading lock, and
+    every request is answered on the server's own daemon threads.
+    """
+    def __init__(self, snapshot, max_age=1.0, logger=None):
+        """
+        :param snapshot: callable returning a JSON-serializable dict of sections.
+        :param max_age: float, seconds a built snapshot is served before it is built again.
+        :param logger: logging.Logger to report to.
+        """
+        self.snapshot = snapshot
+        self.max_age = max_age
+        self.logger = logger or logging.getLogger(__name__)
+        self.cached = None
+        self.cached_body = None
+        self.built_at = None
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = None
+
+    def current(self):
+        """Returns (snapshot, body), rebuilding them if the cached ones are older than max_age."""
+        with self.lock:
+            self.requests += 1
+            now = time.monotonic()
+            if self.built_at is None or now - self.built_at >= self.max_age:
+                self.cached = self.snapshot()
+                self.cached_body = json.dumps(self.cached, default=str).encode()
+                self.built_at = now
+            return self.cached, self.cached_body
+
+    def respond(self, path):
+        """Returns (HTTP status, body) for a GET of path."""
+        section = path.split("?", 1)[0].strip("/")
+        try:
+            snapshot, body = self.current()
+        except Exception as e:
+            self.logger.error(f"Status snapshot failed: {e}")
+            return 500, json.dumps({"error": str(e)}).encode()
+        if section in ("", "status"):
+            return 200, body
+        if section not in snapshot:
+            return 404, json.dumps({"error": f"No section '{section}'", "sections": list(snapshot)}).encode()
+        return 200, json.dumps(snapshot[section], default=str).encode()
+
+    def serve(self, port, host="127.0.0.1"):
+        """Starts serving on a daemon thread. Port 0 picks a free port. Returns the server."""
+        status_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                code, body = status_server.respond(self.path)
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Dashboards poll constantly; keep them out of the strategy log
+                status_server.logger.debug(f"Status request from {self.address_string()}: {format % args}")
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="status-server", daemon=True).start()
+        self.logger.info(f"Status server listening on http://{host}:{self.server.server_address[1]}/status.")
+        return self.server
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,161 @@
+import math
+import threading
+import time
+
+import numpy as np
+
+
+class StressEngine:
+    """
+    StressEngine estimates the probability that the perp position is liquidated over the
+    next funding intervals by simulating many price paths at once with numpy, and finds the
+    rebalance that keeps that probability under a target.
+
+    Along a path the account value is
+        av + szi * (P_t - mark) + funding received up to t
+    and maintenance margin scales with the price, mm * P_t / mark, as in RiskEngine. Every
+    term but av is proportional to the position, so a path liquidates iff
+        (1 - f) * K > av + T,   K = max over t of (mm * P_t / mark - szi * (P_t - mark) - funding)
+    for a transfer T of USDC to perp margin and a reduction of the position by a fraction f.
+    K is computed once per path and sorted, after which the probability of any rebalance,
+    and the smallest one that meets the target, is a binary search over the sorted K.
+
+    Prices follow a driftless log-random walk with Student-t steps, whose fat tails matter
+    for liquidation, at a volatility estimated online from the marks we already see.
+    """
+    def __init__(self, paths=20000, horizon_hours=8, steps_per_hour=4, target_probability=0.01,
+                 default_volatility=0.015, half_life=6 * 3600, min_history=3600, tail_df=4.0, seed=None):
+        """
+        :param paths: int, the number of simulated price paths.
+        :param horizon_hours: int, the number of hourly funding intervals to look ahead.
+        :param steps_per_hour: int, price steps per hour, at which liquidation is checked.
+        :param target_probability: float, the liquidation probability a rebalance must get under.
+        :param default_volatility: float, hourly volatility of the log price until enough marks are seen.
+        :param half_life: float, seconds, half-life of the online variance estimate.
+        :param min_history: float, seconds of marks needed before the estimate replaces the default.
+        :param tail_df: float, degrees of freedom of the Student-t steps, None for normal steps.
+        :param seed: int, seeds the random generator, for reproducible runs.
+        """
+        self.paths = paths
+        self.horizon_hours = horizon_hours
+        self.steps_per_hour = steps_per_hour
+        self.target_probability = target_probability
+        self.default_volatility = default_volatility
+        self.half_life = half_life
+        self.min_history = min_history
+        self.tail_df = tail_df
+        self.rng = np.random.default_rng(seed)
+
+        self.last_price = None
+        self.last_timestamp = None
+        self.history = 0.0
+        self.variance_rate = None   # of the log price, per hour
+        # Marks are observed on the risk thread, the volatility is read on the account thread
+        self.lock = threading.Lock()
+
+    def observe(self, price, timestamp):
+        """
+        Updates the volatility estimate with one mark price. Cheap enough for every mark.
+        Feed it from one price source: the spread between two, e.g. mids and marks, reads as volatility.
+        """
+        with self.lock:
+            if self.last_price is not None and timestamp > self.last_timestamp and price > 0:
+                dt = timestamp - self.last_timestamp
+                sample = math.log(price / self.last_price) ** 2 / (dt / 3600)
+                # Irregular sampling: a longer gap carries more weight
+                alpha = 1.0 - math.exp(-math.log(2) * dt / self.half_life)
+                if self.variance_rate is None:
+                    self.variance_rate = sample
+                else:
+                    self.variance_rate += alpha * (sample - self.variance_rate)
+                self.history += dt
+            if price > 0:
+                self.last_price = price
+                self.last_timestamp = timestamp
+
+    @property
+    def volatility(self):
+        """Hourly volatility of the log price, the default until min_history seconds of marks are seen."""
+        with self.lock:
+            if self.variance_rate is None or self.history < self.min_history:
+                return self.default_volatility
+            return math.sqrt(self.variance_rate)
+
+    def simulate(self, mark, volatility):
+        """Returns simulated prices of shape (paths, horizon_hours * steps_per_hour), excluding mark."""
+        steps = self.horizon_hours * self.steps_per_hour
+        step_volatility = volatility / math.sqrt(self.steps_per_hour)
+        if self.tail_df:
+            # Scaled to unit variance, so volatility keeps its meaning
+            shocks = self.rng.standard_t(self.tail_df, size=(self.paths, steps))
+            shocks *= math.sqrt((self.tail_df - 2) / self.tail_df)
+        else:
+            shocks = self.rng.standard_normal((self.paths, steps))
+        log_returns = shocks * step_volatility - 0.5 * step_volatility ** 2
+        return mark * np.exp(np.cumsum(log_returns, axis=1))
+
+    def exposure(self, prices, szi, maintenance_margin, mark, funding_rate=0.0):
+        """
+        Returns K of every path, sorted: the account value below which the path liquidates.
+
+        :param funding_rate: float, the hourly funding rate, received by a short when positive.
+        """
+        funding = np.zeros_like(prices)
+        # Funding is paid on the hour, on the notional at that moment
+        funding[:, self.steps_per_hour - 1::self.steps_per_hour] = -szi * funding_rate
+        funding = np.cumsum(funding * prices, axis=1)
+        required = maintenance_margin / mark * prices - szi * (prices - mark) - funding
+        return np.sort(required.max(axis=1))
+
+    @staticmethod
+    def probability(sorted_exposure, account_value):
+        """The share of paths whose exposure exceeds account_value, i.e. that liquidate."""
+        survived = np.searchsorted(sorted_exposure, account_value, side="right")
+        return float(len(sorted_exposure) - survived) / len(sorted_exposure)
+
+    def run(self, szi, account_value, maintenance_margin, mark, funding_rate=0.0, spot_usdc=0.0, volatility=None):
+        """
+        Stresses one position.
+
+        :param szi: float, signed perp size, negative for our short.
+        :param account_value: float, perp account value in USDC.
+        :param maintenance_margin: float, cross maintenance margin used in USDC.
+        :param mark: float, the current mark price.
+        :param funding_rate: float, the expected hourly funding rate over the horizon.
+        :param spot_usdc: float, USDC on spot that can be moved to perp margin.
+        :param volatility: float, hourly volatility, defaults to the online estimate.
+        :return: dict with
+            liquidation_probability  over the horizon, as things are
+            required_transfer        USDC to move to perp margin to reach the target, 0 if within it
+            transfer                 what of it spot can cover
+            reduce_fraction          share of the position to close, after the transfer, if spot cannot cover it
+            probability_after        liquidation probability after the transfer and the reduction
+        """
+        start = time.perf_counter()
+        volatility = self.volatility if volatility is None else volatility
+        prices = self.simulate(mark, volatility)
+        exposure = self.exposure(prices, szi, maintenance_margin, mark, funding_rate)
+
+        # The exposure that exactly the target share of paths exceeds
+        allowed = int(self.target_probability * self.paths)
+        threshold = exposure[self.paths - allowed - 1] if allowed < self.paths else -np.inf
+        required_transfer = max(float(threshold) - account_value, 0.0)
+        transfer = min(required_transfer, max(float(spot_usdc), 0.0))
+        reduce_fraction = 0.0
+        if transfer < required_transfer:
+            reduce_fraction = min(max(1.0 - (account_value + transfer) / float(threshold), 0.0), 1.0)
+        remaining = 1.0 - reduce_fraction
+        probability_after = self.probability(exposure * remaining, account_value + transfer) if remaining > 0 else 0.0
+
+        return {
+            "liquidation_probability": self.probability(exposure, account_value),
+            "required_transfer": required_transfer,
+            "transfer": transfer,
+            "reduce_fraction": reduce_fraction,
+            "probability_after": probability_after,
+            "target_probability": self.target_probability,
+            "volatility": volatility,
+            "horizon_hours": self.horizon_hours,
+            "paths": self.paths,
+            "seconds": time.perf_counter() - start
+        }
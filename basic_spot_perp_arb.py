@@ -1,11 +1,29 @@
 from hyperliquid.utils import constants
 import logging
+import os
 import time
 import threading
 from datetime import datetime
 
-from example_utils import setup, setup_telegram
+from example_utils import setup, setup_fees, setup_telegram, setup_section
+from Cassette import Cassette
+from FillModel import FillModel
+from FreshnessGuard import FreshnessClient, FreshnessGuard
+from FundingLedger import FundingLedger
+from FundingPredictor import FundingPredictor
+from BasisMonitor import BasisMonitor
+from CapitalAllocator import CapitalAllocator
+from HedgeMonitor import HedgeMonitor
+from RateLimiter import RateLimitScheduler, RateLimitShed, ScheduledClient
+from Resilience import ResilientClient, RetryPolicy
+from Payloads import AssetContexts, L2Book, SpotState
 from PnlCalculator import PnLCalculator
+from PnlTimeSeries import PnlEngine
+from OrderManager import OrderManager
+from Profiler import SamplingProfiler
+from RiskEngine import RiskEngine
+from StatusServer import StatusServer
+from StressEngine import StressEngine
 from TelegramNotifier import TelegramNotifier
 
 class HypeSpotPerpArbitrage:
@@ -15,11 +33,121 @@ class HypeSpotPerpArbitrage:
     In the next version, we hope to open short and close short as a maker as well.
     Using maker fee wll earn us more profit more quickly.
 
-    We check funding_rate every 15 minutes and check account_value every 5 minutes.
+    We sample the asset context every minute to predict the next funding print,
+    check account_value every 5 minutes, and check liquidation risk on every mark price.
     """
-    def __init__(self, coin):
-        self.wallet, self.info, self.exchange = setup(constants.MAINNET_API_URL, skip_ws=True)
-        
+    def __init__(self, coin, info=None, exchange=None, address=None, clock=time, notify=True, resilient=False):
+        """
+        :param coin: str, the coin we hold on spot and short on perp.
+        :param info, exchange, address: clients and account to trade with instead of the ones
+                                        from config.json, e.g. a PaperMarket. They are used as given,
+                                        without rate limiting or retries, unless resilient.
+        :param clock: object with time() and sleep(), the time module unless simulating.
+        :param notify: bool, whether to send Telegram notifications.
+        :param resilient: bool, wrap injected clients in the rate limiting and retries of a live run,
+                          on clock, e.g. to replay a recorded live session call for call.
+        """
+        self.clock = clock
+        self.cassette = None
+        if info is None:
+            self.wallet, info, exchange = setup(constants.MAINNET_API_URL, skip_ws=True)
+            sdk_exchange = exchange
+            wrap_clients = True
+
+            # Record every request and response, so `python cli.py replay` can re-run this session offline
+            cassette_config = setup_section("cassette", {
+                "record": False,
+                "dir": "cassettes"
+            })
+            if cassette_config["record"]:
+                self.cassette = Cassette(os.path.join(cassette_config["dir"],
+                                                      f"cassette_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.jsonl"))
+                self.cassette.start_session(address=self.wallet, coin=coin)
+                info = self.cassette.wrap(info, "info")
+                exchange = self.cassette.wrap(exchange, "exchange")
+        else:
+            self.wallet = address
+            wrap_clients = False
+
+        # Every Info and Exchange call goes through one weight budget, with order actions first
+        rate_config = setup_section("rate_limit", {
+            "capacity": 1000,
+            "refill_per_minute": 1000,
+            "low_priority_reserve": 0.3,
+            "max_delay": 30
+        })
+        self.scheduler = RateLimitScheduler(capacity=rate_config["capacity"],
+                                            refill_per_minute=rate_config["refill_per_minute"],
+                                            low_priority_reserve=rate_config["low_priority_reserve"],
+                                            max_delay=rate_config["max_delay"],
+                                            clock=None if clock is time else clock)
+        if wrap_clients:
+            # market_open and market_close read mids and user state through the SDK's own Info;
+            # they are part of the order flow, so they spend the order reserve too
+            sdk_exchange.info = ScheduledClient.for_info(sdk_exchange.info, self.scheduler,
+                                                         priority=RateLimitScheduler.PRIORITY_ORDER)
+
+        # Retry transient failures per call instead of abandoning the whole loop body
+        resilience_config = setup_section("resilience", {
+            "max_attempts": 4,
+            "base_delay": 0.25,
+            "max_delay": 5.0,
+            "failure_threshold": 5,
+            "reset_timeout": 30,
+            "loop_max_delay": 60
+        })
+        retry_policy = RetryPolicy(max_attempts=resilience_config["max_attempts"],
+                                   base_delay=resilience_config["base_delay"],
+                                   max_delay=resilience_config["max_delay"])
+        # Backoff of the monitoring loops after an error escapes the per-call retries
+        self.loop_retry_policy = RetryPolicy(base_delay=1.0, max_delay=resilience_config["loop_max_delay"])
+        if wrap_clients or resilient:
+            self.info = ResilientClient(ScheduledClient.for_info(info, self.scheduler),
+                                        retry_policy=retry_policy,
+                                        failure_threshold=resilience_config["failure_threshold"],
+                                        reset_timeout=resilience_config["reset_timeout"],
+                                        clock=self.clock,
+                                        logger=logging.getLogger(__name__))
+            self.exchange = ResilientClient(ScheduledClient.for_exchange(exchange, self.scheduler),
+                                            retry_policy=retry_policy,
+                                            failure_threshold=resilience_config["failure_threshold"],
+                                            reset_timeout=resilience_config["reset_timeout"],
+                                            read_only=False,
+                                            resolve_order=self._resolve_order,
+                                            clock=self.clock,
+                                            logger=logging.getLogger(__name__))
+        else:
+            self.info = info
+            self.exchange = exchange
+
+        # Every market-data read records its age, and is fetched again or refused over its budget
+        freshness_config = setup_section("freshness", {
+            "budgets": {
+                "l2_snapshot": 2.0,
+                "all_mids": 2.0,
+                "meta_and_asset_ctxs": 5.0,
+                "user_state": 10.0,
+                "spot_user_state": 10.0
+            },
+            "default_budget": 5.0,
+            "refetches": 1,
+            "offset_window": 10.0,
+            "offset_drift": 0.001
+        })
+        self.freshness = FreshnessGuard(budgets=freshness_config["budgets"],
+                                        default_budget=freshness_config["default_budget"],
+                                        refetches=freshness_config["refetches"],
+                                        window_seconds=freshness_config["offset_window"],
+                                        max_drift=freshness_config["offset_drift"],
+                                        clock=self.clock,
+                                        logger=logging.getLogger(__name__))
+        self.info = FreshnessClient(self.info, self.freshness)
+
+        # The step an unfinished entry or exit stopped at, and the cloid of each step's order
+        self.entry_step = None
+        self.exit_step = None
+        self.step_cloids = {}
+
         self.coin = coin                  # This is for perp trading
         self.pair = self.coin + "/USDC"   # This is for spot trading
 
@@ -32,6 +160,22 @@ class HypeSpotPerpArbitrage:
         self.perp_order_result = None
         self.slippage = 0.01    # Used in place_perp_market_order
 
+        # Every order gets a cloid and is tracked, and persisted, by the order manager
+        orders_config = setup_section("orders", {
+            "path": "orders.jsonl",
+            "poll_interval": 2.0,
+            "cancel_timeout": 30.0
+        })
+        # Injected clients (paper trading) must not mix their orders into the live record
+        self.order_manager = OrderManager(self.info, self.exchange, self.wallet,
+                                          path=orders_config["path"] if wrap_clients else None,
+                                          clock=self.clock, logger=self.logger)
+        self.order_poll_interval = orders_config["poll_interval"]
+        self.order_cancel_timeout = orders_config["cancel_timeout"]
+        for record in self.order_manager.reconcile():
+            self.logger.info(f"Order {record.cloid} ({record.step or record.leg}) from a previous run is still open: "
+                             f"{'buy' if record.is_buy else 'sell'} {record.sz} {record.coin} @{record.limit_px}.")
+
         self.spot_sz_decimals = self._get_spot_sz_decimals()
         self.perp_sz_decimals = self._get_perp_sz_decimals()
 
@@ -41,14 +185,171 @@ class HypeSpotPerpArbitrage:
         self.perp_max_decimals = 6
         self.spot_max_decimals = 8
 
-        self.pnl_calculator = PnLCalculator()
+        self.pnl_calculator = PnLCalculator(info=self.info, address=self.wallet)
+
+        # Mark both legs on every book update from cached entry prices and sizes
+        self.pnl_engine = PnlEngine(self.pnl_calculator, self.coin)
+
+        # Check liquidation distance and margin ratio on every mark, and de-risk when a band is crossed
+        risk_config = setup_section("risk_engine", {
+            "poll_interval": 1.0,
+            "liq_distances": [0.2, 0.12, 0.06],
+            "margin_ratios": [0.5, 0.65, 0.8],
+            "reduce_fraction": 0.25,
+            "cooldown": 30
+        })
+        self.risk_engine = RiskEngine(self.coin,
+                                      liq_distances=risk_config["liq_distances"],
+                                      margin_ratios=risk_config["margin_ratios"],
+                                      reduce_fraction=risk_config["reduce_fraction"],
+                                      cooldown=risk_config["cooldown"])
+        self.risk_poll_interval = risk_config["poll_interval"]
+
+        # Monte Carlo liquidation probability over the next funding intervals, every account check
+        stress_config = setup_section("stress_engine", {
+            "paths": 20000,
+            "horizon_hours": 8,
+            "steps_per_hour": 4,
+            "target_probability": 0.01,
+            "default_volatility": 0.015,
+            "half_life": 21600,
+            "tail_df": 4.0,
+            "rebalance": True
+        })
+        self.stress_engine = StressEngine(paths=stress_config["paths"],
+                                          horizon_hours=stress_config["horizon_hours"],
+                                          steps_per_hour=stress_config["steps_per_hour"],
+                                          target_probability=stress_config["target_probability"],
+                                          default_volatility=stress_config["default_volatility"],
+                                          half_life=stress_config["half_life"],
+                                          tail_df=stress_config["tail_df"])
+        self.stress_rebalance = stress_config["rebalance"]
+        self.last_stress = None
 
-        telegram_bot_token, telegram_chat_id = setup_telegram()
-        # Initialize TelegramNotifier if bot_token and chat_id are provided
-        if telegram_bot_token and telegram_chat_id:
-            self.telegram_notifier = TelegramNotifier(telegram_bot_token, telegram_chat_id)
-        else:
-            self.telegram_notifier = None
+        if self.is_perp_open:
+            self.refresh_pnl_positions()
+
+        # Record the funding we are actually paid, and the fees, for funding-inclusive PnL
+        ledger_config = setup_section("funding_ledger", {
+            "path": "funding_ledger.jsonl",
+            "state_path": "funding_ledger_state.json",
+            "start_time": 0
+        })
+        self.funding_ledger = FundingLedger(self.info, self.wallet,
+                                            path=ledger_config["path"],
+                                            state_path=ledger_config["state_path"],
+                                            start_time=ledger_config["start_time"],
+                                            aliases={self._get_spot_pair_name(): self.coin})
+
+        # Predict the next funding print from premium samples instead of acting on the last one
+        funding_config = setup_section("funding_predictor", {
+            "sample_interval": 60,
+            "notify_interval": 15 * 60,
+            "z_score": 1.96,
+            "half_life": 300,
+            "min_samples": 10,
+            "entry_threshold": 0.0,
+            "exit_threshold": 0.0
+        })
+        self.funding_predictor = FundingPredictor(z_score=funding_config["z_score"],
+                                                  half_life_seconds=funding_config["half_life"],
+                                                  min_samples=funding_config["min_samples"])
+        self.funding_sample_interval = funding_config["sample_interval"]
+        self.funding_notify_interval = funding_config["notify_interval"]
+        self.entry_funding_threshold = funding_config["entry_threshold"]
+        self.exit_funding_threshold = funding_config["exit_threshold"]
+
+        # Wait for a favorable spot-perp basis before opening or unwinding
+        basis_config = setup_section("basis_monitor", {
+            "half_lives": [60, 900, 3600],
+            "reference_window": 900,
+            "entry_z": 0.5,
+            "exit_z": 0.5,
+            "max_wait": 10 * 60,
+            "poll_interval": 5,
+            "notional": 0.0
+        })
+        self.basis_monitor = BasisMonitor(half_lives=basis_config["half_lives"],
+                                          reference_window=basis_config["reference_window"])
+        self.basis_entry_z = basis_config["entry_z"]
+        self.basis_exit_z = basis_config["exit_z"]
+        self.basis_max_wait = basis_config["max_wait"]
+        self.basis_poll_interval = basis_config["poll_interval"]
+        self.basis_notional = basis_config["notional"]
+        self.allocation = None
+
+        # Size positions from carry, fees, impact and leverage, sharing capital across allocator_coins
+        taker_fee, maker_fee = setup_fees()
+        allocator_config = setup_section("capital_allocator", {
+            "coins": [],
+            "horizon_hours": 24 * 7,
+            "leverage": 1.0,
+            "max_share": 1.0,
+            "max_oi_share": 0.01,
+            "max_volume_share": 0.01,
+            "min_notional": 10.0
+        })
+        self.capital_allocator = CapitalAllocator(maker_fee, taker_fee,
+                                                  horizon_hours=allocator_config["horizon_hours"],
+                                                  leverage=allocator_config["leverage"],
+                                                  max_share=allocator_config["max_share"],
+                                                  max_oi_share=allocator_config["max_oi_share"],
+                                                  max_volume_share=allocator_config["max_volume_share"],
+                                                  min_notional=allocator_config["min_notional"])
+        self.allocator_coins = allocator_config["coins"]
+        self.allocation_plan = {}
+
+        # Keep the spot holding and the perp short matched after entry
+        hedge_config = setup_section("hedge_monitor", {
+            "band_usd": 10.0,
+            "min_order_usd": 10.0
+        })
+        self.hedge_monitor = HedgeMonitor(self.coin,
+                                          self.perp_sz_decimals[self.coin],
+                                          self.spot_sz_decimals[self.coin],
+                                          band_usd=hedge_config["band_usd"],
+                                          min_order_usd=hedge_config["min_order_usd"])
+
+        # Chooses the spot book level of our maker orders
+        fill_config = setup_section("fill_model", {
+            "horizon": 60,
+            "risk_aversion": 1.0,
+            "max_levels": 5,
+            "default_level": 1,
+            "half_life": 900,
+            "max_gap": 300,
+            "queue_share": 0.5,
+            "prior_orders": 5,
+            "state_path": "fill_model_state.json",
+            "cassettes": []
+        })
+        self.fill_model = FillModel(maker_fee, taker_fee,
+                                    horizon=fill_config["horizon"],
+                                    risk_aversion=fill_config["risk_aversion"],
+                                    max_levels=fill_config["max_levels"],
+                                    half_life=fill_config["half_life"],
+                                    max_gap=fill_config["max_gap"],
+                                    queue_share=fill_config["queue_share"],
+                                    prior_orders=fill_config["prior_orders"],
+                                    state_path=fill_config["state_path"] if wrap_clients else None)
+        for path in fill_config["cassettes"]:
+            self.fill_model.observe_cassette(path, self.pair)
+        # The level used until the model has seen enough of the book
+        self.default_spot_level = fill_config["default_level"]
+
+        # Held while opening, closing or topping up, so the monitoring threads never trade against each other
+        self.trade_lock = threading.RLock()
+
+        self.telegram_notifier = None
+        if notify:
+            telegram_bot_token, telegram_chat_id = setup_telegram()
+            # Initialize TelegramNotifier if bot_token and chat_id are provided
+            if telegram_bot_token and telegram_chat_id:
+                self.telegram_notifier = TelegramNotifier(telegram_bot_token, telegram_chat_id)
+
+        # The last margin check of check_account_value, served by the status server
+        self.last_account_check = None
+        self.status_server = None
 
         # The following two attributes are deprecated as is the function check_position_value
         self.initial_position_value = None
@@ -71,14 +372,48 @@ class HypeSpotPerpArbitrage:
 
     def calculate_and_log_total_pnl(self):
         # Calculate Pnl if positions are closed at the current market price
-        perp_pnl = self.calculate_and_log_perp_pnl()
-        spot_pnl = self.calculate_and_log_spot_pnl()
-        pnl = perp_pnl + spot_pnl
-        self.logger.info(f"Total PnL at market price: {pnl}\n")
+        # The streaming PnL is marked on every book update, so normally this costs no requests.
+        last = self.pnl_engine.last
+        if last is not None and self.clock.time() - last["timestamp"] <= 2 * self.funding_sample_interval:
+            self.logger.info(f"Perpetual PnL: {last['perp_pnl']}")
+            self.logger.info(f"Spot PnL: {last['spot_pnl']}")
+            pnl = last["total"]
+        else:
+            # PnL is the first thing we drop when the request budget is under pressure.
+            try:
+                with self.scheduler.priority(RateLimitScheduler.PRIORITY_PNL):
+                    perp_pnl = self.calculate_and_log_perp_pnl()
+                    spot_pnl = self.calculate_and_log_spot_pnl()
+            except RateLimitShed as e:
+                self.logger.info(f"Skipping PnL calculation: {e}")
+                return
+            pnl = perp_pnl + spot_pnl
+        self.logger.info(f"Total PnL at market price: {pnl}")
+        self.logger.info(f"Max drawdown: {self.pnl_engine.max_drawdown()}, intraday PnL: {self.pnl_engine.intraday_pnl()}")
+
+        # Funding received and fees paid since the position was opened
+        carry = None
+        if self.funding_ledger:
+            try:
+                with self.scheduler.priority(RateLimitScheduler.PRIORITY_PNL):
+                    self.funding_ledger.sync()
+            except RateLimitShed as e:
+                self.logger.info(f"Skipping funding ledger sync: {e}")
+            carry = self.funding_ledger.report(self.coin)
+            self.logger.info(f"Funding received: {carry['funding']}, fees paid: {carry['fees']}, "
+                             f"net carry: {carry['net_carry']} over {carry['funding_hours']} funding hours")
+            if carry["annualized_yield"] is not None:
+                self.logger.info(f"Annualized funding yield: {carry['annualized_yield']:.2%}, "
+                                 f"net of fees: {carry['net_annualized_yield']:.2%}")
+            self.logger.info(f"Total PnL including funding: {pnl + carry['net_carry']}\n")
 
         # Send Telegram notification if PnL exceeds the threshold
         if self.telegram_notifier:
             message = f"🚨 PnL Alert! Total PnL: ${pnl:.2f}"
+            if carry is not None:
+                message += f", including funding: ${pnl + carry['net_carry']:.2f}"
+                if carry["net_annualized_yield"] is not None:
+                    message += f", net yield: {carry['net_annualized_yield']:.2%}"
             self.telegram_notifier.send_message(message)
     
     def calculate_and_log_perp_pnl(self):
@@ -133,8 +468,8 @@ class HypeSpotPerpArbitrage:
         '''
         if self.is_perp_open:
             self.logger.info(f"Spot position open for {self.coin}.")
-        else:
-            return False
+            return True
+        return False
 
     # Function to get USDC(spot) and USDC(perp) balances
     def get_usdc_balances(self):
@@ -161,18 +496,11 @@ class HypeSpotPerpArbitrage:
         Get the balance of token_name.
         Returns a float representing the balance. If the token is not found, returns 0.0.
         """
-        data = self.info.spot_user_state(address=self.wallet)
-
-        for balance in data.get('balances', []):  # Use `.get()` to avoid KeyError
-            if balance.get('coin') == token_name:
-                try:
-                    return float(balance.get('total', 0.0))  # Default to 0.0 if 'total' is missing
-                except ValueError:
-                    self.logger.warning(f"Invalid balance format for {token_name}, returning 0.0.")
-                    return 0.0  # Return 0.0 on parsing failure
-        
-        self.logger.info(f"Balance for {token_name} not found, returning 0.0.")  # Log missing balance
-        return 0.0  # Return 0.0 if the token is not found
+        balance = SpotState(self.info.spot_user_state(address=self.wallet)).total(token_name, None)
+        if balance is None:
+            self.logger.info(f"Balance for {token_name} not found, returning 0.0.")  # Log missing balance
+            return 0.0  # Return 0.0 if the token is not found
+        return balance
     
     # Function to get withdrawable amount in USDC(perp)
     def get_withdrawable(self):
@@ -232,53 +560,34 @@ class HypeSpotPerpArbitrage:
             ]
         ]
         """
-        # Get asset context meta data
-        data = self.info.meta_and_asset_ctxs()
-
-        # Create a mapping of token names to funding rates
-        universe = data[0]['universe']
-        token_map = {token['name']: index for index, token in enumerate(universe)}
-
-        # Extract funding rates (second list in the data)
-        funding_data = data[1]
-        
-        # Check if token exists in the mapping
-        if token_name in token_map:
-            index = token_map[token_name]
-            if index < len(funding_data):
-                return float(funding_data[index]['funding'])
-            else:
-                return f"Funding data for {token_name} not found."
+        # Get asset context meta data, indexed by token name
+        contexts = AssetContexts(self.info.meta_and_asset_ctxs())
+        if token_name in contexts:
+            return contexts.value(token_name, 'funding')
         else:
             return f"Token {token_name} not found in universe."
 
+    # Function to get the asset context by token_name
+    def get_asset_ctx_by_token(self, token_name):
+        """
+        Get the asset context of token_name, i.e. its entry in info.meta_and_asset_ctxs()[1].
+        See get_funding_rate_by_token for a sample.
+        """
+        asset_ctx = AssetContexts(self.info.meta_and_asset_ctxs()).ctx(token_name)
+        if asset_ctx is None:
+            raise Exception(f"Token {token_name} not found in universe.")
+        return asset_ctx
+
     # Function to get mark price by token_name
     def get_markPx_by_token(self, token_name):
-        token_mark_price = self._get_token_markPx()
-        if token_name in token_mark_price:
-            return token_mark_price[token_name]
+        # Parse the one price we need rather than the whole universe's
+        mark_price = AssetContexts(self.info.meta_and_asset_ctxs()).value(token_name, 'markPx')
+        if mark_price is not None:
+            return mark_price
         else:
             self.logger.info(f"There is no mark price for {token_name}. We'll just return 0.0.")
             return 0.0
 
-    def _get_token_markPx(self):
-        """
-        Returns a dict,{token_name: mark_prie}
-        """
-        # Get meta and asset context info
-        data = self.info.meta_and_asset_ctxs() 
-
-        # Extract token names from the universe list
-        token_names = [item['name'] for item in data[0]['universe']]
-        
-        # Extract markPx values from the market data and map them to token names
-        token_mark_pxs = {}
-        for i, item in enumerate(data[1]):
-            if i < len(token_names):
-                token_mark_pxs[token_names[i]] = float(item.get('markPx'))
-        
-        return token_mark_pxs
-
     def _get_perp_sz_decimals(self):
         # Get the exchange's metadata and print it out
         meta = self.info.meta()
@@ -302,6 +611,15 @@ class HypeSpotPerpArbitrage:
         
         return spot_sz_decimals
 
+    def _get_spot_pair_name(self):
+        # Spot fills name the pair, e.g. '@107' for HYPE/USDC, rather than the token
+        meta = self.info.spot_meta()
+        token_index = {token["name"]: token["index"] for token in meta["tokens"]}
+        for pair in meta["universe"]:
+            if pair["tokens"] == [token_index.get(self.coin), token_index["USDC"]]:
+                return pair["name"]
+        return self.coin
+
     def _round_perp_px_sz(self, px, sz):
         # If you use these directly, the exchange will return an error, so we round them.
         # First we check if price is greater than 100k in which case we just need to round to an integer
@@ -339,45 +657,135 @@ class HypeSpotPerpArbitrage:
 
         return px, sz
 
-    def place_spot_limit_order(self, is_buy=True):
-            # Place limit order buy at the first ask price
-        if is_buy:
-            price = self._spot_bid_price_at_level(1)
-            size = self.allocation / price
+    def _step_cloid(self, step):
+        # One cloid per entry/exit step, kept until the step completes
+        if step not in self.step_cloids:
+            self.step_cloids[step] = self.order_manager.new_cloid()
+        return self.step_cloids[step]
+
+    @staticmethod
+    def _filled(result):
+        """Whether an order response, as exchange.order returns it, reports a fill."""
+        return (bool(result) and result.get("status") == "ok"
+                and any("filled" in status for status in result["response"]["data"]["statuses"]))
+
+    def _resolve_order(self, cloid):
+        """
+        Look up an order by cloid and rebuild the response exchange.order would have returned.
+        Returns None if the exchange never received an order with this cloid.
+
+        Used after an ambiguous failure, so that a retried or resumed order is never placed twice.
+        For filled orders, avgPx is reported as the limit price.
+        """
+        return self.order_manager.resolve(cloid)
+
+    def place_spot_limit_order(self, is_buy=True, cloid=None):
+        """
+        Place a spot limit order on our side of the book and wait until it is filled.
+        The fill model picks the level of lowest expected cost, or default_level until it has
+        estimates. An order still open after the model's horizon is canceled and what it left
+        crosses the spread, as the model priced it.
+        If cloid is given and an order with that cloid already exists, e.g. when resuming an
+        interrupted entry, we wait on that order instead of placing a new one.
+        Returns the size filled, by the limit order and the crossing one together.
+        """
+        choice = None
+        existing = self._resolve_order(cloid) if cloid is not None else None
+        if existing is not None:
+            self.logger.info(f"Spot order {cloid} was already placed. Resuming.")
+            self.spot_order_result = existing
         else:
-            # Place limit order sell at the first bid price
-            # And sell all the spot balance
-            price = self._spot_ask_price_at_level(1)
-            size = self.get_spot_balance_by_token(self.coin)
-
-        # Round the price and size to be compliant with hyperliquid's requirement
-        price, size = self._round_spot_px_sz(price, size)
-
-        # Using self.pair means this is a SPOT order.
-        self.spot_order_result = self.exchange.order(self.pair, is_buy, size, price, {"limit": {"tif": "Gtc"}})
-
-        # Query the order status by oid and Wait for spot order to be filled before continue
-        # The Waiting part only works when we place limit order.
-        if self.spot_order_result["status"] == "ok":
-            status = self.spot_order_result["response"]["data"]["statuses"][0]
-            if "resting" in status:
-                oid = status["resting"]["oid"]
-                order_status = self.exchange.info.query_order_by_oid(self.wallet, oid)
-                self.logger.info("Order status by oid:", order_status)
-
-                # Wait until filled
-                while True:
-                    order_status = self.exchange.info.query_order_by_oid(self.wallet, oid)
-                    if order_status['order']['status'] == 'filled':
-                        break
-
-                    if is_buy:
-                        self.logger.info("Waiting for spot buy order to be filled.")
-                    else:
-                        self.logger.info("Waiting for spot sell order to be filled.")
+            book = L2Book(self.info.l2_snapshot(self.pair))
+            self.fill_model.observe_book(book, self.clock.time())
+            # Buy on the bids with the allocation, sell all the spot balance on the asks
+            size = self.allocation / book.mid() if is_buy else self.get_spot_balance_by_token(self.coin)
+            choice = self.fill_model.best_level(book, is_buy, size)
+            if choice is not None:
+                price = choice["px"]
+                self.logger.info(f"Spot {'buy' if is_buy else 'sell'} at level {choice['level']}: fill probability "
+                                 f"{choice['fill_probability']:.1%} in {self.fill_model.horizon}s, expected "
+                                 f"{choice['expected_time']:.1f}s, expected cost {choice['cost'] * 1e4:.2f} bps.")
+            else:
+                prices, _ = book.top(is_buy, self.default_spot_level + 1)
+                price = prices[-1]
+            if is_buy:
+                size = self.allocation / price
+
+            self.freshness.decision("spot_order", ["l2_snapshot:" + self.pair])
+
+            # Round the price and size to be compliant with hyperliquid's requirement
+            price, size = self._round_spot_px_sz(price, size)
+
+            # Using self.pair means this is a SPOT order.
+            if cloid is None:
+                cloid = self.order_manager.new_cloid()
+            self.spot_order_result = self.order_manager.order(self.pair, "spot", is_buy, size, price, {"limit": {"tif": "Gtc"}},
+                                                              cloid=cloid, step="spot_buy" if is_buy else "spot_sell")
+
+        record = self.order_manager.get(cloid)
+        if record is None or record.status == "rejected":
+            return 0.0
+
+        # Wait for spot order to be filled before continue
+        side = "buy" if is_buy else "sell"
+        if not record.closed:
+            if choice is not None:
+                self.fill_model.placed(cloid, choice, size, self.clock.time())
+            try:
+                # Measured from placement, so a resumed order does not get a new horizon
+                timeout = max(record.created + self.fill_model.horizon - self.clock.time(), 0.0)
+                record = self.order_manager.wait_closed(
+                    cloid, poll_interval=self.order_poll_interval, timeout=timeout,
+                    on_wait=lambda record: self.logger.info(f"Waiting for spot {side} order to be filled: {record.filled_sz}/{record.sz}."))
+                if not record.closed:
+                    self.logger.info(f"Spot {side} order #{record.oid} is not filled after {self.fill_model.horizon}s. Canceling it.")
+                    self.order_manager.cancel(cloid)
+                    record = self.order_manager.wait_closed(cloid, poll_interval=self.order_poll_interval,
+                                                            timeout=self.order_cancel_timeout)
+                    if not record.closed:
+                        # The cancel was never acknowledged: ask for the order by its cloid
+                        self.order_manager.resolve(cloid)
+                        record = self.order_manager.get(cloid)
+                    if not record.closed:
+                        # Raised so the step resumes on this order next cycle and cancels it again
+                        raise Exception(f"Spot {side} order #{record.oid} is still open {self.order_cancel_timeout}s after canceling it.")
+            finally:
+                # An order we stopped waiting on, e.g. after an error, counts with what had filled by then
+                self.fill_model.closed(cloid, record.filled_sz / record.sz if record.sz else 0.0, self.clock.time())
+
+        filled = record.filled_sz
+        if record.status != "filled":
+            self.logger.info(f"Spot {side} order #{record.oid} was {record.status} after filling {record.filled_sz}.")
+            if record.status == "canceled":
+                filled += self._cross_spot_remainder(is_buy, record)
+        return filled
+
+    def _cross_spot_remainder(self, is_buy, record):
+        """
+        Takes what a canceled spot limit order left with an Ioc order across the spread.
+        The order has its own step cloid, so a resumed step never places it twice.
+        Returns the size it filled.
+        """
+        step = ("spot_buy" if is_buy else "spot_sell") + "_cross"
+        cloid = self._step_cloid(step)
+        if self._resolve_order(cloid) is None:
+            mid = L2Book(self.info.l2_snapshot(self.pair)).mid()
+            # Rounded first, so a buy's size is what the USDC left pays for at the rounded price
+            price, _ = self._round_spot_px_sz(mid * (1 + self.slippage) if is_buy else mid * (1 - self.slippage), 0.0)
+            if is_buy:
+                size = min(record.sz - record.filled_sz, self.get_spot_balance_by_token("USDC") / price)
+            else:
+                size = self.get_spot_balance_by_token(self.coin)
+            self.freshness.decision("spot_order", ["l2_snapshot:" + self.pair])
+            _, size = self._round_spot_px_sz(price, size)
+            if not size > 0:
+                return 0.0
+            result = self.order_manager.order(self.pair, "spot", is_buy, size, price, {"limit": {"tif": "Ioc"}},
+                                              cloid=cloid, step=step)
+            self.logger.info(f"Crossed the spread for the remaining {size} {self.coin}: {result}")
+        crossed = self.order_manager.get(cloid)
+        return crossed.filled_sz if crossed is not None else 0.0
 
-        return self.spot_order_result
-    
     def _spot_ask_price_at_level(self, level):
         data = self.info.l2_snapshot(self.pair)
         asks = data['levels'][1]  # Second list in 'levels' is asks
@@ -400,10 +808,17 @@ class HypeSpotPerpArbitrage:
         
     # Currently, we are NOT using this function to place perp order.  
     def place_perp_limit_order(self, size, price, is_buy=False):
-        self.perp_order_result = self.exchange.order(self.coin, is_buy, size, price, {"limit": {"tif": "Gtc"}})
+        self.perp_order_result = self.order_manager.order(self.coin, "perp", is_buy, size, price, {"limit": {"tif": "Gtc"}})
         return self.perp_order_result   
 
-    def place_perp_market_order(self, is_buy=False):
+    def place_perp_market_order(self, is_buy=False, cloid=None):
+        # An order with this cloid already exists when we resume an interrupted entry
+        existing = self._resolve_order(cloid) if cloid is not None else None
+        if existing is not None:
+            self.logger.info(f"Perp order {cloid} was already placed. Resuming.")
+            self.perp_order_result = existing
+            return self.perp_order_result
+
         # Here the size means the units of coin rather than the units of USDC
         size = self.get_spot_balance_by_token(self.coin)
         # price = self._perp_ask_price_at_level(1)
@@ -417,7 +832,8 @@ class HypeSpotPerpArbitrage:
         self.logger.info(f"There are {size} {self.coin} in the balance.")
         self.logger.info(f"We are going to open corresponding amount of short position.")
 
-        self.perp_order_result = self.exchange.market_open(self.coin, is_buy, size, slippage=self.slippage)
+        self.perp_order_result = self.order_manager.market_open(self.coin, is_buy, size, self.slippage, cloid=cloid,
+                                                                step="perp_close" if is_buy else "perp_open")
         if self.perp_order_result["status"] == "ok":
             for status in self.perp_order_result["response"]["data"]["statuses"]:
                 try:
@@ -428,60 +844,355 @@ class HypeSpotPerpArbitrage:
 
         return self.perp_order_result
 
-    def close_positions(self):   
-        # Sell all spot 
-        self.logger.info(f"We try to sell all {self.coin}.")
-        coin_spot_balance = self.get_spot_balance_by_token(self.coin)
-        if coin_spot_balance > 0:
-            self.place_spot_limit_order(is_buy=False)
-        else:
-            self.logger.info(f"No spot balance. Nothing to sell.")
-            
-        # Close short perp
-        self.logger.info(f"Now we try to close all {self.coin}.")
-        order_result = self.exchange.market_close(self.coin)
-        if order_result["status"] == "ok":
-            for status in order_result["response"]["data"]["statuses"]:
-                try:
-                    filled = status["filled"]
-                    self.logger.info(f'Order #{filled["oid"]} filled {filled["totalSz"]} @{filled["avgPx"]}')
-                except KeyError:
-                    self.logger.info(f'Error: {status["error"]}')
+    def open_positions(self):
+        """
+        Run the entry sequence: allocate, buy spot, short perp.
+
+        The current step is kept in self.entry_step, so if a step raises we resume from it on
+        the next cycle instead of starting over or leaving spot bought without its short.
+        Each step's order keeps its cloid until the step completes, so it is never placed twice.
+        The steps' reads are part of the order flow, so they are scheduled at order priority.
+        """
+        with self.trade_lock, self.scheduler.priority(RateLimitScheduler.PRIORITY_ORDER):
+            if self.entry_step is None:
+                self.entry_step = "allocate"
+
+            if self.entry_step == "allocate":
+                self.allocation = self.allocate_spot_perp_balance()
+                if not self.allocation:
+                    self.entry_step = None
+                    return
+                self.entry_step = "basis"
+
+        # Waiting for the basis can take basis_max_wait seconds and sends no order, so it holds
+        # no lock: hedge, margin and stress checks go on meanwhile
+        if self.entry_step == "basis":
+            self.wait_for_basis(is_entry=True)
+
+        with self.trade_lock, self.scheduler.priority(RateLimitScheduler.PRIORITY_ORDER):
+            if self.entry_step == "basis":
+                if self.funding_ledger:
+                    self.funding_ledger.open_position(self.coin, int(self.clock.time() * 1000))
+                self.entry_step = "spot"
+
+            if self.entry_step == "spot":
+                cloid = self._step_cloid("spot_buy")
+                filled = self.place_spot_limit_order(is_buy=True, cloid=cloid)
+                if not filled > 0:
+                    # A rejected or canceled order that bought nothing: there is nothing to hedge
+                    record = self.order_manager.get(cloid)
+                    self.logger.info(f"Spot buy {record.status if record else 'failed'} without a fill. Aborting the entry.")
+                    self.entry_step = None
+                    self.step_cloids.clear()
+                    return
+                self.is_spot_open = True
+                self.entry_step = "perp"
+
+            if self.entry_step == "perp":
+                cloid = self._step_cloid("perp_open")
+                result = self.place_perp_market_order(is_buy=False, cloid=cloid)
+                if not self._filled(result):
+                    # Spot is bought but not hedged: stay on this step, so the next cycle tries again
+                    record = self.order_manager.get(cloid)
+                    self.logger.info(f"Perp short {record.status if record else 'not placed'} without a fill. Retrying next cycle.")
+                    if record is not None and record.status in ("rejected", "canceled"):
+                        # The exchange is done with that order; the retry needs a cloid of its own
+                        self.step_cloids.pop("perp_open", None)
+                    return
+                self.is_perp_open = True
+
+            self.entry_step = None
+            self.step_cloids.clear()
+            self.refresh_pnl_positions()
+
+    def close_positions(self):
+        """
+        Sell all spot, then close the perp short.
+        Like open_positions, resumes from self.exit_step if the previous attempt stopped midway.
+        """
+        with self.trade_lock, self.scheduler.priority(RateLimitScheduler.PRIORITY_ORDER):
+            if self.exit_step is None:
+                self.exit_step = "spot"
+
+            if self.exit_step == "spot":
+                # Sell all spot
+                self.logger.info(f"We try to sell all {self.coin}.")
+                coin_spot_balance = self.get_spot_balance_by_token(self.coin)
+                if coin_spot_balance > 0:
+                    cloid = self._step_cloid("spot_sell")
+                    self.place_spot_limit_order(is_buy=False, cloid=cloid)
+                else:
+                    self.logger.info(f"No spot balance. Nothing to sell.")
+                self.is_spot_open = False
+                self.exit_step = "perp"
+
+            if self.exit_step == "perp":
+                # Close short perp
+                self.logger.info(f"Now we try to close all {self.coin}.")
+                cloid = self._step_cloid("perp_close")
+                order_result = self._resolve_order(cloid) or self.order_manager.market_close(self.coin, True, slippage=self.slippage,
+                                                                                             cloid=cloid, step="perp_close")
+                if order_result and order_result["status"] == "ok":
+                    for status in order_result["response"]["data"]["statuses"]:
+                        try:
+                            filled = status["filled"]
+                            self.logger.info(f'Order #{filled["oid"]} filled {filled["totalSz"]} @{filled["avgPx"]}')
+                        except KeyError:
+                            self.logger.info(f'Error: {status["error"]}')
+                self.is_perp_open = False
+
+            self.exit_step = None
+            self.step_cloids.clear()
+            self.pnl_engine.clear()
+            self.risk_engine.clear()
+
+    def update_books(self):
+        """
+        Fetch the spot and perp books and feed them into the basis monitor and the PnL engine.
+        The executable basis is computed at our allocation, or at basis_notional before we have one.
+        Returns the latest basis.
+        """
+        # Decoded once for both consumers
+        spot_book = L2Book(self.info.l2_snapshot(self.pair))
+        perp_book = L2Book(self.info.l2_snapshot(self.coin))
+        self.freshness.decision("pnl", ["l2_snapshot:" + self.pair, "l2_snapshot:" + self.coin])
+        now = self.clock.time()
+        self.pnl_engine.update(spot_book, perp_book, timestamp=now)
+        self.fill_model.observe_book(spot_book, now)
+        notional = self.allocation or self.basis_notional
+        return self.basis_monitor.update(spot_book, perp_book, notional, timestamp=now)
+
+    def refresh_pnl_positions(self):
+        """
+        Re-read entry prices and sizes of both legs for the PnL engine, and the risk thresholds.
+        Call after every trade.
+        """
+        user_state = self.info.user_state(address=self.wallet)
+        user_fills = self.info.user_fills(address=self.wallet)
+        self.pnl_engine.refresh(user_state, user_fills)
+        self.refresh_risk(user_state)
+
+    def refresh_risk(self, user_state):
+        """Recompute the risk band thresholds from user_state at the current mark price."""
+        position = RiskEngine.find_position(user_state, self.coin)
+        if position is None:
+            self.risk_engine.clear()
+            return
+        mark_price = abs(float(position["positionValue"]) / float(position["szi"]))
+        self.risk_engine.refresh(user_state, mark_price)
+
+    def check_risk(self):
+        """Poll the mark price and run the risk engine on each one."""
+        errors = 0
+        while True:
+            try:
+                if self.risk_engine.first_threshold is not None:
+                    mids = self.info.all_mids()
+                    self.on_mark(float(mids[self.coin]), self.clock.time())
+                errors = 0
+                self.clock.sleep(self.risk_poll_interval)
+            except Exception as e:
+                self.logger.error(f"⚠️ Risk check error: {e}")
+                self.clock.sleep(self.loop_retry_policy.delay(errors))
+                errors += 1
+
+    def on_mark(self, mark_price, timestamp):
+        """Check one mark price against the precomputed risk bands and act on a crossing."""
+        self.stress_engine.observe(mark_price, timestamp)
+        # Acting on an old mark beats not acting, so risk only records the age
+        self.freshness.decision("risk", ["all_mids"], refuse=False)
+        event = self.risk_engine.check(mark_price, timestamp)
+        if event is not None:
+            self.derisk(event)
+        return event
+
+    def derisk(self, event):
+        """
+        Act on a risk event: warn, move spot USDC to perp margin, or buy back part of the short
+        and sell the matching spot. A transfer without enough spot USDC falls back to reducing.
+        Logs the latency from detection to the completed action.
+        """
+        band = event["band"]
+        self.logger.info(f"⚠️ Risk band '{band}' crossed at mark {event['mark']}: liquidation price "
+                         f"{event['liquidation_px']}, margin ratio {event['margin_ratio']:.2%}.")
+        action = "warn"
+        with self.trade_lock:
+            if band == "transfer":
+                usdc_spot = self.get_spot_balance_by_token("USDC")
+                amount = round(min(event["transfer_amount"], usdc_spot), 2)
+                if amount >= 1:
+                    result = self.exchange.usd_class_transfer(amount, True)
+                    self.logger.info(f"Transferred {amount} USDC from spot to perp margin: {result}")
+                    action = "transfer"
+                else:
+                    self.logger.info(f"Only {usdc_spot} USDC on spot to transfer. Reducing instead.")
+                    band = "reduce"
+
+            if band == "reduce":
+                _, size = self._round_perp_px_sz(event["mark"], event["reduce_size"])
+                if size > 0:
+                    # Buy back the short first, so the account only ever gets safer
+                    result = self.order_manager.market_close(self.coin, True, sz=size, slippage=self.slippage, step="reduce")
+                    self.logger.info(f"Reduced the short by {size} {self.coin}: {result}")
+                    spot_size = min(size, self.get_spot_balance_by_token(self.coin))
+                    px, spot_size = self._round_spot_px_sz(event["mark"] * (1 - self.slippage), spot_size)
+                    if spot_size > 0:
+                        result = self.order_manager.order(self.pair, "spot", False, spot_size, px, {"limit": {"tif": "Ioc"}}, step="reduce")
+                        self.logger.info(f"Sold {spot_size} {self.coin} spot: {result}")
+                    action = "reduce"
+
+            if action != "warn":
+                self.refresh_pnl_positions()
+
+        record = self.risk_engine.record(event, action, self.clock.time())
+        self.logger.info(f"Risk action '{action}' completed {record['latency'] * 1000:.0f} ms after detection.")
+        if self.telegram_notifier:
+            self.telegram_notifier.send_message(f"⚠️ Risk band '{event['band']}' crossed at mark {event['mark']}. Action: {action}.")
+        return record
+
+    def check_stress(self, spot_user_state, mark_price):
+        """
+        Stress the position refreshed into the risk engine over the next funding intervals.
+        Above the target liquidation probability, move spot USDC to perp margin and, if spot
+        cannot cover it, reduce the position, both through derisk().
+        Returns the stress result, or None without a position.
+        """
+        risk = self.risk_engine
+        if risk.account_value is None or not risk.szi:
+            return None
+        # The volatility is estimated from the risk loop's marks alone; see on_mark()
+        prediction = self.funding_predictor.predict(timestamp=self.clock.time())
+        stress = self.stress_engine.run(risk.szi, risk.account_value, risk.maintenance_margin, mark_price,
+                                        funding_rate=prediction["predicted"] if prediction else 0.0,
+                                        spot_usdc=SpotState.of(spot_user_state).total("USDC"))
+        self.last_stress = dict(stress, timestamp=self.clock.time())
+        self.logger.info(f"Stress: {stress['liquidation_probability']:.2%} liquidation probability over "
+                         f"{stress['horizon_hours']}h at {stress['volatility']:.2%} hourly volatility, "
+                         f"target {stress['target_probability']:.2%} ({stress['seconds'] * 1000:.0f} ms).")
+        if stress["liquidation_probability"] <= stress["target_probability"]:
+            return stress
+
+        self.logger.info(f"⚠️ Stress over target: needs {stress['required_transfer']:.2f} USDC more margin, "
+                         f"spot covers {stress['transfer']:.2f}, reduce {stress['reduce_fraction']:.1%} of the position.")
+        if not self.stress_rebalance:
+            return stress
+        event = {
+            "mark": mark_price,
+            "detected_at": self.clock.time(),
+            "liquidation_px": risk.liquidation_px,
+            "margin_ratio": risk.margin_ratio(mark_price),
+            "transfer_amount": stress["transfer"],
+            "reduce_size": abs(risk.szi) * stress["reduce_fraction"]
+        }
+        if stress["transfer"] >= 1:
+            self.derisk(dict(event, band="transfer", reduce_size=0.0))
+        if event["reduce_size"] > 0:
+            self.derisk(dict(event, band="reduce"))
+        return stress
+
+    def wait_for_basis(self, is_entry=True):
+        """
+        Poll the books until the basis is favorable for opening (is_entry) or unwinding,
+        or until basis_max_wait seconds have passed.
+        Returns True if the basis turned favorable, False if we gave up waiting.
+        """
+        action = "entry" if is_entry else "exit"
+        deadline = self.clock.time() + self.basis_max_wait
+        while True:
+            basis = self.update_books()
+            if is_entry:
+                favorable = self.basis_monitor.is_entry_favorable(min_z=self.basis_entry_z)
+            else:
+                favorable = self.basis_monitor.is_exit_favorable(max_z=self.basis_exit_z)
+
+            if favorable:
+                self.logger.info(f"Basis is favorable for {action}: {basis[action]}, z-score {self.basis_monitor.z_score(action):.2f}.")
+                return True
+            if self.clock.time() >= deadline:
+                self.logger.info(f"Basis still not favorable for {action} after {self.basis_max_wait}s. Proceeding anyway.")
+                return False
+
+            self.logger.info(f"Waiting for a favorable {action} basis.")
+            self.clock.sleep(self.basis_poll_interval)
+
+    def check_hedge(self, user_state, spot_user_state, mark_price):
+        """
+        Compare the spot holding with the perp szi from one state snapshot and send the
+        smallest corrective order when the net delta leaves the band. Fetch the snapshot while
+        holding trade_lock, so that no entry or exit is midway through when it is taken.
+        Returns the measurement, whose net_delta_usd is the residual delta.
+        """
+        with self.trade_lock:
+            if not (self.is_spot_open and self.is_perp_open):
+                return None
+
+            measurement = self.hedge_monitor.measure(user_state, spot_user_state, mark_price)
+            self.logger.info(f"Spot {measurement['spot_size']} vs perp {measurement['perp_size']} {self.coin}: "
+                             f"residual delta {measurement['net_delta']:.6f} {self.coin} (${measurement['net_delta_usd']:.2f}).")
+
+            order = self.hedge_monitor.corrective_order(measurement)
+            if order is None:
+                return measurement
+
+            side = "buy" if order["is_buy"] else "sell"
+            self.logger.info(f"Net delta is outside the ${self.hedge_monitor.band_usd} band. Top-up: {side} {order['size']} {self.coin} on {order['leg']}.")
+            if order["leg"] == "perp":
+                result = self.order_manager.market_open(self.coin, order["is_buy"], order["size"], self.slippage, step="hedge")
+            else:
+                px = mark_price * (1 + self.slippage) if order["is_buy"] else mark_price * (1 - self.slippage)
+                px, _ = self._round_spot_px_sz(px, order["size"])
+                result = self.order_manager.order(self.pair, "spot", order["is_buy"], order["size"], px, {"limit": {"tif": "Ioc"}}, step="hedge")
+            self.logger.info(f"Top-up order result: {result}")
+            self.refresh_pnl_positions()
+
+            return measurement
 
     def allocate_spot_perp_balance(self):
         """
-        Evenly allocate spot and perp usdc balance;
-        In a word, rebalance the balance.
-        Return the evenly allocated balance, which is half the total.
+        Size the position with the capital allocator and split the USDC between spot and perp:
+        spot keeps what buys the spot leg, perp gets the margin of the short.
+        With the allocator's default of leverage 1 on a single coin, this is half the total each.
+        Return the allocated notional, 0.0 if the carry does not pay for the fees and impact.
         """
         balances = self.get_usdc_balances()
         usdc_spot = balances['USDC_SPOT']
         usdc_perp = balances['USDC_PERP']
         total_usdc = balances['TOTAL']
-        allocation = total_usdc / 2
 
         self.logger.info(f"The current usdc_spot is {usdc_spot} and usdc_perp is {usdc_perp}.")
 
-        # If usdc_perp > usdc_spot, transfer (usdc_perp - usdc_spot)/2 from perp to spot
-        # If usdc_perp < usdc_spot, transfer (usdc_spot - usdc_perp)/2 from spot to perp
-        if usdc_perp > usdc_spot:
-            transfer_amount = (usdc_perp - usdc_spot) / 2
-            transfer_result = self.exchange.usd_class_transfer(transfer_amount, False)
-            self.logger.info("Since usdc_perp > usdc_spot, transfer from perp to spot: ", transfer_result)
-        else:
-            transfer_amount = (usdc_spot - usdc_perp) / 2
+        meta, asset_ctxs = self.info.meta_and_asset_ctxs()
+        coins = self.allocator_coins
+        if coins == "*":
+            coins = CapitalAllocator.spot_coins(self.info.spot_meta())
+        coins = set(coins or []) | {self.coin}
+        # Our own coin has the sampled prediction rather than a single snapshot
+        prediction = self.funding_predictor.predict(timestamp=self.clock.time())
+        carry = {self.coin: prediction["predicted"]} if prediction else None
+        self.allocation_plan = self.capital_allocator.allocate_universe(total_usdc, meta, asset_ctxs, coins=coins, carry=carry)
+        for coin, plan in list(self.allocation_plan.items())[:5]:
+            self.logger.info(f"Allocation {coin}: notional {plan['notional']:.2f}, margin {plan['margin']:.2f}, "
+                             f"expected profit {plan['profit']:.2f}.")
+
+        plan = self.allocation_plan.get(self.coin)
+        if plan is None:
+            self.logger.info(f"The allocator assigns no capital to {self.coin}.")
+            return 0.0
+
+        # Positive moves USDC from spot to perp
+        transfer_amount = round(plan["margin"] - usdc_perp, 2)
+        if transfer_amount > 0:
             transfer_result = self.exchange.usd_class_transfer(transfer_amount, True)
-            self.logger.info("Since usdc_spot > usdc_perp, transfer from spot to perp: ", transfer_result)
-        
+            self.logger.info(f"Transfer {transfer_amount} from spot to perp: {transfer_result}")
+        elif transfer_amount < 0:
+            transfer_result = self.exchange.usd_class_transfer(-transfer_amount, False)
+            self.logger.info(f"Transfer {-transfer_amount} from perp to spot: {transfer_result}")
+
         new_balances = self.get_usdc_balances()
-        new_usdc_spot = new_balances['USDC_SPOT']
-        new_usdc_perp = new_balances['USDC_PERP']
+        self.logger.info(f"The usdc_spot is {new_balances['USDC_SPOT']} and the usdc_perp is {new_balances['USDC_PERP']}, "
+                         f"allocated {plan['notional']:.2f} to {self.coin}.")
 
-        if abs(new_usdc_perp - allocation) < 0.0001 and abs(new_usdc_spot - allocation) < 0.0001:
-            self.logger.info(f"The usdc_spot is {new_usdc_spot} and the usdc_perp is {new_usdc_perp}")
-            self.logger.info(f"Allocation complete and successful.")
-        
-        return allocation
+        return plan["notional"]
 
     # This function is used in check_positions_value, which is deprecated.
     def get_position_value(self):
@@ -574,72 +1285,121 @@ class HypeSpotPerpArbitrage:
                         self.logger.info(f"Position value is safe. Current: {current_position_value}, Threshold: {threshold}")
 
                 # Sleep for 5 minutes before checking the position value again
-                time.sleep(5 * 60)
+                self.clock.sleep(5 * 60)
 
             except Exception as e:
                 self.logger.info(f"Position value check error: {e}")
-                time.sleep(60)
+                self.clock.sleep(60)
     
     def check_funding_rate(self):
-        """Checks the funding rate every 15 mins and manages positions."""
+        """
+        Samples the asset context every funding_sample_interval seconds and manages positions
+        on the predicted funding rate rather than the last printed one.
+
+        We enter once the lower band of the prediction is above entry_funding_threshold and
+        exit once the upper band is below exit_funding_threshold. In between we hold.
+        """
+        last_notified = 0
+        errors = 0
         while True:
             try:
-                funding_rate = self.get_funding_rate_by_token(self.coin)
-                
+                # Finish an interrupted entry or exit before anything else, so we are never left unhedged
+                if self.entry_step is not None:
+                    self.logger.info(f"Resuming entry at step '{self.entry_step}'.")
+                    self.open_positions()
+                elif self.exit_step is not None:
+                    self.logger.info(f"Resuming exit at step '{self.exit_step}'.")
+                    self.close_positions()
+
+                asset_ctx = self.get_asset_ctx_by_token(self.coin)
+                self.funding_predictor.update(asset_ctx, timestamp=self.clock.time())
+                self.update_books()
+                prediction = self.funding_predictor.predict(timestamp=self.clock.time())
+                funding_rate = prediction["current"]
+                predicted = prediction["predicted"]
+                band = f"[{prediction['lower']:.8f}, {prediction['upper']:.8f}]"
+
                 # Send a Telegram notification about the funding rate
-                if self.telegram_notifier:
-                    message = f"📊 Current funding rate for {self.coin}: {funding_rate}"
+                if self.telegram_notifier and self.clock.time() - last_notified >= self.funding_notify_interval:
+                    message = f"📊 Current funding rate for {self.coin}: {funding_rate}, predicted: {predicted:.8f} {band}"
                     self.telegram_notifier.send_message(message)
+                    last_notified = self.clock.time()
+
+                self.freshness.decision("funding", ["meta_and_asset_ctxs"])
 
-                # Only operate when the funding rate is positive
-                if funding_rate > 0:
-                    self.logger.info(f"Funding rate {funding_rate} is positive.")
+                # Only open when the whole confidence band of the next print is positive
+                if not prediction["ready"]:
+                    self.logger.info(f"Funding rate is {funding_rate}, predicted {predicted:.8f} {band} from "
+                                     f"{self.funding_predictor.total_samples} samples, too few to act on. Holding.")
+
+                elif prediction["lower"] > self.entry_funding_threshold:
+                    self.logger.info(f"Funding rate {funding_rate} is positive, predicted {predicted:.8f} {band}.")
                     if not self.is_spot_open and not self.is_perp_open:
-                        self.allocation = self.allocate_spot_perp_balance()
-                        self.place_spot_limit_order(is_buy=True)
-                        self.is_spot_open = True
-                        self.place_perp_market_order(is_buy=False)
-                        self.is_perp_open = True
+                        self.open_positions()
                     else:
                         self.logger.info(f"Orders are already open.")
-                
-                else:
-                    self.logger.info(f"Funding rate is {funding_rate}, negative.")
+
+                elif prediction["upper"] < self.exit_funding_threshold:
+                    self.logger.info(f"Funding rate is {funding_rate}, predicted {predicted:.8f} {band}, negative.")
                     if self.is_spot_open and self.is_perp_open:
                         self.logger.info(f"We close positions.")
+                        self.wait_for_basis(is_entry=False)
                         self.close_positions()
-                        self.is_spot_open = False
-                        self.is_perp_open = False
                         self.logger.info(f"Positions closed.")
 
-                # Sleep for 15 minutes before checking the funding rate again
-                time.sleep(15 * 60)
+                else:
+                    self.logger.info(f"Funding rate is {funding_rate}, predicted {predicted:.8f} {band} is undecided. Holding.")
+
+                # Sleep until the next premium sample
+                errors = 0
+                self.clock.sleep(self.funding_sample_interval)
 
             except Exception as e:
                 self.logger.error(f"⚠️ Funding rate check error: {e}")
                 if self.telegram_notifier:
                     error_message = f"⚠️ Error in funding rate check: {e}"
                     self.telegram_notifier.send_message(error_message)
-                time.sleep(60)
+                # Back off from seconds up to loop_max_delay while the errors keep coming
+                self.clock.sleep(self.loop_retry_policy.delay(errors))
+                errors += 1
 
     def check_account_value(self):
+        errors = 0
         while True:
             try:
                 self.logger.info("🔍 Running Account Value Check...")  # Heartbeat log
 
-                user_state = self.info.user_state(address=self.wallet)
-                if self.is_perp_open:
-                    relevant_values = self._extract_relevant_values(user_state)
+                # Fetched under the trade lock, so the hedge check never corrects from a snapshot
+                # taken midway through an entry or exit
+                with self.trade_lock:
+                    user_state = self.info.user_state(address=self.wallet)
+                    self.refresh_risk(user_state)
+                    perp_open = self.is_perp_open
+                    if perp_open:
+                        # One state snapshot per cycle serves both the hedge check and the margin check
+                        spot_user_state = self.info.spot_user_state(address=self.wallet)
+                        relevant_values = self._extract_relevant_values(user_state)
+                        self.last_account_check = dict(relevant_values, timestamp=self.clock.time())
+                        self.check_hedge(user_state, spot_user_state, relevant_values["mark_price"])
+                if perp_open:
                     self._check_and_warn(relevant_values)
+                    self.check_stress(spot_user_state, relevant_values["mark_price"])
                 else:
                     self.logger.info("ℹ️ Perpetual positions are not open yet. Skipping check.")
 
+                budget = self.scheduler.utilization()
+                self.logger.info(f"Request budget: {budget['utilization']:.1%} used in the last minute, "
+                                 f"{budget['tokens']:.0f} tokens left, {budget['queued']} queued, "
+                                 f"avg wait {budget['avg_wait']:.3f}s, shed {budget['shed']}.")
+
                 # Sleep for 5 minutes before checking the account value again
-                time.sleep(5 * 60)
+                errors = 0
+                self.clock.sleep(5 * 60)
 
             except Exception as e:
                 self.logger.error(f"⚠️ Account value check error: {e}")
-                time.sleep(60)
+                self.clock.sleep(self.loop_retry_policy.delay(errors))
+                errors += 1
 
     def _extract_relevant_values(self, user_state):
         """
@@ -699,8 +1459,11 @@ class HypeSpotPerpArbitrage:
         # Extract relevant values
         account_value = float(data["crossMarginSummary"]["accountValue"])
         cross_maintenance_margin_used = float(data["crossMaintenanceMarginUsed"])
-        position = data["assetPositions"][0]["position"]
-        liquidation_price = float(position["liquidationPx"])
+        position = RiskEngine.find_position(data, self.coin)
+        if position is None:
+            raise Exception(f"No {self.coin} perp position in user_state.")
+        # liquidationPx is null when the account cannot be liquidated at any price
+        liquidation_price = float(position["liquidationPx"]) if position.get("liquidationPx") else None
         mark_price = self.get_markPx_by_token(self.coin) 
         
         # Return extracted values as a dictionary
@@ -745,12 +1508,13 @@ class HypeSpotPerpArbitrage:
         self.logger.info(f"Warning Threshold: {warning_threshold}")
         self.logger.info(f"Liquidation Price: {liquidation_price}")
         self.logger.info(f"Mark Price: {mark_price}")
+        self.logger.info(f"Risk band at this mark: {self.risk_engine.band_at(mark_price) or 'none'}")
         
         # Check if account value is close to or below the threshold
         if account_value <= warning_threshold:
             self.logger.info(f"⚠️ Warning: Account value is close to the maintenance margin threshold.")
             self.logger.info("Consider reducing your position to avoid liquidation!")
-        elif mark_price >= liquidation_price:
+        elif liquidation_price is not None and mark_price >= liquidation_price:
             self.logger.info(f"⚠️ Warning: The current mark price is close to the liquidation price!")
             self.logger.info("Consider taking action to avoid liquidation!")
         else:
@@ -763,23 +1527,122 @@ class HypeSpotPerpArbitrage:
     def _curr_timestamp(self):
         return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
+    def start_profiler(self):
+        """
+        Make the sampling profiler and thread dumps available at runtime, through signals
+        (kill -USR1 to start/stop, kill -USR2 to dump threads) and an optional control socket.
+        """
+        profiler_config = setup_section("profiler", {
+            "interval": 0.01,
+            "output_dir": "profiles",
+            "signals": True,
+            "control_port": 0
+        })
+        self.profiler = SamplingProfiler(interval=profiler_config["interval"],
+                                         output_dir=profiler_config["output_dir"],
+                                         logger=self.logger)
+        if profiler_config["signals"] and threading.current_thread() is threading.main_thread():
+            self.profiler.install_signal_handlers()
+        if profiler_config["control_port"]:
+            self.profiler.serve(profiler_config["control_port"])
+
+    def status_snapshot(self):
+        """
+        The strategy's state as one JSON-serializable dict, read from what the threads already
+        keep: no request is sent and the trading lock is not taken, so it may be a moment behind.
+        The orders and the margin figures and risk events, which other threads change, are copied
+        by their owners under their own locks.
+        """
+        now = self.clock.time()
+        risk = self.risk_engine
+        prediction = self.funding_predictor.predict(timestamp=now)
+        risk_state = risk.snapshot()
+        return {
+            "time": now,
+            "coin": self.coin,
+            "legs": {
+                "spot_open": self.is_spot_open,
+                "perp_open": self.is_perp_open,
+                "entry_step": self.entry_step,
+                "exit_step": self.exit_step,
+                "allocation": self.allocation
+            },
+            "positions": {
+                "perp_size": self.pnl_engine.perp_size,
+                "perp_entry_px": self.pnl_engine.perp_entry_px,
+                "spot_size": self.pnl_engine.spot_size,
+                "spot_entry_px": self.pnl_engine.spot_entry_px,
+                "residual_delta_usd": self.hedge_monitor.residual_delta_usd
+            },
+            "pnl": {
+                "latest": self.pnl_engine.last,
+                "intraday": self.pnl_engine.intraday_pnl(),
+                "max_drawdown": self.pnl_engine.max_drawdown()
+            },
+            "risk": {
+                "margin": risk_state["margin"],
+                "active_band": risk.active_band,
+                "thresholds": risk_state["thresholds"],
+                "events": risk_state["events"],
+                "stress": self.last_stress,
+                "last_account_check": self.last_account_check
+            },
+            "funding": {
+                "prediction": prediction,
+                "carry": self.funding_ledger.report(self.coin) if self.funding_ledger else None
+            },
+            "basis": self.basis_monitor.latest,
+            "allocation_plan": self.allocation_plan,
+            "orders": self.order_manager.snapshot(),
+            "requests": self.scheduler.utilization(),
+            "freshness": self.freshness.snapshot()
+        }
+
+    def start_status_server(self):
+        """Serve status_snapshot() over HTTP on localhost if "port" is set in the "status_server" section."""
+        status_config = setup_section("status_server", {
+            "port": 0,
+            "host": "127.0.0.1",
+            "max_age": 1.0
+        })
+        if not status_config["port"]:
+            return None
+        self.status_server = StatusServer(self.status_snapshot, max_age=status_config["max_age"], logger=self.logger)
+        self.status_server.serve(status_config["port"], host=status_config["host"])
+        return self.status_server
+
     def run_strategy(self):
+        self.start_profiler()
+        self.start_status_server()
+
         # Run the strategy functions in separate threads to allow parallel execution
-        funding_rate_thread = threading.Thread(target=self.check_funding_rate)
-        account_value_thread = threading.Thread(target=self.check_account_value)
+        funding_rate_thread = threading.Thread(target=self.check_funding_rate, name="funding")
+        account_value_thread = threading.Thread(target=self.check_account_value, name="account")
+        risk_thread = threading.Thread(target=self.check_risk, name="risk")
 
         # Start the threads
         self.logger.info("Starting Funding Rate Monitoring Thread...")
         self.logger.info("Starting Account Value Monitoring Thread...")
+        self.logger.info("Starting Risk Monitoring Thread...")
         
         funding_rate_thread.start()
         account_value_thread.start()
+        risk_thread.start()
 
-        self.logger.info("Both strategy threads have been started successfully.")
+        self.logger.info("All strategy threads have been started successfully.")
 
         # Join the threads to run the strategy until completion
-        funding_rate_thread.join()
-        account_value_thread.join()           
+        try:
+            funding_rate_thread.join()
+            account_value_thread.join()
+            risk_thread.join()
+        finally:
+            self.close()
+
+    def close(self):
+        """Release what the strategy holds open, e.g. the cassette being recorded. Call it on exit."""
+        if self.cassette is not None:
+            self.cassette.close()
 
 if __name__ == "__main__":
     arbitrage = HypeSpotPerpArbitrage("HYPE")
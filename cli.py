@@ -0,0 +1,224 @@
+"""
+Command line entry point of the strategy.
+
+    python cli.py run              run the strategy
+    python cli.py close            sell all spot and close the perp short
+    python cli.py pnl              PnL if we closed both legs now
+    python cli.py status           positions, balances, risk and realized carry
+    python cli.py scan             current and predicted funding of every perp
+    python cli.py funding          funding history statistics of every perp, from a local cache
+    python cli.py replay FILE      re-run a recorded session offline from its cassette
+
+pnl, status, scan and funding only read: they never load the secret key or build an Exchange.
+Every command imports what it needs when it runs, so the read-only ones start fast.
+"""
+import argparse
+
+
+def _base_url():
+    from hyperliquid.utils import constants
+    return constants.MAINNET_API_URL
+
+
+def run(args):
+    from basic_spot_perp_arb import HypeSpotPerpArbitrage
+    HypeSpotPerpArbitrage(args.coin).run_strategy()
+
+
+def close(args):
+    from basic_spot_perp_arb import HypeSpotPerpArbitrage
+    arbitrage = HypeSpotPerpArbitrage(args.coin, notify=False)
+    try:
+        arbitrage.close_positions()
+    finally:
+        arbitrage.close()
+
+
+def pnl(args):
+    from example_utils import setup_info
+    from PnlCalculator import PnLCalculator
+
+    address, info = setup_info(_base_url())
+    PnLCalculator(info=info, address=address).run(hype_spot=args.coin + "/USDC", hype_perp=args.coin)
+
+
+def status(args):
+    from example_utils import print_json, setup_info, setup_section
+    from FundingLedger import FundingLedger
+    from RiskEngine import RiskEngine
+
+    address, info = setup_info(_base_url())
+    user_state = info.user_state(address)
+    spot_user_state = info.spot_user_state(address)
+
+    result = {
+        "address": address,
+        "account_value": float(user_state["crossMarginSummary"]["accountValue"]),
+        "maintenance_margin": float(user_state["crossMaintenanceMarginUsed"]),
+        "withdrawable": float(user_state["withdrawable"]),
+        "spot_balances": {balance["coin"]: float(balance["total"]) for balance in spot_user_state["balances"]},
+        "position": None
+    }
+
+    position = RiskEngine.find_position(user_state, args.coin)
+    if position is not None:
+        mark_price = abs(float(position["positionValue"]) / float(position["szi"]))
+        risk_config = setup_section("risk_engine", {
+            "liq_distances": [0.2, 0.12, 0.06],
+            "margin_ratios": [0.5, 0.65, 0.8]
+        })
+        risk_engine = RiskEngine(args.coin, liq_distances=risk_config["liq_distances"],
+                                 margin_ratios=risk_config["margin_ratios"])
+        risk_engine.refresh(user_state, mark_price)
+        result["position"] = {
+            "szi": float(position["szi"]),
+            "entry_px": float(position["entryPx"]),
+            "mark_px": mark_price,
+            "liquidation_px": risk_engine.liquidation_px,
+            "unrealized_pnl": float(position["unrealizedPnl"]),
+            "cum_funding": position.get("cumFunding"),
+            "margin_ratio": risk_engine.margin_ratio(mark_price),
+            "risk_band": risk_engine.band_at(mark_price),
+            "band_thresholds": dict(risk_engine.thresholds)
+        }
+
+    # The ledger's running totals are on disk; reading them costs no requests
+    ledger_config = setup_section("funding_ledger", {
+        "path": "funding_ledger.jsonl",
+        "state_path": "funding_ledger_state.json"
+    })
+    ledger = FundingLedger(info, address, path=ledger_config["path"], state_path=ledger_config["state_path"])
+    result["carry"] = ledger.report(args.coin)
+
+    print_json(result)
+
+
+def scan(args):
+    from example_utils import setup_info
+    from FundingPredictor import FundingPredictor
+
+    _, info = setup_info(_base_url())
+    meta, asset_ctxs = info.meta_and_asset_ctxs()
+
+    rows = []
+    for asset, ctx in zip(meta["universe"], asset_ctxs):
+        if asset.get("isDelisted") or float(ctx.get("dayNtlVlm", 0.0)) < args.min_volume:
+            continue
+        funding = float(ctx["funding"])
+        # What the current premium alone would pay, before it is averaged over the hour
+        predicted = FundingPredictor.funding_from_premium(FundingPredictor.premium_from_ctx(ctx)) if ctx.get("impactPxs") else funding
+        rows.append((asset["name"], funding, predicted, float(ctx["dayNtlVlm"]), float(ctx["openInterest"]) * float(ctx["markPx"])))
+
+    rows.sort(key=lambda row: row[1], reverse=True)
+    print(f"{'coin':<10}{'funding/h':>12}{'APR':>10}{'predicted':>12}{'pred APR':>10}{'24h volume':>16}{'open interest':>16}")
+    for name, funding, predicted, volume, open_interest in rows[:args.top]:
+        print(f"{name:<10}{funding:>12.6%}{funding * 24 * 365:>10.1%}{predicted:>12.6%}{predicted * 24 * 365:>10.1%}"
+              f"{volume:>16,.0f}{open_interest:>16,.0f}")
+
+
+def funding(args):
+    from example_utils import setup_info, setup_section
+    from FundingAnalytics import FundingHistoryCache, funding_statistics, rank_coins
+    from RateLimiter import RateLimitScheduler, ScheduledClient
+
+    config = setup_section("funding_analytics", {
+        "cache_dir": "funding_cache",
+        "workers": 4
+    })
+    if args.offline:
+        # Building an Info already requests the metadata; offline reads only the cache
+        cache = FundingHistoryCache(None, cache_dir=config["cache_dir"])
+        coins = args.coins.split(",") if args.coins else cache.cached()
+    else:
+        _, info = setup_info(_base_url())
+        rate_config = setup_section("rate_limit", {
+            "capacity": 1000,
+            "refill_per_minute": 1000
+        })
+        # The downloads share one weight budget, so parallel workers never trip the exchange's limit
+        scheduler = RateLimitScheduler(capacity=rate_config["capacity"], refill_per_minute=rate_config["refill_per_minute"])
+        cache = FundingHistoryCache(ScheduledClient.for_info(info, scheduler), cache_dir=config["cache_dir"],
+                                    workers=config["workers"])
+        coins = args.coins.split(",") if args.coins else cache.universe()
+        fetched = cache.download(days=args.days, coins=coins)
+        failed = [coin for coin, count in fetched.items() if count is None]
+        print(f"Fetched {sum(count or 0 for count in fetched.values())} funding prints"
+              + (f", failed for {', '.join(failed)} (run again to resume)." if failed else "."))
+
+    coins, _, rates = cache.matrix(coins, days=args.days)
+    statistics = funding_statistics(rates)
+    rows = rank_coins(coins, statistics, sort_by=args.sort)
+
+    print(f"{'coin':<10}{'APR':>9}{'vol APR':>9}{'7d APR':>9}{'pos %':>8}{'persist':>9}{'mean run':>10}"
+          f"{'max run':>9}{'cur run':>9}{'regimes':>9}{'in regime':>11}")
+    for row in rows[:args.top]:
+        print(f"{row['coin']:<10}{row['mean_apr']:>9.1%}{row['volatility_apr']:>9.1%}{row['recent_apr']:>9.1%}"
+              f"{row['positive_share']:>8.1%}{row['persistence']:>9.3f}{row['mean_positive_run']:>9.1f}h"
+              f"{row['max_positive_run']:>8}h{row['current_positive_run']:>8}h{row['regime_changes']:>9}"
+              f"{row['hours_in_regime']:>10}h")
+
+
+def replay(args):
+    import threading
+
+    from basic_spot_perp_arb import HypeSpotPerpArbitrage
+    from Cassette import CassetteExhausted, CassettePlayer
+    from example_utils import print_json
+
+    player = CassettePlayer(args.path, speed=args.speed, strict=args.strict)
+    # Each strategy thread ends on CassetteExhausted; that is the end of the replay, not an error
+    default_hook = threading.excepthook
+    threading.excepthook = lambda hook_args: (None if issubclass(hook_args.exc_type, CassetteExhausted)
+                                              else default_hook(hook_args))
+    coin = player.session.get("coin", args.coin)
+    try:
+        # The cassette was recorded below the rate limiting and retries, so the replay runs them too
+        strategy = HypeSpotPerpArbitrage(coin, info=player.client("info"), exchange=player.client("exchange"),
+                                         address=player.session.get("address"), clock=player.clock, notify=False,
+                                         resilient=True)
+        # A replay must not add the recorded session's funding to the real ledger
+        strategy.funding_ledger = None
+        if args.action == "run":
+            strategy.run_strategy()
+        else:
+            getattr(strategy, args.action + "_positions")()
+    except CassetteExhausted as e:
+        print(e)
+    print_json(player.status())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HyperLiquid spot-perp funding arbitrage.")
+    parser.add_argument("--coin", default="HYPE", help="the coin we hold on spot and short on perp")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("run", help="run the strategy").set_defaults(func=run)
+    commands.add_parser("close", help="sell all spot and close the perp short").set_defaults(func=close)
+    commands.add_parser("pnl", help="PnL if we closed both legs now").set_defaults(func=pnl)
+    commands.add_parser("status", help="positions, balances, risk and realized carry").set_defaults(func=status)
+    scan_parser = commands.add_parser("scan", help="current and predicted funding of every perp")
+    scan_parser.add_argument("--top", type=int, default=20, help="the number of coins to show")
+    scan_parser.add_argument("--min-volume", type=float, default=1_000_000, help="minimum 24h notional volume")
+    scan_parser.set_defaults(func=scan)
+    funding_parser = commands.add_parser("funding", help="funding history statistics of every perp")
+    funding_parser.add_argument("--days", type=int, default=90, help="the history to analyze")
+    funding_parser.add_argument("--coins", help="comma-separated perps, defaults to the whole universe")
+    funding_parser.add_argument("--sort", default="mean_apr", help="the statistic to rank by")
+    funding_parser.add_argument("--top", type=int, default=30, help="the number of coins to show")
+    funding_parser.add_argument("--offline", action="store_true", help="analyze the cache without downloading")
+    funding_parser.set_defaults(func=funding)
+    replay_parser = commands.add_parser("replay", help="re-run a recorded session offline from its cassette")
+    replay_parser.add_argument("path", help="the cassette file, e.g. cassettes/cassette_<time>.jsonl")
+    replay_parser.add_argument("--action", choices=("run", "open", "close"), default="run",
+                               help="what the strategy does with the recorded responses")
+    replay_parser.add_argument("--speed", type=float, help="replay pace relative to the recording, "
+                                                           "as fast as possible if not given")
+    replay_parser.add_argument("--strict", action="store_true", help="fail on a call not recorded with the same arguments")
+    replay_parser.set_defaults(func=replay)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
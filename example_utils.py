@@ -1,14 +1,14 @@
 import json
 import os
 
-import eth_account
-from eth_account.signers.local import LocalAccount
-
-from hyperliquid.exchange import Exchange
-from hyperliquid.info import Info
-
 
 def setup(base_url=None, skip_ws=False):
+    # Signing and the exchange client are only needed to trade, so read-only tools never import them
+    import eth_account
+    from eth_account.signers.local import LocalAccount
+    from hyperliquid.exchange import Exchange
+    from hyperliquid.info import Info
+
     config_path = os.path.join(os.path.dirname(__file__), "config.json")
     with open(config_path) as f:
         config = json.load(f)
@@ -31,6 +31,22 @@ def setup(base_url=None, skip_ws=False):
     exchange = Exchange(account, base_url, account_address=address)
     return address, info, exchange
 
+def setup_info(base_url=None, skip_ws=True):
+    """
+    Read-only counterpart of setup(): returns (address, info) without loading the secret key,
+    checking the account or building an Exchange.
+    Needs "account_address" in config.json.
+    """
+    from hyperliquid.info import Info
+
+    config_path = os.path.join(os.path.dirname(__file__), "config.json")
+    with open(config_path) as f:
+        config = json.load(f)
+    address = config.get("account_address", "")
+    if address == "":
+        raise Exception("Read-only commands need account_address in config.json.")
+    return address, Info(base_url, skip_ws)
+
 def setup_fees():
     """
     Loads taker_fee and maker_fee from the config.json file.
@@ -51,6 +67,23 @@ def setup_fees():
 
     return taker_fee, maker_fee
 
+def setup_section(section, defaults):
+    """
+    Loads an optional section of config.json, e.g. "funding_predictor".
+    Keys missing from the config fall back to the given defaults.
+
+    :param section: str, the top-level key in config.json.
+    :param defaults: dict, the default value of every key in the section.
+    :return: dict, defaults updated with whatever the config provides.
+    """
+    config_path = os.path.join(os.path.dirname(__file__), "config.json")
+    with open(config_path) as f:
+        config = json.load(f)
+
+    values = dict(defaults)
+    values.update(config.get(section, {}))
+    return values
+
 def setup_telegram():
     """
     Loads Telegram bot token and chat ID from config.json.
@@ -74,6 +107,9 @@ def setup_telegram():
 
 
 def setup_multi_sig_wallets():
+    import eth_account
+    from eth_account.signers.local import LocalAccount
+
     config_path = os.path.join(os.path.dirname(__file__), "config.json")
     with open(config_path) as f:
         config = json.load(f)
@@ -0,0 +1,55 @@
+import unittest
+
+from FreshnessGuard import FreshnessGuard
+
+
+class Clock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class FreshnessGuardTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock(1000.0)
+        self.guard = FreshnessGuard(budgets={"l2_snapshot": 2.0}, window_seconds=10.0, clock=self.clock)
+        # Server clock 5 s ahead of ours
+        self.skew = 5.0
+
+    def read(self, data_age, rtt=0.1):
+        sent = self.clock.now
+        received = sent + rtt
+        server_ms = (received - data_age + self.skew) * 1000
+        self.clock.now = received
+        return self.guard.record("l2_snapshot:HYPE", {"time": server_ms}, sent, received)
+
+    def test_fresh_reads(self):
+        self.assertLess(self.read(0.0), 0.2)
+        self.clock.now += 1.0
+        self.assertLess(self.read(0.0), 0.2)
+
+    def test_stale_read_after_gap_longer_than_window(self):
+        self.read(0.0)
+        self.clock.now += 60.0
+        age = self.read(30.0)
+        self.assertGreater(age, 29.0)
+        self.assertGreater(age, self.guard.budget("l2_snapshot"))
+
+    def test_clock_step_is_forgotten(self):
+        self.read(0.0)
+        self.clock.now += 1.0
+        self.read(0.0)
+        # Our clock steps 20 s forward, which looks like 20 s old data at first
+        self.skew -= 20.0
+        self.clock.now += 20.0
+        self.assertGreater(self.read(0.0), 19.0)
+        for _ in range(12):
+            self.clock.now += 1.0
+            age = self.read(0.0)
+        self.assertLess(age, 0.2)
+
+
+if __name__ == "__main__":
+    unittest.main()